@@ -41,6 +41,18 @@ RUN_32_MODE = '32'
 RUN_64_MODE = '64'
 
 
+def _get_jobs(value):
+    """Parse the number of the worker processes, which is at least 1."""
+    try:
+        jobs = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("%s is not a number" % value)
+    if jobs < 1:
+        raise argparse.ArgumentTypeError("at least 1 job is needed, not %s"
+                                         % value)
+    return jobs
+
+
 def _get_configured_parser():
     """Configure the commandline arguments parser."""
     description = 'Teaching your touchpad magic tricks since 2016.'
@@ -162,6 +174,10 @@ def _get_configured_parser():
                            'if this option is not provided then '
                            'the learning process will be '
                            'repeated for each symbol known to the app')
+    subparser.add_argument('-j', '--jobs', dest='jobs', default=None,
+                           metavar='JOBS', help='learn the symbols in JOBS '
+                           'processes (default: one per processor)',
+                           type=_get_jobs)
 
     # The set_max_waittime subcommand section.
     subparser = subparsers.add_parser(SET_MAX_WAITTIME_SUBCOMMAND,
@@ -185,9 +201,9 @@ def _get_configured_parser():
     subparser.add_argument(dest='run_mode', metavar='MODE',
                            choices={RUN_32_MODE, RUN_64_MODE, RUN_USER_MODE},
                            help='set the mode you would like to run the '
-                           'app in; use <32> for 32-bit machines, <64> for '
-                           '64-bit machines and <user> to use user-defined '
-                           'symbols')
+                           'app in; use <32> or <64> to use the hardcoded '
+                           'symbols (the same on every machine) and <user> '
+                           'to use user-defined symbols')
 
     return parser
 
@@ -203,8 +219,8 @@ def _start_threads(learning_mode=None, training_size=None, system_bitness=None,
             that the user is asked to draw.
         system_bitness (int): The bitness of the system. The only legal values
             are {None, 32, 64}. If the value is 32 or 64 then set of hardcoded
-            symbols (with respect to the provided bitness) will be
-            recogniezed instead of the user defined symbols.
+            symbols (the same for both values) will be recogniezed instead
+            of the user defined symbols.
         symbol_name (str): The name of the symbol provided by the user with
             a command line option.
     """
@@ -344,7 +360,7 @@ def _repeat(args):
     """
     print('Repeating the learning process from traning-set file.')
     classifier = classifier_module.Classifier()
-    classifier.learn(True, args.symbol_name)
+    classifier.learn(True, args.symbol_name, args.jobs)
     sys.exit(0)
 
 
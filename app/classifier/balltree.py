@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""The BallTree class."""
+
+import numpy as np
+
+# The most training elements a leaf holds.
+LEAF_SIZE = 64
+# The error of the squared distances expanded as in brute_force_kneighbors
+# of the symbolindex, relative to the squared norms, allowed for. So the
+# rounding never rules out a leaf holding one of the nearest samples.
+ROUNDING_MARGIN = 1e-9
+
+
+class BallTree:
+    """Exact nearest neighbour search by balls of the samples, in NumPy.
+
+    The samples are split in halves recursively, by the median of the
+    feature of the largest spread, until at most leaf_size samples are
+    left. Every leaf is bounded by the ball around the mean of its samples.
+    No sample of a leaf is nearer to a query than the distance to the center
+    of its ball minus the radius, so the leaves are searched from the
+    nearest ball on and only the leaves which may still hold one of the
+    nearest samples are searched at all. The results are exact, like the
+    ones of brute_force_kneighbors of the symbolindex.
+
+    It replaces the ball tree of sklearn, so the classification needs no
+    sklearn, and its arrays are stored in the model store rather than built
+    again when it is loaded. It keeps a copy of the samples ordered by the
+    leaf, so the samples of neighbouring leaves are searched as one block.
+
+    The samples can be spliced without building the tree again (see
+    splice). The balls of the leaves still hold the samples left, the new
+    samples get leaves of their own. The search stays exact, but the leaves
+    get looser, so the tree should be built again once many samples have
+    been spliced.
+
+    Attributes:
+        samples (numpy.ndarray): The searched vectors, one per row.
+        leaf_rows (numpy.ndarray): The rows of the samples grouped by the
+            leaf.
+        leaf_offsets (numpy.ndarray): The rows of the i-th leaf are at
+            leaf_offsets[i] to leaf_offsets[i + 1] (exclusive) of
+            leaf_rows.
+        ordered (numpy.ndarray): The samples of leaf_rows, one per row, in
+            the type of the samples (so it is no bigger than they are).
+        norms (numpy.ndarray): The squared norms of the rows of ordered, in
+            double precision.
+        centers (numpy.ndarray): The centers of the balls of the leaves,
+            one per row.
+        radii (numpy.ndarray): The radii of the balls of the leaves.
+        spliced (int): The number of the samples removed or added by splice
+            since the tree was built.
+    """
+
+    def __init__(self, samples, leaf_size=LEAF_SIZE):
+        """Constructor. Splits the samples into the leaves.
+
+        Args:
+            samples (numpy.ndarray): The searched vectors, one per row.
+            leaf_size (int): The most samples a leaf holds.
+        """
+        self.samples = np.asarray(samples)
+        groups = [np.arange(len(self.samples))]
+        while len(groups[0]) > leaf_size:
+            children = []
+            for rows in groups:
+                values = self.samples[rows]
+                feature = np.argmax(values.max(axis=0) - values.min(axis=0))
+                half = len(rows) // 2
+                order = np.argpartition(values[:, feature], half)
+                children += [rows[order[:half]], rows[order[half:]]]
+            groups = children
+        self.leaf_offsets = np.zeros(len(groups) + 1, dtype=np.intp)
+        np.cumsum([len(rows) for rows in groups], out=self.leaf_offsets[1:])
+        self.leaf_rows = np.concatenate(groups)
+        self.ordered = self.samples[self.leaf_rows]
+        self.norms = np.einsum('ij,ij->i', self.ordered, self.ordered,
+                               dtype=np.float64)
+        self.centers = np.array([self.samples[rows].mean(axis=0,
+                                                         dtype=np.float64)
+                                 for rows in groups])
+        self.radii = np.empty(len(groups))
+        for leaf, rows in enumerate(groups):
+            differences = self.samples[rows] - self.centers[leaf]
+            self.radii[leaf] = np.sqrt(
+                np.einsum('ij,ij->i', differences, differences).max())
+        self.spliced = 0
+
+    def get_arrays(self):
+        """Return the arrays of the leaves to store (see from_arrays)."""
+        return {'leaf_rows': self.leaf_rows,
+                'leaf_offsets': self.leaf_offsets, 'ordered': self.ordered,
+                'norms': self.norms, 'centers': self.centers,
+                'radii': self.radii, 'spliced': np.array(self.spliced)}
+
+    @staticmethod
+    def from_arrays(samples, arrays):
+        """Make the tree of the samples of the arrays of get_arrays.
+
+        Nothing is computed, so the arrays may be memory-mapped.
+        """
+        tree = BallTree.__new__(BallTree)
+        tree.samples = samples
+        for name, array in arrays.items():
+            setattr(tree, name, array)
+        # The stores of the older versions have no count of the splices.
+        tree.spliced = int(arrays.get('spliced', 0))
+        return tree
+
+    def splice(self, samples, start, end):
+        """Replace the samples of rows start to end (exclusive).
+
+        Their rows are removed from the leaves, the leaves left empty are
+        dropped. The new samples get leaves of their own, split like a tree
+        of them alone. Nothing else is computed, so it takes the time of
+        copying the arrays and of splitting the new samples. The arrays are
+        replaced rather than changed, as they may be memory-mapped.
+
+        Args:
+            samples (numpy.ndarray): All the searched vectors after the
+                splice. Its rows from start on, as many as it has more than
+                the old samples without the removed ones, are the new ones.
+            start (int): The first removed row of the old samples.
+            end (int): The row after the last removed one.
+        """
+        samples = np.asarray(samples)
+        count = len(samples) - len(self.samples) + end - start
+        kept = (self.leaf_rows < start) | (self.leaf_rows >= end)
+        rows = self.leaf_rows[kept]
+        rows[rows >= end] += count - (end - start)
+        sizes = np.diff(np.concatenate([[0], np.cumsum(kept)])
+                        [self.leaf_offsets])
+        leaves = sizes > 0
+        parts = [(rows, self.ordered[kept], self.norms[kept],
+                  self.centers[leaves], self.radii[leaves], sizes[leaves])]
+        if count:
+            added = BallTree(samples[start:start + count])
+            parts.append((added.leaf_rows + start, added.ordered,
+                          added.norms, added.centers, added.radii,
+                          np.diff(added.leaf_offsets)))
+        self.leaf_rows, self.ordered, self.norms, self.centers, \
+            self.radii, sizes = [np.concatenate(arrays)
+                                 for arrays in zip(*parts)]
+        self.leaf_offsets = np.zeros(len(sizes) + 1, dtype=np.intp)
+        np.cumsum(sizes, out=self.leaf_offsets[1:])
+        self.samples = samples
+        self.spliced += end - start + count
+
+    def kneighbors(self, queries, count):
+        """Find the nearest samples of the queries.
+
+        The nearest leaves holding at least count samples are searched
+        first. Their count-th nearest sample bounds the distance of the
+        nearest samples, so the other leaves are searched only if their
+        balls are nearer than it. The squares of the distances are expanded
+        to choose the nearest samples, their distances are computed
+        directly.
+
+        Args:
+            queries (numpy.ndarray): The query vectors, one per row.
+            count (int): The number of the nearest samples. At most the
+                number of the samples.
+
+        Returns:
+            Tuple of the matrices of the distances and of the rows of the
+            nearest samples, nearest first, one row per query (like
+            NearestNeighbors.kneighbors of sklearn).
+        """
+        queries = np.asarray(queries)
+        sizes = np.diff(self.leaf_offsets)
+        distances = np.empty((len(queries), count))
+        rows = np.empty((len(queries), count), dtype=np.intp)
+        for index, query in enumerate(queries):
+            query = query.astype(np.float64)
+            differences = self.centers - query
+            bounds = np.sqrt(np.einsum('ij,ij->i', differences,
+                                       differences)) - self.radii
+            order = np.argsort(bounds, kind='mergesort')
+            first = np.searchsorted(np.cumsum(sizes[order]), count) + 1
+            positions, squares = self._search_leaves(order[:first], query)
+            slack = ROUNDING_MARGIN * (self.norms.max() + query.dot(query))
+            limit = np.partition(squares, count - 1)[count - 1] + slack
+            rest = order[first:][bounds[order[first:]] <=
+                                 np.sqrt(max(limit, 0))]
+            if len(rest):
+                more_positions, more_squares = \
+                    self._search_leaves(rest, query)
+                positions = np.concatenate([positions, more_positions])
+                squares = np.concatenate([squares, more_squares])
+                limit = np.partition(squares, count - 1)[count - 1] + slack
+            candidates = self.leaf_rows[positions[squares <= limit]]
+            differences = self.samples[candidates] - query
+            candidate_distances = np.sqrt(
+                np.einsum('ij,ij->i', differences, differences))
+            # Equally distant samples are given in the order of their rows.
+            by_row = np.argsort(candidates, kind='mergesort')
+            nearest = by_row[np.argsort(candidate_distances[by_row],
+                                        kind='mergesort')[:count]]
+            distances[index] = candidate_distances[nearest]
+            rows[index] = candidates[nearest]
+        return distances, rows
+
+    def _search_leaves(self, leaves, query):
+        """Return the positions and the expanded squares of the samples.
+
+        The positions are the ones of the samples of the leaves in ordered,
+        the squares are the ones of their distances to the query. The runs
+        of the neighbouring leaves are searched as one block.
+        """
+        leaves = np.sort(leaves)
+        breaks = np.flatnonzero(np.diff(leaves) != 1) + 1
+        starts = self.leaf_offsets[leaves[np.r_[0, breaks]]]
+        ends = self.leaf_offsets[leaves[np.r_[breaks - 1, len(leaves) - 1]]
+                                 + 1]
+        query_norm = query.dot(query)
+        positions = np.concatenate([np.arange(start, end)
+                                    for start, end in zip(starts, ends)])
+        squares = np.concatenate(
+            [self.norms[start:end] -
+             2 * self.ordered[start:end].astype(np.float64).dot(query)
+             for start, end in zip(starts, ends)]) + query_norm
+        return positions, squares
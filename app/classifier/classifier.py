@@ -1,19 +1,23 @@
 # -*- coding: utf-8 -*-
 """The Classifier class."""
 
+import hashlib
 import math
+from concurrent.futures import ProcessPoolExecutor
 import operator
 import pickle
 import sys
 import _thread
 import os
+import zipfile
 
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
-
-from sklearn.neighbors import KNeighborsClassifier
 
+from classifier import balltree
 from classifier import featureextractor
+from classifier import modelstore
+from classifier import symbolindex
+from stroke import stroke as stroke_module
 
 from string import Template
 
@@ -23,102 +27,126 @@ TEST_LOCATION = 'classifier/data/'
 USER_DIR = 'user-defined/'
 SYSTEM_BITNESS_32 = 32
 SYSTEM_BITNESS_64 = 64
-HARDCODED_32BIT_DIR = '32/'
-HARDCODED_64BIT_DIR = '64/'
+# The model store of the hardcoded symbols, the same for both bitnesses (see
+# tools/convertmodels.py).
+HARDCODED_DIR = 'hardcoded/'
 
 EXPORT_DIR = 'exports/'
 
+# Marks the attributes which have not been loaded from the files yet.
+NOT_LOADED = object()
+
+# The cascade is used if there are at least so many training elements.
+CASCADE_MIN_SAMPLES = 400
+# The number of principal components the full-resolution features are
+# projected onto before the models are learnt. None turns the projection off.
+PROJECTION_COMPONENTS = None
+# The type of the projected features and of the matrices of the index.
+MODEL_DTYPE = np.float32
+# The backend of the index of all training elements, chosen by their number
+# if None. symbolindex.BACKEND_FOREST speeds up the very large libraries at
+# the cost of missing some of the nearest elements.
+INDEX_BACKEND = None
+# The number of the worker processes the index of all training elements is
+# searched in when classifying (see SymbolIndex.start_shards). None searches
+# it in the process of the classifier, which is faster unless the library is
+# very large.
+INDEX_SHARDS = None
+
+# The distance tolerances saved by the older versions. They are read until
+# the model store holds them (see _save_model_store).
 DISTANCE_TOLERANCE_FILE = 'distance-tolerance$sym.dat'
 EXPORT_SAVING_FILE = 'exports/$sym'
+FEATURE_CACHE_FILE = 'feature-cache$sym.npz'
+# The lists of the active and of the inactive symbols pickled by the older
+# versions. They are read until the model store holds the symbol table (see
+# _save_model_store).
 INACTIVE_SYMBOLS_FILE = 'inactive-symbols.dat'
+# The training sets pickled by the older versions. They are read until they
+# are converted (see tools/converttrainingsets.py).
+LEGACY_TRAINING_SET_FILE = 'training-set$sym.dat'
+# The models of the symbols pickled by the older versions, with the general
+# one of an empty symbol name. They are removed with the files of the
+# distance tolerances.
 MODEL_FILE = 'nn-model$sym.dat'
+MODEL_STORE_FILE = 'classifier-store.npz'
+PROJECTION_FILE = 'projection.dat'
+STATISTICS_CACHE_FILE = 'statistics-cache$sym.npz'
 SYMBOL_LIST_FILE = 'symbol-list.dat'
-TRAINING_SET_FILE = 'training-set$sym.dat'
+TRAINING_SET_FILE = 'training-set$sym.npz'
 
 
 class Classifier:
     """Class for learning and classifying drawn symbols."""
 
     def __init__(self, system_bitness=None):
-        """Constructor. Loads the learning model from files.
+        """Constructor. Loads the list of symbols from file.
+
+        The index of the symbols is loaded from file when it is needed.
 
         Args:
             learning_mode (bool): Says if we are in the learning mode or not.
             system_bitness (int): The only legal values are {None, 32, 64}.
                 If the value is 32 or 64 then set of hardcoded symbols
-                (with respect to the provided bitness) will be recogniezed
-                instead of the user defined symbols.
+                (the same for both values) will be recogniezed instead of
+                the user defined symbols.
         """
         file_names = [DISTANCE_TOLERANCE_FILE, MODEL_FILE,
                       TRAINING_SET_FILE, SYMBOL_LIST_FILE,
-                      EXPORT_SAVING_FILE, INACTIVE_SYMBOLS_FILE]
+                      EXPORT_SAVING_FILE, INACTIVE_SYMBOLS_FILE,
+                      FEATURE_CACHE_FILE, PROJECTION_FILE,
+                      MODEL_STORE_FILE, STATISTICS_CACHE_FILE,
+                      LEGACY_TRAINING_SET_FILE]
 
         file_paths = Classifier._build_paths(file_names, system_bitness)
         #  (self.distance_tolerance_file_path, self.model_file_path,
         #   self.training_set_file_path) = file_paths
         self.files = {name: path for name, path in zip(file_names, file_paths)}
 
-        # Symbol list loading.
-        try:
-
-            with open(self.files[SYMBOL_LIST_FILE], 'rb') as handle:
-                self.symbol_list = pickle.load(handle)
-
-        except FileNotFoundError:
-            self.symbol_list = []
-
-        # Loading classifying models and distance tolerances
-        self.learning_models = []
-        self.tolerance_distances = []
-        self.symbol_list.append("")
-        for symbol in self.symbol_list:
-            try:
-
-                model_path = Classifier.\
-                    _get_file_path(self.files[MODEL_FILE], symbol)
-
-                with open(model_path, 'rb') as handle:
-                    self.learning_models.append(pickle.load(handle))
+        # Symbol table loading, with the distance tolerances of the symbols.
+        self.symbol_list, self.inactive_symbols, self.tolerance_distances = \
+            self._load_symbol_table()
 
-            except FileNotFoundError:
-                self.learning_models.append({})
-
-            if symbol != "":
-                try:
-
-                    tolerance_distance_path = \
-                        Classifier._get_file_path(
-                            self.files[DISTANCE_TOLERANCE_FILE], symbol)
-
-                    with open(tolerance_distance_path, 'r') as handle:
-                        self.tolerance_distances.\
-                            append(float(handle.readline()))
-
-                except FileNotFoundError:
-                    self.tolerance_distances.append(0)
-
-        self.learning_models = \
-            {sym: mod for sym, mod in
-             zip(self.symbol_list, self.learning_models)}
-        self.tolerance_distances = \
-            {sym: dist for sym, dist in
-             zip(self.symbol_list, self.tolerance_distances)}
-        self.symbol_list.pop()
+        # The index and the projection are loaded on the first use (see
+        # _get_symbol_index and _get_projection).
+        self.symbol_index = NOT_LOADED
+        self.projection = NOT_LOADED
 
         # Variables for learning-mode.
         self.training_size = 0
         self.ultimate_training_size = 0
-        self.training_set = []
+        self.training_set = stroke_module.StrokeSet()
         self.symbol_name = None
 
+        # Feature vectors of the training sets extracted so far, at every
+        # level of the feature pyramid.
+        self.feature_pyramids = {}
+        # Statistics of the training sets computed so far.
+        self.stroke_statistics = {}
+
+    def _get_training_set_path(self, symbol):
+        """Return the path of the file with the training set of the symbol.
+
+        It is the legacy pickle if the training set has not been converted
+        yet.
+        """
+        training_path = Classifier.\
+            _get_file_path(self.files[TRAINING_SET_FILE], symbol)
+        legacy_path = Classifier.\
+            _get_file_path(self.files[LEGACY_TRAINING_SET_FILE], symbol)
+        if not os.path.isfile(training_path) and os.path.isfile(legacy_path):
+            return legacy_path
+        return training_path
+
     def _load_training_set(self, symbol, file_not_found_ignore=False):
-        """Load and return traning symbols from file."""
-        try:
-            training_path = Classifier.\
-                _get_file_path(self.files[TRAINING_SET_FILE], symbol)
+        """Load and return traning symbols from file.
 
-            with open(training_path, 'rb') as handle:
-                training_set = pickle.load(handle)
+        Returns:
+            The training set (see load_training_set_file).
+        """
+        try:
+            training_path = self._get_training_set_path(symbol)
+            training_set = load_training_set_file(training_path)
 
         except FileNotFoundError:
             if file_not_found_ignore:
@@ -132,6 +160,158 @@ class Classifier:
 
         return training_set
 
+    def _get_tolerance_distance(self, symbol):
+        """Get the distance tolerance of the symbol, 0 if it is missing.
+
+        The tolerances are loaded from the model store with the symbol
+        table. The file of the older versions is read only if the store
+        does not hold the tolerance yet.
+        """
+        if symbol not in self.tolerance_distances:
+            try:
+
+                tolerance_distance_path = \
+                    Classifier._get_file_path(
+                        self.files[DISTANCE_TOLERANCE_FILE], symbol)
+
+                with open(tolerance_distance_path, 'r') as handle:
+                    self.tolerance_distances[symbol] = \
+                        float(handle.readline())
+
+            except FileNotFoundError:
+                return 0
+        return self.tolerance_distances[symbol]
+
+    def _get_symbol_index(self):
+        """Get the index of all training elements, None if there is none.
+
+        The index is loaded from the model store (see _save_model_store).
+        Its matrices are mapped into the memory rather than read, so
+        loading hardly depends on their size and the processes of the
+        classifier share them. The models pickled by the older versions
+        are not read, they have to be learnt again or converted (see
+        tools/convertmodels.py). The worker processes of the index are
+        started if INDEX_SHARDS is set.
+        """
+        if self.symbol_index is NOT_LOADED:
+            self.symbol_index = None
+            try:
+                manifest, arrays = modelstore.load(
+                    self.files[MODEL_STORE_FILE], mapped=True)
+                if manifest['index'] is not None:
+                    self.symbol_index = symbolindex.SymbolIndex\
+                        .from_store_data(manifest['index'], arrays)
+            except FileNotFoundError:
+                if os.path.isfile(Classifier._get_file_path(
+                        self.files[MODEL_FILE], "")):
+                    print("classifier.py: warning: the models of the older "
+                          "versions are not read anymore; please learn the "
+                          "symbols again", file=sys.stderr)
+            except ValueError as error:
+                print("classifier.py: warning:", error, file=sys.stderr)
+            if self.symbol_index is not None and INDEX_SHARDS:
+                self.symbol_index.start_shards(INDEX_SHARDS)
+        return self.symbol_index
+
+    def _load_symbol_table(self):
+        """Load the names of the symbols with their distance tolerances.
+
+        They are read from the manifest of the model store. The pickled
+        lists are read if there is no store yet, the tolerances are read
+        from their files then (see _get_tolerance_distance).
+
+        Returns:
+            Tuple of the lists of the active and of the inactive symbols and
+            of the dictionary mapping the symbols to their tolerances.
+        """
+        try:
+            manifest = modelstore.load_manifest(self.files[MODEL_STORE_FILE])
+        except FileNotFoundError:
+            pass
+        except ValueError as error:
+            print("classifier.py: warning:", error, file=sys.stderr)
+        else:
+            flags = list(zip(manifest['symbols'], manifest['active']))
+            return ([symbol for symbol, active in flags if active],
+                    [symbol for symbol, active in flags if not active],
+                    manifest['tolerances'])
+
+        symbol_lists = []
+        for name in [SYMBOL_LIST_FILE, INACTIVE_SYMBOLS_FILE]:
+            try:
+
+                with open(self.files[name], 'rb') as handle:
+                    symbol_lists.append(pickle.load(handle))
+
+            except FileNotFoundError:
+                symbol_lists.append([])
+        return symbol_lists[0], symbol_lists[1], {}
+
+    def _unload_symbol_index(self):
+        """Forget the index, stopping its worker processes if any."""
+        if self.symbol_index not in (None, NOT_LOADED):
+            self.symbol_index.stop_shards()
+        self.symbol_index = NOT_LOADED
+
+    def _save_model_store(self, symbol_index):
+        """Save the index with the symbol table and the tolerances.
+
+        The model store is what the classification needs, in one file. It
+        replaces the old one at once, so it is never half written. It is
+        the only file of the symbol table and of the tolerances (of the
+        inactive symbols too, so they can be activated), the files of the
+        older versions are removed with their models. It is written whole
+        after every update, as the arrays of an .npz file cannot be
+        replaced in place. That is linear in the number of the training
+        elements, about as long as building the ball tree (see
+        tools/indexbenchmark.py --updates), but it is a sequential write
+        and it keeps the store one file which can be memory-mapped.
+
+        Args:
+            symbol_index (SymbolIndex): The index of the active symbols,
+                None if there is none.
+        """
+        manifest = {
+            'symbols': self.symbol_list + self.inactive_symbols,
+            'active': [True] * len(self.symbol_list) +
+                      [False] * len(self.inactive_symbols),
+            'tolerances': {symbol: self._get_tolerance_distance(symbol)
+                           for symbol in self.symbol_list +
+                           self.inactive_symbols},
+            'index': None}
+        arrays = {}
+        if symbol_index is not None:
+            manifest['index'], arrays = symbol_index.get_store_data()
+        modelstore.save(self.files[MODEL_STORE_FILE], manifest, arrays)
+        legacy_paths = [self.files[SYMBOL_LIST_FILE],
+                        self.files[INACTIVE_SYMBOLS_FILE],
+                        Classifier._get_file_path(self.files[MODEL_FILE], "")]
+        for symbol in manifest['symbols']:
+            legacy_paths += [
+                Classifier._get_file_path(self.files[MODEL_FILE], symbol),
+                Classifier._get_file_path(
+                    self.files[DISTANCE_TOLERANCE_FILE], symbol)]
+        for path in legacy_paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _get_projection(self):
+        """Get the projection of the features, None if there is none.
+
+        See _fit_projection.
+        """
+        if self.projection is NOT_LOADED:
+            try:
+
+                with open(self.files[PROJECTION_FILE], 'rb') as handle:
+                    self.projection = pickle.load(handle)
+
+            except FileNotFoundError:
+                self.projection = None
+        return self.projection
+
     def export_files(self, settings_name):
         """Export saved settings to file.
 
@@ -141,12 +321,12 @@ class Classifier:
         print('exporting in classifier')
         box = []
         box.append(self.symbol_list)
-        inactive_symbols = self._get_inactive_symbols()
-        box.append(inactive_symbols)
-        box.append(self.learning_models[""])
+        box.append(self.inactive_symbols)
+        box.append(self._get_symbol_index())
         for symbol in self.symbol_list:
-            box.append(self.learning_models[symbol])
-            box.append(self.tolerance_distances[symbol])
+            # The place of the model of the older versions.
+            box.append(None)
+            box.append(self._get_tolerance_distance(symbol))
             training_set = self._load_training_set(symbol, True)
             box.append(training_set)
         export_path = Classifier.\
@@ -174,49 +354,34 @@ class Classifier:
             print("name of settings not found in classifier database")
             _thread.interrupt_main()
             sys.exit(1)
+        self.feature_pyramids = {}
+        self.stroke_statistics = {}
+        self._unload_symbol_index()
         symbol_list = box.pop(0)
-        file_with_symbols = \
-            open(self.files[SYMBOL_LIST_FILE], 'wb')
-        pickle.dump(symbol_list, file_with_symbols)
-        file_with_symbols.close()
-
         inactive_symbols = box.pop(0)
-        file_with_inactive_symbols = \
-            open(self.files[INACTIVE_SYMBOLS_FILE], 'wb')
-        pickle.dump(inactive_symbols, file_with_inactive_symbols)
-        file_with_inactive_symbols.close()
-
-        general_model = box.pop(0)
-        file_with_model = \
-            open(Classifier._get_file_path(self.files[MODEL_FILE], ""),
-                 'wb')
-        pickle.dump(general_model, file_with_model)
-        file_with_model.close()
+
+        # The exports of the older versions hold their general model instead
+        # of the index, so it is built from the training sets.
+        symbol_index = box.pop(0)
+        if not isinstance(symbol_index, symbolindex.SymbolIndex):
+            symbol_index = None
 
         for symbol in symbol_list:
-            learning_model = box.pop(0)
-            file_with_model = \
-                open(Classifier._get_file_path(self.files[MODEL_FILE], symbol),
-                     'wb')
-            pickle.dump(learning_model, file_with_model)
-            file_with_model.close()
-
-            tolerance_distance = box.pop(0)
-            tolerance_distance_path = Classifier._get_file_path(
-                self.files[DISTANCE_TOLERANCE_FILE], symbol)
-            file_with_tolerance_distance = \
-                open(tolerance_distance_path, 'w')
-            file_with_tolerance_distance.write("%.16f\n"
-                                               % (tolerance_distance))
-            file_with_tolerance_distance.close()
+            # The model of the older versions is not needed.
+            box.pop(0)
+            self.tolerance_distances[symbol] = box.pop(0)
 
             training_set = box.pop(0)
-            file_with_training_path = \
-                Classifier._get_file_path(self.files[TRAINING_SET_FILE], symbol)
-            file_with_training = \
-                open(file_with_training_path, 'wb')
-            pickle.dump(training_set, file_with_training)
-            file_with_training.close()
+            if training_set is not None:
+                # The exports of the older versions hold lists of signals.
+                self._write_training_set_to_file(symbol, training_set)
+
+        self.symbol_list = symbol_list
+        self.inactive_symbols = inactive_symbols
+        if symbol_index is None:
+            self._learn_all_symbols_together()
+        else:
+            self._save_model_store(symbol_index)
 
     def reset_training_set(self, new_training_size, symbol_name):
         """Start the new training set.
@@ -229,7 +394,7 @@ class Classifier:
         """
         self.ultimate_training_size = new_training_size
         self.training_size = 0
-        self.training_set = []
+        self.training_set = stroke_module.StrokeSet()
         self.symbol_name = symbol_name
 
     def add_to_training_set(self, signal_list):
@@ -238,8 +403,10 @@ class Classifier:
            When all symbols designed for this session are given,
            learning is called.
 
+           The symbol is appended to the StrokeSet of the training set.
+
         Args:
-            signal_list (TouchpadSignal list): list of touchpad-signals
+            signal_list (Stroke or TouchpadSignal list): touchpad-signals
             representing the drawn symbol.
         """
         print("training...")
@@ -252,117 +419,317 @@ class Classifier:
             sys.exit(0)
         print()
 
-    def classify(self, signal_list):
+    def classify(self, signal_list, feature_pyramid=None, statistics=None):
         """Classify the symbol to some an item.
 
+        One query of the symbol index gives both the candidate symbol and
+        the distances to its nearest training elements. The symbols whose
+        statistics are far from the ones of the drawn symbol are ruled out
+        before, so nothing is queried if none is left.
+
         Args:
-            signal_list (TouchpadSignal list): the list of the signals fetched
+            signal_list (Stroke or TouchpadSignal list): the signals fetched
                 from a touchpad representing the drawn symbol.
+            feature_pyramid (dict): the features of the signal_list at the
+                levels of the feature pyramid if they have already been
+                computed (for example by a SignalCollection). They are
+                extracted otherwise.
+            statistics (numpy.ndarray): the statistics of the signal_list
+                (see get_statistics_batch of the featureextractor) if they
+                are already known, like the feature_pyramid.
 
         Returns:
             The name of the symbol (such as "small_a" for a or "large_k for K
             if similarity has been found. None otherwise.
         """
         print("classifying...")
-        feature_vector = featureextractor.get_features(signal_list)
-        models = self.learning_models
-        if models[""] == {}:
+        symbol_index = self._get_symbol_index()
+        if symbol_index is None:
             return None
-        symbol_candidate = models[""].predict([feature_vector])[0]
-        if models[symbol_candidate] == {}:
+        levels = symbol_index.levels
+        if statistics is None:
+            statistics = featureextractor.get_statistics(signal_list)
+        candidates = symbol_index.filter_candidates(statistics)
+        if candidates is not None and not len(candidates):
             return None
-        distances, _ = models[symbol_candidate] \
-            .kneighbors(np.array([feature_vector]))
-        mean_distance = np.mean(distances[0])
+        if feature_pyramid is None or \
+                any(level not in feature_pyramid for level in levels):
+            feature_pyramid = featureextractor.get_feature_pyramid(
+                signal_list, levels)
+        feature_vector = self._project(
+            feature_pyramid[featureextractor.NUMBER_OF_POINTS])
+        symbol_candidate, distances = symbol_index.query(
+            feature_vector, feature_pyramid, candidates)
+        print("mean query latency: %.3f ms"
+              % (1000 * symbol_index.get_mean_latency()))
+        mean_distance = np.mean(distances)
         print(mean_distance)
-        if mean_distance < self.tolerance_distances[symbol_candidate]:
+        if mean_distance < self._get_tolerance_distance(symbol_candidate):
             print(symbol_candidate)
             return symbol_candidate
         else:
             return None
 
+    def classify_many(self, strokes):
+        """Classify many symbols at once, e.g. the recorded ones.
+
+        The features of all the strokes are extracted in one pass. The
+        symbol index is queried once for all the strokes with the same
+        candidate symbols (see classify). Nothing is printed.
+
+        Args:
+            strokes (list): The Strokes (or the lists of TouchpadSignals)
+                of the drawn symbols. Every one needs at least one point.
+
+        Returns:
+            Tuple of three arrays: the names of the most similar symbols
+            (None if there was no candidate), the mean distances to their
+            nearest training elements (infinite if there was no candidate)
+            and the flags telling if the symbols are similar enough, i.e.
+            if classify would return them.
+        """
+        number_of_strokes = len(strokes)
+        symbols = np.full(number_of_strokes, None, dtype=object)
+        mean_distances = np.full(number_of_strokes, np.inf)
+        symbol_index = self._get_symbol_index()
+        if not number_of_strokes or symbol_index is None:
+            return symbols, mean_distances, np.zeros(number_of_strokes,
+                                                     dtype=bool)
+        levels = symbol_index.levels
+        packed_strokes = featureextractor.pack_strokes(strokes)
+        feature_pyramid = featureextractor.get_feature_pyramid_batch(
+            packed_strokes, levels)
+        feature_vectors = self._project(
+            feature_pyramid[featureextractor.NUMBER_OF_POINTS])
+
+        inside = symbol_index.get_envelope_mask(
+            featureextractor.get_statistics_batch(packed_strokes))
+        if inside is None:
+            inside = np.ones((number_of_strokes,
+                              len(symbol_index.symbols)), dtype=bool)
+        groups = {}
+        for stroke_index, pattern in enumerate(inside):
+            groups.setdefault(pattern.tobytes(), []).append(stroke_index)
+        for members in groups.values():
+            pattern = inside[members[0]]
+            if not pattern.any():
+                continue
+            candidates = None if pattern.all() else np.flatnonzero(pattern)
+            found, distances = symbol_index.query_many(
+                feature_vectors[members],
+                {level: feature_pyramid[level][members]
+                 for level in levels[:-1]}, candidates)
+            symbols[members] = found
+            mean_distances[members] = [np.mean(symbol_distances)
+                                       for symbol_distances in distances]
+
+        tolerance_distances = np.array(
+            [0 if symbol is None else self._get_tolerance_distance(symbol)
+             for symbol in symbols])
+        return symbols, mean_distances, mean_distances < tolerance_distances
+
     def _compute_tolerance_distance(self, sample, symbol):
         """Compute the distance tolerance.
 
         Computes distance tolerance in the feature vectors space
-        below which we find the symbol similar. Then saves it
-        to proper file.
+        below which we find the symbol similar. It is kept with the
+        other tolerances, which are saved with the model store.
 
         Args:
             sample (list of lists of int): list of feature-vectors,
                                            on which we base on.
             symbol (String): name of symbol to compute tolerance
         """
-        nbrs = NearestNeighbors(n_neighbors=3, algorithm='ball_tree')\
-            .fit(sample)
-        distances, _ = nbrs.kneighbors(sample)
-        print(distances)
-        means = []
-        for distances_row in distances:
-            row = np.delete(distances_row, [0])
-            means.append(np.mean(row))
-        means.sort()
-        critical_index = math.ceil(0.8 * len(means)) - 1
-        tolerance_distance = means[critical_index] * 1.3
-        print("tolerance distance: %.16f" % tolerance_distance)
-
-        tolerance_distance_path = \
-            Classifier._get_file_path(
-                self.files[DISTANCE_TOLERANCE_FILE], symbol)
-
-        with open(tolerance_distance_path, 'w') as handle:
-            handle.write("%.16f\n" % tolerance_distance)
-
+        tolerance_distance = get_tolerance_distance(sample)
+        self.tolerance_distances[symbol] = tolerance_distance
         return tolerance_distance
 
-    def _write_training_set_to_file(self, symbol):
-        """Write current training set to file."""
-
-        file_with_training_path = \
-            Classifier._get_file_path(self.files[TRAINING_SET_FILE], symbol)
-
-        with open(file_with_training_path, 'wb') as handle:
-            pickle.dump(self.training_set, handle)
+    def _write_training_set_to_file(self, symbol, training_set=None):
+        """Write the training set to file.
 
-    def _save_symbol_list(self):
-        """Save current list of symbols."""
+        The legacy pickle of the symbol is removed, so it is not read
+        instead.
 
-        with open(self.files[SYMBOL_LIST_FILE], 'wb') as handle:
-            pickle.dump(self.symbol_list, handle)
+        Args:
+            symbol (str): Name of the symbol.
+            training_set (StrokeSet or list): The training set, the current
+                one by default. A list of strokes is converted.
+        """
+        self.feature_pyramids.pop(symbol, None)
+        self.stroke_statistics.pop(symbol, None)
+        if training_set is None:
+            training_set = self.training_set
+        if not isinstance(training_set, stroke_module.StrokeSet):
+            training_set = stroke_module.StrokeSet.from_strokes(training_set)
+
+        training_set.save(Classifier._get_file_path(
+            self.files[TRAINING_SET_FILE], symbol))
+        try:
+            os.remove(Classifier._get_file_path(
+                self.files[LEGACY_TRAINING_SET_FILE], symbol))
+        except FileNotFoundError:
+            pass
 
     def _save_training_set(self, symbol):
         """Save the drawn training set to file.
 
+        A new symbol is added to the symbol list, which is saved with the
+        model store by the learning.
+
         Args:
             symbol (str): Name of the symbol.
         """
 
         self._write_training_set_to_file(symbol)
 
-        inactive_symbols = self._get_inactive_symbols()
-        if symbol not in self.symbol_list.copy() + inactive_symbols:
+        if symbol not in self.symbol_list + self.inactive_symbols:
             self.symbol_list.append(symbol)
-            self._save_symbol_list()
 
-    def _get_inactive_symbols(self):
-        """Fetch list of inactive symbols from file."""
-        try:
+    def _get_training_set_key(self, symbol):
+        """Compute the key of the cached features of the symbol.
 
-            with open(self.files[INACTIVE_SYMBOLS_FILE], 'rb') as handle:
-                inactive_symbols = pickle.load(handle)
-            return inactive_symbols
+        The key is a hash of the training set file and of the parameters
+        of the feature extractor.
 
+        Returns:
+            The key (str) or None if there is no file with the training set.
+        """
+        digest = hashlib.sha1()
+        digest.update(repr(sorted(featureextractor.get_parameters().items()))
+                      .encode())
+        try:
+            with open(self._get_training_set_path(symbol), 'rb') as handle:
+                digest.update(handle.read())
         except FileNotFoundError:
-            return []
+            return None
+        return digest.hexdigest()
+
+    def _load_cached_features(self, symbol, key):
+        """Load the cached features of the symbol if the key matches.
+
+        Returns:
+            The feature pyramid (a dictionary mapping the levels to the
+            matrices of feature vectors) or None if the cache is missing
+            or out of date.
+        """
+        cache_path = Classifier.\
+            _get_file_path(self.files[FEATURE_CACHE_FILE], symbol)
+        try:
+            with np.load(cache_path) as cache:
+                if str(cache['key']) != key:
+                    return None
+                return {level: cache['features_%d' % level]
+                        for level in featureextractor.PYRAMID_LEVELS}
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _save_cached_features(self, symbol, key, feature_pyramid):
+        """Save the feature pyramid of the symbol to the cache file."""
+        cache_path = Classifier.\
+            _get_file_path(self.files[FEATURE_CACHE_FILE], symbol)
+        temporary_path = cache_path + '.tmp'
+        matrices = {'features_%d' % level: matrix
+                    for level, matrix in feature_pyramid.items()}
+        with open(temporary_path, 'wb') as handle:
+            np.savez(handle, key=np.array(key), **matrices)
+        os.replace(temporary_path, cache_path)
 
-    def _save_inactive_symbols(self, inactive_symbols):
-        """Save given inactive symbols list to file.
+    def _extract_feature_pyramids(self, symbols, keys):
+        """Extract the training sets of the symbols in one pass and cache them.
 
         Args:
-            inactive_symbols (list of str): Current inactive symbols.
+            symbols (list of str): Names of the symbols.
+            keys (dict): The cache keys of the symbols.
         """
-        with open(self.files[INACTIVE_SYMBOLS_FILE], 'wb') as handle:
-            pickle.dump(inactive_symbols, handle)
+        training_sets = [self._load_training_set(symbol)
+                         for symbol in symbols]
+        strokes = featureextractor.pack_strokes(
+            [training_element for training_set in training_sets
+             for training_element in training_set])
+        feature_pyramid = featureextractor.get_feature_pyramid_batch(strokes)
+
+        split_points = np.cumsum([len(training_set)
+                                  for training_set in training_sets])[:-1]
+        matrices = {level: np.split(matrix, split_points)
+                    for level, matrix in feature_pyramid.items()}
+        for index, symbol in enumerate(symbols):
+            self.feature_pyramids[symbol] = \
+                {level: matrices[level][index] for level in matrices}
+            if keys[symbol] is not None:
+                self._save_cached_features(symbol, keys[symbol],
+                                           self.feature_pyramids[symbol])
+
+    def _get_feature_matrices(self, symbols,
+                              level=featureextractor.NUMBER_OF_POINTS):
+        """Get feature vectors of the training sets of the symbols.
+
+        The features are taken from the cache files if the training sets
+        have not changed since. The rest of the training sets is packed
+        together, extracted in one pass and cached.
+
+        Args:
+            symbols (list of str): Names of the symbols.
+            level (int): The level of the feature pyramid, i.e. the number
+                of points the curves are resampled to.
+
+        Returns:
+            Dictionary mapping the symbols to their matrices of feature
+            vectors (one row per training element).
+        """
+        missing_symbols = []
+        keys = {}
+        for symbol in symbols:
+            if symbol in self.feature_pyramids:
+                continue
+            keys[symbol] = self._get_training_set_key(symbol)
+            cached = self._load_cached_features(symbol, keys[symbol])
+            if cached is None:
+                missing_symbols.append(symbol)
+            else:
+                self.feature_pyramids[symbol] = cached
+
+        if missing_symbols:
+            self._extract_feature_pyramids(missing_symbols, keys)
+        return {symbol: self.feature_pyramids[symbol][level]
+                for symbol in symbols}
+
+    def _get_stroke_statistics(self, symbols):
+        """Get the statistics of the training sets of the symbols.
+
+        See get_statistics_batch of the featureextractor. They are cached
+        in files like the features (see _get_feature_matrices).
+
+        Args:
+            symbols (list of str): Names of the symbols.
+
+        Returns:
+            Dictionary mapping the symbols to their matrices of statistics
+            (one row per training element).
+        """
+        for symbol in symbols:
+            if symbol in self.stroke_statistics:
+                continue
+            key = self._get_training_set_key(symbol)
+            cache_path = Classifier.\
+                _get_file_path(self.files[STATISTICS_CACHE_FILE], symbol)
+            try:
+                with np.load(cache_path) as cache:
+                    if str(cache['key']) == key:
+                        self.stroke_statistics[symbol] = cache['statistics']
+                        continue
+            except (OSError, KeyError, ValueError):
+                pass
+
+            statistics = featureextractor.get_statistics_batch(
+                featureextractor.pack_strokes(
+                    self._load_training_set(symbol)))
+            self.stroke_statistics[symbol] = statistics
+            if key is not None:
+                temporary_path = cache_path + '.tmp'
+                with open(temporary_path, 'wb') as handle:
+                    np.savez(handle, key=np.array(key), statistics=statistics)
+                os.replace(temporary_path, cache_path)
+        return {symbol: self.stroke_statistics[symbol] for symbol in symbols}
 
     def _learn_one_symbol(self, symbol):
         """Learn given symbol basing on training set from file.
@@ -370,51 +737,236 @@ class Classifier:
         Args:
             symbol (str): Name of the symbol.
         """
-        training_set = self._load_training_set(symbol)
-        feature_vectors = []
-        for training_element in training_set:
-            feature_vectors.append(featureextractor
-                                   .get_features(training_element))
-        sample = np.array(feature_vectors)
-        nbrs = NearestNeighbors(n_neighbors=2, algorithm='ball_tree')\
-            .fit(sample)
+        sample = self._project(self._get_feature_matrices([symbol])[symbol])
+        return self._compute_tolerance_distance(sample, symbol)
 
-        model_path = Classifier.\
-            _get_file_path(self.files[MODEL_FILE], symbol)
+    def _learn_symbols(self, symbols, jobs=1):
+        """Learn the given symbols basing on training sets from files.
 
-        with open(model_path, 'wb') as handle:
-            pickle.dump(nbrs, handle)
+        Args:
+            symbols (list of str): Names of the symbols.
+            jobs (int): The number of worker processes the symbols are
+                learnt in. None means as many as there are processors. The
+                symbols are learnt one after another in this process if it
+                is 1 (or there is one processor) or if there is at most one
+                symbol.
+        """
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        if jobs == 1 or len(symbols) < 2:
+            self._get_feature_matrices(symbols)
+            for sym in symbols:
+                print("learning", sym, "symbol...")
+                self._learn_one_symbol(sym)
+            return
+
+        # The features which are known already are sent to the workers,
+        # the rest is extracted there.
+        keys = {}
+        for sym in symbols:
+            if sym in self.feature_pyramids:
+                continue
+            keys[sym] = self._get_training_set_key(sym)
+            if keys[sym] is None:
+                # Report the missing training set like the serial learning.
+                self._load_training_set(sym)
+            cached = self._load_cached_features(sym, keys[sym])
+            if cached is not None:
+                self.feature_pyramids[sym] = cached
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(
+                learn_symbol_in_worker, self._get_training_set_path(sym),
+                self.feature_pyramids.get(sym), self._get_projection())
+                       for sym in symbols]
+            for sym, future in zip(symbols, futures):
+                print("learning", sym, "symbol...")
+                feature_pyramid, tolerance_distance = future.result()
+                if sym not in self.feature_pyramids:
+                    self.feature_pyramids[sym] = feature_pyramid
+                    self._save_cached_features(sym, keys[sym],
+                                               feature_pyramid)
+                self.tolerance_distances[sym] = tolerance_distance
+
+    def _build_symbol_index(self):
+        """Build the index of all training elements of the active symbols.
+
+        The index gets the coarse levels of the feature pyramid as well if
+        there are at least CASCADE_MIN_SAMPLES training elements. The
+        full-resolution features are projected (see _project). The
+        envelopes of the statistics of the symbols are built from their
+        training sets.
 
-        return self._compute_tolerance_distance(sample, symbol)
+        Returns:
+            The SymbolIndex or None if there are no active symbols.
+        """
+        if not self.symbol_list:
+            return None
+        feature_matrices = self._get_index_features(self.symbol_list)
+        coarse_matrices = None
+        number_of_samples = sum(len(matrix)
+                                for matrix in feature_matrices.values())
+        if number_of_samples >= CASCADE_MIN_SAMPLES:
+            coarse_matrices = self._get_index_coarse_features(
+                self.symbol_list)
+        return symbolindex.SymbolIndex(
+            feature_matrices, coarse_matrices, INDEX_BACKEND,
+            self._get_stroke_statistics(self.symbol_list))
+
+    def _get_index_features(self, symbols):
+        """Return the projected full-resolution features for the index.
 
-    def _learn_all_symbols_together(self):
-        """Build file of knn-classifier model of all training elements."""
-        print('learning all together...')
-        feature_vectors = []
-        results = []
-        for sym in self.symbol_list:
-
-            training_set = self._load_training_set(sym)
-            for training_element in training_set:
-                feature_vector = \
-                    featureextractor.get_features(training_element)
-                feature_vectors.append(feature_vector)
-                results.append(sym)
-        if self.symbol_list:
-            knn_model = KNeighborsClassifier(n_neighbors=5).\
-                fit(feature_vectors, results)
-            with open(Classifier._get_file_path(self.files[MODEL_FILE], ""),
-                      'wb') as handle:
-                pickle.dump(knn_model, handle)
+        Returns:
+            Dictionary mapping the symbols to their matrices of features.
+        """
+        return {sym: self._project(matrix).astype(MODEL_DTYPE)
+                for sym, matrix in self._get_feature_matrices(
+                    symbols).items()}
 
+    def _get_index_coarse_features(self, symbols):
+        """Return the features at the coarse levels for the cascade.
+
+        Returns:
+            Dictionary mapping the coarse levels of the feature pyramid to
+            the dictionaries mapping the symbols to their matrices.
+        """
+        return {level: {sym: matrix.astype(MODEL_DTYPE)
+                        for sym, matrix in self._get_feature_matrices(
+                            symbols, level).items()}
+                for level in featureextractor.PYRAMID_LEVELS[:-1]}
+
+    def _update_symbol_index(self, symbols):
+        """Update the saved index after the given symbols have changed.
+
+        The active ones are put into the index again, the others are
+        removed from it (see SymbolIndex.insert_symbol). Only their
+        features are needed and the ball tree or the forest is spliced
+        rather than built, so only copying the matrices and saving the
+        model store take a time linear in the number of the other training
+        elements (see tools/indexbenchmark.py --updates). It is impossible
+        without an index, with the projection (which is fitted to all the
+        training sets), without the envelopes (see
+        SymbolIndex.from_store_data) or if the cascade would be turned on
+        or off (see CASCADE_MIN_SAMPLES).
+
+        Args:
+            symbols (list of str): The names of the changed symbols.
+
+        Returns:
+            True if the index has been updated and saved, False if it has
+            to be built from scratch (see _learn_all_symbols_together).
+        """
+        if PROJECTION_COMPONENTS is not None or not self.symbol_list:
+            return False
+        symbol_index = self._get_symbol_index()
+        if symbol_index is None or symbol_index.envelopes is None:
+            return False
+        changed = set(symbols)
+        if set(symbol_index.symbols) - changed != \
+                set(self.symbol_list) - changed:
+            return False
+        inserted = sorted(changed.intersection(self.symbol_list))
+        removed = sorted(changed.intersection(symbol_index.symbols))
+        feature_matrices = self._get_index_features(inserted)
+        number_of_samples = len(symbol_index) + \
+            sum(len(matrix) for matrix in feature_matrices.values()) - \
+            sum(len(symbol_index.get_symbol_features(symbol))
+                for symbol in removed)
+        cascade = number_of_samples >= CASCADE_MIN_SAMPLES
+        if cascade != bool(symbol_index.coarse_features):
+            return False
+
+        coarse_matrices = {}
+        if cascade:
+            coarse_matrices = self._get_index_coarse_features(inserted)
+        statistics = self._get_stroke_statistics(inserted)
+        for symbol in inserted:
+            symbol_index.insert_symbol(
+                symbol, feature_matrices[symbol],
+                {level: matrices[symbol]
+                 for level, matrices in coarse_matrices.items()},
+                statistics[symbol])
+        for symbol in set(removed) - set(inserted):
+            symbol_index.remove_symbol(symbol)
+        print('updated the index,', len(symbol_index), 'training elements,',
+              'backend:', symbol_index.backend)
+        self._save_model_store(symbol_index)
+        return True
+
+    def _fit_projection(self):
+        """Fit the projection of the features onto the principal components.
+
+        The projection is fitted to the full-resolution features of all the
+        active symbols and saved to file. The file is removed if
+        PROJECTION_COMPONENTS is None.
+
+        Returns:
+            True if the features are projected differently than before,
+            False otherwise.
+        """
+        had_projection = self._get_projection() is not None
+        self.projection = None
+        if PROJECTION_COMPONENTS is not None and self.symbol_list:
+            feature_matrices = self._get_feature_matrices(self.symbol_list)
+            feature_vectors = np.concatenate(
+                [feature_matrices[sym] for sym in self.symbol_list])
+            mean = feature_vectors.mean(axis=0)
+            _, _, components = np.linalg.svd(feature_vectors - mean,
+                                             full_matrices=False)
+            self.projection = {
+                'mean': mean.astype(MODEL_DTYPE),
+                'components':
+                    components[:PROJECTION_COMPONENTS].astype(MODEL_DTYPE)}
+
+        if self.projection is not None:
+            with open(self.files[PROJECTION_FILE], 'wb') as handle:
+                pickle.dump(self.projection, handle)
         else:
             try:
-                os.remove(Classifier._get_file_path(self.files[MODEL_FILE],
-                                                    ""))
+                os.remove(self.files[PROJECTION_FILE])
             except OSError:
                 pass
+        return had_projection or self.projection is not None
 
-    def learn(self, load_from_file, symbol=""):
+    def _project(self, features):
+        """Project the full-resolution features if there is a projection.
+
+        Args:
+            features (numpy.ndarray): A feature vector or a matrix with one
+                feature vector per row.
+
+        Returns:
+            The projected features as MODEL_DTYPE, or the features untouched
+            if there is no projection.
+        """
+        return project_features(self._get_projection(), features)
+
+    def _learn_all_symbols_together(self, jobs=1):
+        """Build file of the index of all training elements.
+
+        The projection of the features is fitted first if
+        PROJECTION_COMPONENTS is set (see _build_symbol_index).
+
+        Args:
+            jobs (int): The number of processes the single symbols are
+                learnt in if the projection makes it necessary (see
+                _learn_symbols).
+        """
+        print('learning all together...')
+        if self._fit_projection():
+            # The tolerances of the single symbols are computed in the
+            # space of the projection, so they have to follow it.
+            self._learn_symbols(
+                self.symbol_list + self.inactive_symbols, jobs)
+
+        self._unload_symbol_index()
+        self.symbol_index = self._build_symbol_index()
+        if self.symbol_index is not None:
+            print('indexed', len(self.symbol_index), 'training elements,',
+                  'backend:', self.symbol_index.backend)
+        self._save_model_store(self.symbol_index)
+
+    def learn(self, load_from_file, symbol="", jobs=1):
         """Learn basing on training-set.
 
         Args:
@@ -423,37 +975,35 @@ class Classifier:
                                  that has to be learned and then saved to file.
             symbol (str): Name of the symbol,
                           or empty string if general learning wanted.
+            jobs (int): The number of worker processes the symbols are learnt
+                        in by the general learning (see _learn_symbols).
         """
         if symbol is None:
             symbol = ""
-        inactive_symbols = self._get_inactive_symbols()
-        available_symbols = self.symbol_list.copy() + inactive_symbols
+        available_symbols = self.symbol_list + self.inactive_symbols
         if symbol != "":
             print("learning", symbol, "symbol...")
             if not load_from_file:
                 self._save_training_set(symbol)
             elif symbol not in available_symbols:
                 print('symbol', symbol, 'not found in classifier database')
-            self._learn_one_symbol(symbol)
-        else:
-            for sym in available_symbols:
-                print("learning", sym, "symbol...")
-                self._learn_one_symbol(sym)
+            if PROJECTION_COMPONENTS is None:
+                self._learn_one_symbol(symbol)
+        elif PROJECTION_COMPONENTS is None:
+            self._learn_symbols(available_symbols, jobs)
 
-        self._learn_all_symbols_together()
+        if symbol != "" and self._update_symbol_index([symbol]):
+            return
+        # With the projection the symbols are learnt after it is fitted.
+        self._learn_all_symbols_together(jobs)
 
     def _delete_symbol(self, symbol):
         print('removing symbol', symbol, 'from classifier...')
-        inactive_symbols = self._get_inactive_symbols()
         if symbol in self.symbol_list:
             self.symbol_list.remove(symbol)
-            with open(self.files[SYMBOL_LIST_FILE], 'wb') as handle:
-                handle.truncate()
-                pickle.dump(self.symbol_list, handle)
 
-        elif symbol in inactive_symbols:
-            inactive_symbols.remove(symbol)
-            self._save_inactive_symbols(inactive_symbols)
+        elif symbol in self.inactive_symbols:
+            self.inactive_symbols.remove(symbol)
 
         else:
             print('warning: symbol', symbol,
@@ -462,11 +1012,19 @@ class Classifier:
                 print(symbol)
 
         print("removing related files...")
+        self.feature_pyramids.pop(symbol, None)
+        self.stroke_statistics.pop(symbol, None)
+        self.tolerance_distances.pop(symbol, None)
         try:
             os.remove(Classifier._get_file_path(
                 self.files[TRAINING_SET_FILE], symbol))
         except OSError:
             pass
+        try:
+            os.remove(Classifier._get_file_path(
+                self.files[LEGACY_TRAINING_SET_FILE], symbol))
+        except OSError:
+            pass
         try:
             os.remove(Classifier._get_file_path(
                 self.files[MODEL_FILE], symbol))
@@ -477,6 +1035,16 @@ class Classifier:
                 self.files[DISTANCE_TOLERANCE_FILE], symbol))
         except OSError:
             pass
+        try:
+            os.remove(Classifier._get_file_path(
+                self.files[FEATURE_CACHE_FILE], symbol))
+        except OSError:
+            pass
+        try:
+            os.remove(Classifier._get_file_path(
+                self.files[STATISTICS_CACHE_FILE], symbol))
+        except OSError:
+            pass
 
     def delete_symbols(self, symbols_to_delete):
         """Delete symbols from classifier with all files related.
@@ -492,7 +1060,8 @@ class Classifier:
             for symbol in symbols_to_delete:
                 self._delete_symbol(symbol)
 
-        self._learn_all_symbols_together()
+        if not self._update_symbol_index(symbols_to_delete):
+            self._learn_all_symbols_together()
 
     def activate_symbols(self, symbols):
         """Activate symbols.
@@ -500,44 +1069,35 @@ class Classifier:
         Args:
             symbols (list of str): Symbols to activate.
         """
-        inactive_symbols = self._get_inactive_symbols()
+        symbol_list = self.symbol_list.copy()
+        inactive_symbols = self.inactive_symbols.copy()
         if not symbols:
             symbols = inactive_symbols.copy()
         allowed = True
         for symbol in symbols:
             if symbol in inactive_symbols:
                 print("activating symbol", symbol, "in classifier...")
-                training_set_path = \
-                    Classifier._get_file_path(self.files[TRAINING_SET_FILE],
-                                              symbol)
-                model_path = \
-                    Classifier._get_file_path(self.files[MODEL_FILE], symbol)
-                dt_pattern = \
-                    self.files[DISTANCE_TOLERANCE_FILE]
-                distace_tolerance_path = \
-                    Classifier._get_file_path(dt_pattern, symbol)
+                training_set_path = self._get_training_set_path(symbol)
+                self._get_tolerance_distance(symbol)
                 if not os.path.isfile(training_set_path):
                     print("File with training set of symbol", symbol,
                           "is missing. Activation is impossible.")
                     allowed = False
-                elif not os.path.isfile(model_path):
-                    print("File with learning model of symbol", symbol,
-                          "is missing. Activation is impossible.")
-                    allowed = False
-                elif not os.path.isfile(distace_tolerance_path):
-                    print("File with the tolerance distance of symbol", symbol,
+                elif symbol not in self.tolerance_distances:
+                    print("The tolerance distance of symbol", symbol,
                           "is missing. Activation is impossible.")
                     allowed = False
                 else:
-                    self.symbol_list.append(symbol)
+                    symbol_list.append(symbol)
                     inactive_symbols.remove(symbol)
-            elif symbol not in self.symbol_list:
+            elif symbol not in symbol_list:
                 print("warning: symbol", symbol,
                       "is not present in classifier database")
         if allowed:
-            self._save_symbol_list()
-            self._save_inactive_symbols(inactive_symbols)
-            self._learn_all_symbols_together()
+            self.symbol_list = symbol_list
+            self.inactive_symbols = inactive_symbols
+            if not self._update_symbol_index(symbols):
+                self._learn_all_symbols_together()
             print("activation in classifier passed with success")
             return True
         return False
@@ -550,18 +1110,16 @@ class Classifier:
         """
         if not symbols:
             symbols = self.symbol_list.copy()
-        inactive_symbols = self._get_inactive_symbols()
         for symbol in symbols:
             if symbol in self.symbol_list:
                 print("deactivating symbol", symbol, "in classifier...")
                 self.symbol_list.remove(symbol)
-                inactive_symbols.append(symbol)
-            elif symbol not in inactive_symbols:
+                self.inactive_symbols.append(symbol)
+            elif symbol not in self.inactive_symbols:
                 print("warning: symbol", symbol,
                       "is not present in classifier database")
-        self._save_symbol_list()
-        self._save_inactive_symbols(inactive_symbols)
-        self._learn_all_symbols_together()
+        if not self._update_symbol_index(symbols):
+            self._learn_all_symbols_together()
 
     @staticmethod
     def _get_file_path(template_string, symbol_name):
@@ -586,7 +1144,8 @@ class Classifier:
         """Build paths of the files based on the system bitness.
 
         Chooses different directories depending on the value of the
-        system_bitness. If the bitness is neither 32 nor 64 then the
+        system_bitness. The hardcoded symbols of HARDCODED_DIR are the
+        same for 32 and 64. If the bitness is neither 32 nor 64 then the
         USER_DIR directory will be used.
 
         Args:
@@ -596,12 +1155,8 @@ class Classifier:
         file_paths = ["" for file in files]
 
         file_paths = Classifier._extend_paths(file_paths, DATA_PATH)
-        if system_bitness == SYSTEM_BITNESS_32:
-            file_paths = Classifier._extend_paths(file_paths,
-                                                  HARDCODED_32BIT_DIR)
-        elif system_bitness == SYSTEM_BITNESS_64:
-            file_paths = Classifier._extend_paths(file_paths,
-                                                  HARDCODED_64BIT_DIR)
+        if system_bitness in [SYSTEM_BITNESS_32, SYSTEM_BITNESS_64]:
+            file_paths = Classifier._extend_paths(file_paths, HARDCODED_DIR)
         else:
             file_paths = Classifier._extend_paths(file_paths, USER_DIR)
 
@@ -625,3 +1180,93 @@ class Classifier:
             file_paths extended with path_element.
         """
         return [operator.add(path, path_element) for path in file_paths]
+
+
+def get_tolerance_distance(sample):
+    """Compute the distance tolerance of a symbol.
+
+    Computes distance tolerance in the feature vectors space below which
+    we find the symbol similar.
+
+    Args:
+        sample (numpy.ndarray): The feature vectors of the training set of
+            the symbol, one per row.
+    """
+    if len(sample) <= symbolindex.BRUTE_FORCE_MAX_SAMPLES:
+        distances, _ = symbolindex.brute_force_kneighbors(sample, sample, 3)
+    else:
+        distances, _ = balltree.BallTree(sample).kneighbors(sample, 3)
+    print(distances)
+    means = []
+    for distances_row in distances:
+        row = np.delete(distances_row, [0])
+        means.append(np.mean(row))
+    means.sort()
+    critical_index = math.ceil(0.8 * len(means)) - 1
+    tolerance_distance = float(means[critical_index] * 1.3)
+    print("tolerance distance: %.16f" % tolerance_distance)
+    return tolerance_distance
+
+
+def project_features(projection, features):
+    """Project the full-resolution features if there is a projection.
+
+    Args:
+        projection (dict): The mean and the components of the projection
+            (see Classifier._fit_projection) or None.
+        features (numpy.ndarray): A feature vector or a matrix with one
+            feature vector per row.
+
+    Returns:
+        The projected features as MODEL_DTYPE, or the features untouched
+        if there is no projection.
+    """
+    if projection is None:
+        return features
+    centered = np.asarray(features, dtype=MODEL_DTYPE) - projection['mean']
+    return centered.dot(projection['components'].T)
+
+
+def load_training_set_file(path):
+    """Load the training set from the file.
+
+    Args:
+        path (str): The path of the file with the training set.
+
+    Returns:
+        The training set as a StrokeSet, or the list of the lists of signals
+        (or of the Strokes) of a legacy pickle. The legacy training sets are
+        converted when they are written (see
+        Classifier._write_training_set_to_file).
+
+    Raises:
+        FileNotFoundError: If there is no file.
+    """
+    if not zipfile.is_zipfile(path):
+        with open(path, 'rb') as handle:
+            return pickle.load(handle)
+    return stroke_module.StrokeSet.load(path)
+
+
+def learn_symbol_in_worker(training_path, feature_pyramid, projection):
+    """Learn one symbol in a worker process of Classifier._learn_symbols.
+
+    Nothing is written to the files, the results are sent back instead.
+
+    Args:
+        training_path (str): The path of the file with the training set.
+        feature_pyramid (dict): The features of the training set if they
+            are known already, None otherwise.
+        projection (dict): The projection of the features or None.
+
+    Returns:
+        Tuple of the feature pyramid and the distance tolerance of the
+        symbol.
+    """
+    if feature_pyramid is None:
+        training_set = load_training_set_file(training_path)
+        feature_pyramid = featureextractor.get_feature_pyramid_batch(
+            featureextractor.pack_strokes(training_set))
+    sample = project_features(
+        projection, feature_pyramid[featureextractor.NUMBER_OF_POINTS])
+    return feature_pyramid, get_tolerance_distance(sample)
@@ -1,5 +1,20 @@
-"""Module to convert list of points from evtest to easily comparable format."""
-from math import atan, pi, fabs, hypot
+"""Module to convert list of points from evtest to easily comparable format.
+
+The features are computed by an array-based engine working on the x and y
+coordinates of the points and the pen-up marker of every point. Many strokes
+packed together (see PackedStrokes) are processed in one pass by
+get_features_batch. The curves may be resampled at several resolutions in
+the same pass (see get_feature_pyramid_batch). The signals may be given
+either as a list of signal objects or as a Stroke. The Point, Line, Curve
+and Scaler classes are kept for compatibility with code which still works on
+objects.
+"""
+from collections import deque, namedtuple
+from math import atan, pi, hypot
+
+import numpy as np
+
+from stroke import stroke as stroke_module
 
 
 class Point:
@@ -153,6 +168,632 @@ NUMBER_OF_POINTS = 40
 ANGLE_DOWNSCALE = 28
 COLOR_DOWNSCALE = 2
 
+# The numbers of points of the resolutions of the feature pyramid, from the
+# coarsest to the finest one.
+PYRAMID_LEVELS = [10, 20, NUMBER_OF_POINTS]
+
+# The version of the computation of the features and of the statistics. It
+# has to be increased whenever they change, so the features cached by the
+# classifier are extracted again.
+EXTRACTOR_VERSION = 2
+
+
+def get_parameters():
+    """Return the values of the parameters the features depend on."""
+    return {'SCALE': SCALE, 'NUMBER_OF_POINTS': NUMBER_OF_POINTS,
+            'ANGLE_DOWNSCALE': ANGLE_DOWNSCALE,
+            'COLOR_DOWNSCALE': COLOR_DOWNSCALE,
+            'PYRAMID_LEVELS': PYRAMID_LEVELS,
+            'EXTRACTOR_VERSION': EXTRACTOR_VERSION}
+
+
+def get_feature_size(number_of_points=NUMBER_OF_POINTS):
+    """Return the length of the feature vector of a curve of that many points.
+
+    There are x, y, color and angle per point but the last point has no
+    angle.
+    """
+    return 4 * number_of_points - 1
+
+
+PackedStrokes = namedtuple('PackedStrokes',
+                           ['x_values', 'y_values', 'pen_up', 'offsets'])
+PackedStrokes.__doc__ = """Many strokes packed into flat arrays.
+
+The points of the i-th stroke are the elements offsets[i] to offsets[i + 1]
+(exclusive) of x_values, y_values and pen_up, so offsets has one element
+more than there are strokes.
+"""
+
+
+def _single_stroke_offsets(x_values):
+    """Return offsets describing one stroke made of all the points."""
+    return np.array([0, len(x_values)])
+
+
+def get_cumulative_length(x_values, y_values, offsets=None):
+    """Calculate the length of the curve travelled up to every point.
+
+    Args:
+        x_values (numpy.ndarray): The x coordinates of the points.
+        y_values (numpy.ndarray): The y coordinates of the points.
+        offsets (numpy.ndarray): The offsets of the strokes if the points
+            belong to more than one stroke (see PackedStrokes). The strokes
+            are not connected with each other.
+
+    Returns:
+        Array of the cumulative arc length. Its first element is always 0.
+    """
+    line_lengths = np.hypot(np.diff(x_values), np.diff(y_values))
+    if offsets is not None:
+        line_lengths[offsets[1:-1] - 1] = 0
+    cumulative_length = np.zeros(len(x_values))
+    np.cumsum(line_lengths, out=cumulative_length[1:])
+    return cumulative_length
+
+
+def get_border_points(x_values, y_values, offsets):
+    """Calculate min and max points of the rectangular border of each stroke.
+
+    Returns:
+        Tuple of two pairs of arrays: the min and the max points.
+    """
+    starts = offsets[:-1]
+    return ((np.minimum.reduceat(x_values, starts),
+             np.minimum.reduceat(y_values, starts)),
+            (np.maximum.reduceat(x_values, starts),
+             np.maximum.reduceat(y_values, starts)))
+
+
+def get_centers_of_mass(x_values, y_values, cumulative_length, offsets):
+    """Calculate center of mass of every stroke made of linear segments.
+
+    Every segment weighs as much as it is long. The first point of a stroke
+    is its center of mass if the stroke has no length.
+
+    Returns:
+        Pair of arrays: x and y coordinates of the centers of mass.
+    """
+    starts = offsets[:-1]
+    # The segments joining consecutive strokes have length 0, so every
+    # stroke's range may safely include the segment following its last point.
+    line_lengths = np.append(np.diff(cumulative_length), 0)
+    lengths = np.add.reduceat(line_lengths, starts)
+    moments_x = np.add.reduceat(
+        np.append(x_values[:-1] + x_values[1:], 0) * line_lengths, starts)
+    moments_y = np.add.reduceat(
+        np.append(y_values[:-1] + y_values[1:], 0) * line_lengths, starts)
+
+    center_x = x_values[starts].astype(float)
+    center_y = y_values[starts].astype(float)
+    has_length = lengths > 0
+    center_x[has_length] = \
+        moments_x[has_length] / 2 / lengths[has_length]
+    center_y[has_length] = \
+        moments_y[has_length] / 2 / lengths[has_length]
+    return center_x, center_y
+
+
+def resample_curves(x_values, y_values, pen_up, cumulative_length, offsets,
+                    number_of_points=NUMBER_OF_POINTS):
+    """Pick number_of_points equidistant points of every stroke.
+
+    The first and the last point of a stroke are always picked. The rest is
+    interpolated along the arc length. A picked point inherits the pen-up
+    marker of the point which starts the segment it lies on.
+
+    Returns:
+        Tuple of three arrays of shape (number of strokes, number_of_points):
+        x coordinates, y coordinates and pen-up markers of the picked points.
+    """
+    starts = offsets[:-1]
+    ends = offsets[1:] - 1
+    shape = (len(starts), number_of_points)
+
+    new_x = np.empty(shape)
+    new_y = np.empty(shape)
+    new_pen_up = np.empty(shape, dtype=bool)
+    new_x[:] = x_values[ends, np.newaxis]
+    new_y[:] = y_values[ends, np.newaxis]
+    new_pen_up[:] = pen_up[ends, np.newaxis]
+    new_x[:, 0] = x_values[starts]
+    new_y[:, 0] = y_values[starts]
+    new_pen_up[:, 0] = pen_up[starts]
+
+    start_lengths = cumulative_length[starts]
+    lengths = cumulative_length[ends] - start_lengths
+    curved = np.flatnonzero(lengths > 0)
+    targets = start_lengths[curved, np.newaxis] + \
+        np.arange(1, number_of_points - 1) * \
+        (lengths[curved, np.newaxis] / (number_of_points - 1))
+
+    # Every target lies on a segment of non-zero length starting at a point
+    # of the same stroke.
+    sections = np.searchsorted(cumulative_length, targets, side='right') - 1
+    section_lengths = cumulative_length[sections + 1] - \
+        cumulative_length[sections]
+    ratios = (targets - cumulative_length[sections]) / section_lengths
+    new_x[curved, 1:-1] = x_values[sections] + \
+        ratios * (x_values[sections + 1] - x_values[sections])
+    new_y[curved, 1:-1] = y_values[sections] + \
+        ratios * (y_values[sections + 1] - y_values[sections])
+    new_pen_up[curved, 1:-1] = pen_up[sections]
+    return new_x, new_y, new_pen_up
+
+
+def scale_curves(new_x, new_y, min_points, max_points, origins):
+    """Move every curve to its origin and scale it.
+
+    The array counterpart of Scaler.scale_point. The curves are scaled
+    squarely so that the longer side of the border has length SCALE.
+
+    Args:
+        new_x (numpy.ndarray): The x coordinates, one row per curve.
+        new_y (numpy.ndarray): The y coordinates, one row per curve.
+        min_points (tuple): The x and y arrays of the min border points.
+        max_points (tuple): The x and y arrays of the max border points.
+        origins (tuple): The x and y arrays of the origins.
+    """
+    drawn_scale = np.maximum(max_points[0] - min_points[0],
+                             max_points[1] - min_points[1]).astype(float)
+    flat = drawn_scale == 0
+    drawn_scale[flat] = 1
+
+    scaled_x = (new_x - origins[0][:, np.newaxis]) / \
+        drawn_scale[:, np.newaxis] * SCALE
+    scaled_y = (new_y - origins[1][:, np.newaxis]) / \
+        drawn_scale[:, np.newaxis] * SCALE
+    scaled_x[flat] = 0
+    scaled_y[flat] = 0
+    return scaled_x, scaled_y
+
+
+def _normalize_strokes_at_levels(strokes, levels):
+    """Normalize the strokes at every resolution from the levels.
+
+    The arc length, the borders and the centers of mass of the strokes are
+    computed once and shared by all the resolutions.
+
+    Yields:
+        Tuples of three arrays of shape (number of strokes, number of
+        points), one tuple per level (see normalize_strokes).
+    """
+    x_values = np.asarray(strokes.x_values, dtype=float)
+    y_values = np.asarray(strokes.y_values, dtype=float)
+    pen_up = np.asarray(strokes.pen_up, dtype=bool)
+    offsets = np.asarray(strokes.offsets, dtype=np.intp)
+
+    cumulative_length = get_cumulative_length(x_values, y_values, offsets)
+    centers = get_centers_of_mass(x_values, y_values, cumulative_length,
+                                  offsets)
+    min_points, max_points = get_border_points(x_values, y_values, offsets)
+
+    for number_of_points in levels:
+        new_x, new_y, new_pen_up = resample_curves(
+            x_values, y_values, pen_up, cumulative_length, offsets,
+            number_of_points)
+        new_x, new_y = scale_curves(new_x, new_y, min_points, max_points,
+                                    centers)
+        yield new_x, new_y, new_pen_up
+
+
+def normalize_strokes(strokes):
+    """Transform the strokes to easily measurable format.
+
+    Args:
+        strokes (PackedStrokes): The strokes. Every stroke needs at least
+            one point.
+
+    Returns:
+        Tuple of three arrays of shape (number of strokes, NUMBER_OF_POINTS):
+        x coordinates, y coordinates and pen-up markers of the normalized
+        curves.
+    """
+    return next(_normalize_strokes_at_levels(strokes, [NUMBER_OF_POINTS]))
+
+
+def normalize_arrays(x_values, y_values, pen_up):
+    """Transform the points of a single curve to easily measurable format.
+
+    Returns:
+        Tuple of three arrays of length NUMBER_OF_POINTS: x coordinates,
+        y coordinates and pen-up markers of the normalized curve.
+    """
+    strokes = PackedStrokes(x_values, y_values, pen_up,
+                            _single_stroke_offsets(x_values))
+    new_x, new_y, new_pen_up = normalize_strokes(strokes)
+    return new_x[0], new_y[0], new_pen_up[0]
+
+
+def get_angles(x_values, y_values):
+    """Get scaled absolute angles between the segments and the x axis.
+
+    Works along the last axis, so rows of many curves can be passed at once.
+    """
+    angles = np.arctan2(np.abs(np.diff(y_values)), np.abs(np.diff(x_values)))
+    return 2 * angles / pi * (SCALE / ANGLE_DOWNSCALE)
+
+
+def get_features_batch(strokes):
+    """Return the feature vectors of many strokes at once.
+
+    Args:
+        strokes (PackedStrokes): The strokes. Every stroke needs at least
+            one point.
+
+    Returns:
+        Matrix with one row of features per stroke. A row holds x, y, color,
+        angle, x, y, color, ... (there is one angle less than there are
+        points).
+    """
+    return get_feature_pyramid_batch(strokes, [NUMBER_OF_POINTS])[
+        NUMBER_OF_POINTS]
+
+
+def get_feature_pyramid_batch(strokes, levels=None):
+    """Return the feature vectors of many strokes at several resolutions.
+
+    Args:
+        strokes (PackedStrokes): The strokes. Every stroke needs at least
+            one point.
+        levels (list of int): The numbers of points of the resolutions.
+            PYRAMID_LEVELS by default.
+
+    Returns:
+        Dictionary mapping every level to the matrix with one row of
+        features per stroke (see get_features_batch).
+    """
+    if levels is None:
+        levels = PYRAMID_LEVELS
+    if len(strokes.offsets) == 1:
+        return {number_of_points:
+                np.empty((0, get_feature_size(number_of_points)))
+                for number_of_points in levels}
+    return {number_of_points: join_feature_arrays(*normalized)
+            for number_of_points, normalized in
+            zip(levels, _normalize_strokes_at_levels(strokes, levels))}
+
+
+def get_statistics_batch(strokes):
+    """Return cheap statistics of many strokes at once.
+
+    Nothing is resampled, so the statistics may rule out symbols before the
+    features are computed.
+
+    Args:
+        strokes (PackedStrokes): The strokes. Every stroke needs at least
+            one point.
+
+    Returns:
+        Matrix with one row per stroke: the number of points, the number of
+        the raises of the finger, the arc length relative to the border (to
+        the sum of its width and height, increased by 1) and the aspect
+        ratio of the border (its height to its width, both increased by 1).
+        The last two do not change when the stroke is scaled.
+    """
+    offsets = strokes.offsets
+    statistics = np.empty((len(offsets) - 1, 4))
+    if len(offsets) == 1:
+        return statistics
+    starts = offsets[:-1]
+    cumulative_length = get_cumulative_length(strokes.x_values,
+                                              strokes.y_values, offsets)
+    (min_x, min_y), (max_x, max_y) = get_border_points(
+        strokes.x_values, strokes.y_values, offsets)
+    statistics[:, 0] = np.diff(offsets)
+    statistics[:, 1] = np.add.reduceat(strokes.pen_up.astype(int), starts)
+    statistics[:, 2] = (cumulative_length[offsets[1:] - 1] -
+                        cumulative_length[starts]) / \
+        (max_x - min_x + max_y - min_y + 1)
+    statistics[:, 3] = (max_y - min_y + 1) / (max_x - min_x + 1)
+    return statistics
+
+
+def join_feature_arrays(new_x, new_y, new_pen_up):
+    """Join the normalized curves and their angles into feature vectors.
+
+    Args:
+        new_x (numpy.ndarray): The x coordinates, one row per curve.
+        new_y (numpy.ndarray): The y coordinates, one row per curve.
+        new_pen_up (numpy.ndarray): The pen-up markers, one row per curve.
+
+    Returns:
+        Matrix with one row of features per curve.
+    """
+    number_of_curves, number_of_points = new_x.shape
+    features = np.empty((number_of_curves, number_of_points, 4))
+    features[:, :, 0] = new_x
+    features[:, :, 1] = new_y
+    features[:, :, 2] = new_pen_up * (SCALE / COLOR_DOWNSCALE)
+    features[:, :-1, 3] = get_angles(new_x, new_y)
+    features = features.reshape(number_of_curves, -1)[:, :-1]
+    return np.ascontiguousarray(features)
+
+
+def get_features_from_arrays(x_values, y_values, pen_up):
+    """Return the feature vector of a curve given as arrays.
+
+    Args:
+        x_values (array-like): The x coordinates of the proper points.
+        y_values (array-like): The y coordinates of the proper points.
+        pen_up (array-like of bool): True for the points after which
+            the finger was raised.
+
+    Returns:
+        Array of features (see get_features_batch).
+    """
+    strokes = PackedStrokes(x_values, y_values, pen_up,
+                            _single_stroke_offsets(x_values))
+    return get_features_batch(strokes)[0]
+
+
+class StrokeAccumulator:
+    """Statistics of a stroke maintained while its signals are coming.
+
+    The points are stored together with their pen-up markers, the running
+    border, arc length and center of mass, so only the resampling is left
+    to do when the stroke is finished. Signals may be removed from the head
+    of the stroke too.
+
+    The points are numbered in the order of their arrival. The point number
+    n is stored at the position n - base of the arrays.
+
+    Attributes:
+        x_values (numpy.ndarray): Storage of the x coordinates.
+        y_values (numpy.ndarray): Storage of the y coordinates.
+        pen_up (numpy.ndarray): Storage of the pen-up markers.
+        line_lengths (numpy.ndarray): Storage of the lengths of the segments
+            ending at the points.
+        cumulative_length (numpy.ndarray): Storage of the arc length
+            travelled since the first point stored.
+        base (int): Number of the point stored at the position 0.
+        head (int): Number of the first point of the stroke.
+        tail (int): Number of the point which is going to be added next.
+        moment_x (float): Sum of x coordinates of the segments' centers
+            weighted by the segments' lengths (doubled).
+        moment_y (float): As above, for the y coordinates.
+        last_point_pending (bool): True if nothing after the last point
+            has told yet if the finger was raised.
+        extremes (list of deque): Monotonic queues of point numbers giving
+            the min x, min y, max x and max y of the stroke.
+        raises (int): Number of the points of the stroke after which the
+            finger went up.
+    """
+
+    INITIAL_CAPACITY = 256
+
+    def __init__(self):
+        """Create an empty accumulator."""
+        self.reset()
+
+    def reset(self):
+        """Forget all the points."""
+        self.x_values = np.empty(self.INITIAL_CAPACITY)
+        self.y_values = np.empty(self.INITIAL_CAPACITY)
+        self.pen_up = np.zeros(self.INITIAL_CAPACITY, dtype=bool)
+        self.line_lengths = np.empty(self.INITIAL_CAPACITY)
+        self.cumulative_length = np.empty(self.INITIAL_CAPACITY)
+        self.base = 0
+        self.head = 0
+        self.tail = 0
+        self.moment_x = 0.0
+        self.moment_y = 0.0
+        self.last_point_pending = False
+        self.extremes = [deque(), deque(), deque(), deque()]
+        self.raises = 0
+
+    def number_of_points(self):
+        """Return the number of points of the stroke."""
+        return self.tail - self.head
+
+    def add(self, signal):
+        """Take a new signal into account.
+
+        Args:
+            signal (TouchpadSignal): The signal added to the stroke.
+        """
+        if signal.is_proper_signal_of_point():
+            self.add_point(signal.get_x(), signal.get_y())
+        elif signal.is_raising_finger_signal():
+            self.raise_finger()
+
+    def raise_finger(self):
+        """Mark the last point as the one after which the finger went up."""
+        if self.last_point_pending:
+            self.pen_up[self.tail - 1 - self.base] = True
+            self.last_point_pending = False
+            self.raises += 1
+
+    def remove_head_point(self):
+        """Forget the first point of the stroke."""
+        if self.head == self.tail:
+            return
+        if self.head + 1 == self.tail:
+            self.reset()
+            return
+
+        position = self.head - self.base
+        line_length = self.line_lengths[position + 1]
+        self.moment_x -= line_length * \
+            (self.x_values[position] + self.x_values[position + 1])
+        self.moment_y -= line_length * \
+            (self.y_values[position] + self.y_values[position + 1])
+        for extreme in self.extremes:
+            if extreme[0] == self.head:
+                extreme.popleft()
+        if self.pen_up[position]:
+            self.raises -= 1
+        self.head += 1
+
+    def get_length(self):
+        """Return the length of the stroke."""
+        if self.head == self.tail:
+            return 0.0
+        return self.cumulative_length[self.tail - 1 - self.base] - \
+            self.cumulative_length[self.head - self.base]
+
+    def get_center_of_mass(self):
+        """Return the center of mass of the stroke as a pair of coordinates.
+
+        Every segment weighs as much as it is long (see get_centers_of_mass).
+        """
+        length = self.get_length()
+        if length <= 0:
+            position = self.head - self.base
+            return self.x_values[position], self.y_values[position]
+        return self.moment_x / 2 / length, self.moment_y / 2 / length
+
+    def get_border_points(self):
+        """Return the min and the max point of the border of the stroke."""
+        min_x, min_y, max_x, max_y = \
+            [storage[extreme[0] - self.base] for extreme, storage in
+             zip(self.extremes, [self.x_values, self.y_values] * 2)]
+        return (min_x, min_y), (max_x, max_y)
+
+    def get_statistics(self):
+        """Return the statistics of the stroke (see get_statistics_batch).
+
+        Returns:
+            Array of the statistics. None is returned if there are no
+            points.
+        """
+        if self.head == self.tail:
+            return None
+        (min_x, min_y), (max_x, max_y) = self.get_border_points()
+        return np.array([self.number_of_points(), self.raises,
+                         self.get_length() /
+                         (max_x - min_x + max_y - min_y + 1),
+                         (max_y - min_y + 1) / (max_x - min_x + 1)])
+
+    def get_features(self):
+        """Return the feature vector of the stroke.
+
+        Returns:
+            Array of features (see get_features_batch). None is returned
+            if there are no points.
+        """
+        pyramid = self.get_feature_pyramid([NUMBER_OF_POINTS])
+        if pyramid is None:
+            return None
+        return pyramid[NUMBER_OF_POINTS]
+
+    def get_feature_pyramid(self, levels=None):
+        """Return the feature vectors of the stroke at several resolutions.
+
+        Args:
+            levels (list of int): The numbers of points of the resolutions.
+                PYRAMID_LEVELS by default.
+
+        Returns:
+            Dictionary mapping every level to the array of features. None
+            is returned if there are no points.
+        """
+        if self.head == self.tail:
+            return None
+        if levels is None:
+            levels = PYRAMID_LEVELS
+        start = self.head - self.base
+        stop = self.tail - self.base
+        x_values = self.x_values[start:stop]
+        y_values = self.y_values[start:stop]
+        min_point, max_point = self.get_border_points()
+        center = self.get_center_of_mass()
+
+        pyramid = {}
+        for number_of_points in levels:
+            new_x, new_y, new_pen_up = resample_curves(
+                x_values, y_values, self.pen_up[start:stop],
+                self.cumulative_length[start:stop],
+                _single_stroke_offsets(x_values), number_of_points)
+            new_x, new_y = scale_curves(
+                new_x, new_y,
+                (np.array([min_point[0]]), np.array([min_point[1]])),
+                (np.array([max_point[0]]), np.array([max_point[1]])),
+                (np.array([center[0]]), np.array([center[1]])))
+            pyramid[number_of_points] = \
+                join_feature_arrays(new_x, new_y, new_pen_up)[0]
+        return pyramid
+
+    def add_point(self, x_value, y_value):
+        """Append the point to the stroke and update the statistics."""
+        if self.tail - self.base == len(self.x_values):
+            self._make_room()
+        position = self.tail - self.base
+        self.x_values[position] = x_value
+        self.y_values[position] = y_value
+        self.pen_up[position] = False
+
+        if self.tail > self.head:
+            line_length = hypot(x_value - self.x_values[position - 1],
+                                y_value - self.y_values[position - 1])
+            self.line_lengths[position] = line_length
+            self.cumulative_length[position] = \
+                self.cumulative_length[position - 1] + line_length
+            self.moment_x += line_length * \
+                (self.x_values[position - 1] + x_value)
+            self.moment_y += line_length * \
+                (self.y_values[position - 1] + y_value)
+        else:
+            self.line_lengths[position] = 0.0
+            self.cumulative_length[position] = 0.0
+
+        for extreme, storage, keeps_minimum in \
+                zip(self.extremes, [self.x_values, self.y_values] * 2,
+                    [True, True, False, False]):
+            value = storage[position]
+            while extreme:
+                last_value = storage[extreme[-1] - self.base]
+                if (last_value < value) if keeps_minimum else \
+                        (last_value > value):
+                    break
+                extreme.pop()
+            extreme.append(self.tail)
+
+        self.tail += 1
+        self.last_point_pending = True
+
+    def _make_room(self):
+        """Move the stroke to the front of the storage or enlarge it."""
+        start = self.head - self.base
+        count = self.tail - self.head
+        capacity = max(len(self.x_values), 2 * count)
+        storages = ['x_values', 'y_values', 'pen_up', 'line_lengths',
+                    'cumulative_length']
+        for name in storages:
+            storage = getattr(self, name)
+            moved = np.empty(capacity, dtype=storage.dtype)
+            moved[:count] = storage[start:start + count]
+            setattr(self, name, moved)
+        self.base = self.head
+
+
+def _curve_from_arrays(x_values, y_values, colors, length):
+    """Wrap normalized arrays into a Curve object."""
+    curve = Curve(Point(x_values[0], y_values[0]))
+    for i in range(1, len(x_values)):
+        curve.hard_add_point(Point(x_values[i], y_values[i]))
+    curve.attach_colors(list(colors))
+    curve.center_of_mass = Point(0, 0)
+    curve.length = length
+    return curve
+
+
+def _points_to_arrays(list_of_points):
+    """Convert a list of Points to arrays of coordinates."""
+    x_values = np.array([point.x_cord for point in list_of_points],
+                        dtype=float)
+    y_values = np.array([point.y_cord for point in list_of_points],
+                        dtype=float)
+    return x_values, y_values
+
+
+def _signals_to_coordinates(signal_list):
+    """Return the x and the y values of the signals (a list or a Stroke)."""
+    if isinstance(signal_list, stroke_module.Stroke):
+        return signal_list.x_values, signal_list.y_values
+    return (np.array([signal.get_x() for signal in signal_list]),
+            np.array([signal.get_y() for signal in signal_list]))
+
 
 def calculate_border_points(signal_list):
     """Calculate min a max points of a rectangular border.
@@ -161,39 +802,22 @@ def calculate_border_points(signal_list):
     therefore we need to know coordinates of least rectangle,
     that covers them all.
     """
-    initiated_starting_values = False
-    max_point = Point(0, 0)
-    min_point = Point(0, 0)
-    for signal in signal_list:
-        point = Point(signal.get_x(), signal.get_y())
-
-        if not initiated_starting_values:
-            min_point.x_cord = point.x_cord
-            min_point.y_cord = point.y_cord
-            max_point.x_cord = point.x_cord
-            max_point.y_cord = point.y_cord
-            initiated_starting_values = True
-
-        if point.x_cord < min_point.x_cord:
-            min_point.x_cord = point.x_cord
-        if point.x_cord > max_point.x_cord:
-            max_point.x_cord = point.x_cord
-        if point.y_cord < min_point.y_cord:
-            min_point.y_cord = point.y_cord
-        if point.y_cord > max_point.y_cord:
-            max_point.y_cord = point.y_cord
-
-    return min_point, max_point
+    if not len(signal_list):
+        return Point(0, 0), Point(0, 0)
+    x_values, y_values = _signals_to_coordinates(signal_list)
+    return Point(x_values.min(), y_values.min()), \
+        Point(x_values.max(), y_values.max())
 
 
 def create_curve(signal_list):
     """Create curve given signal_list from evtest."""
-    if not signal_list:
+    if not len(signal_list):
         return
-    curve = Curve(Point(signal_list[0].get_x(), signal_list[0].get_y()))
+    x_values, y_values = _signals_to_coordinates(signal_list)
+    curve = Curve(Point(x_values[0], y_values[0]))
 
-    for i in range(1, len(signal_list)):
-        point = Point(signal_list[i].get_x(), signal_list[i].get_y())
+    for i in range(1, len(x_values)):
+        point = Point(x_values[i], y_values[i])
         curve.add_point(point)
 
     return curve
@@ -205,51 +829,21 @@ def create_normalized_curve(curve, min_point, max_point, colors):
     Creates list of equdistant NUMBER_OF_POINTS points
     that represents the same shape as signal_list list
     """
-    length_of_one_line = curve.length / (NUMBER_OF_POINTS - 1)
-    # there is one more point then the number of lines
-    # curve_length-1 to be sure there are NUMBER_OF_POINTS points
-
-    travelled_distance = 0
-    scaler = Scaler(min_point, max_point, curve.center_of_mass)
-    point = curve.list_of_points[0]
-
-    normalized_curve = Curve(scaler.scale_point(point))
-    normalized_curve.add_color(colors[0])
-
-    for i in range(0, len(curve.list_of_points) - 1):
-        point = curve.list_of_points[i]
-        next_point = curve.list_of_points[i + 1]
-        section = Line(point, next_point)
-
-        travelled_distance += section.length()
-        while travelled_distance > length_of_one_line:
-            # there should be a new points between these two
-            travelled_distance = (travelled_distance - length_of_one_line)
-            overdue = section.length() - travelled_distance
-            # section_length = overdue + x
-            # overdue is included in previous line,
-            # so x must be added to the new line distance
-
-            # determining new point coordinates
-            ratio = overdue / section.length()
-            point = section.ratio_point(ratio)
-            scaled_point = scaler.scale_point(point)
-            section = Line(point, next_point)
-            # in case there should be more points added then one here
-
-            normalized_curve.hard_add_point(scaled_point)
-
-            normalized_curve.add_color(colors[i])
-
-    while len(normalized_curve.list_of_points) < NUMBER_OF_POINTS:
-        scaled_point = scaler.scale_point(
-            curve.list_of_points[len(curve.list_of_points) - 1])
-        normalized_curve.hard_add_point(scaled_point)
-        normalized_curve.add_color(colors[len(curve.list_of_points) - 1])
-
-    normalized_curve.center_of_mass = Point(0, 0)
-    normalized_curve.length = curve.length
-    return normalized_curve
+    x_values, y_values = _points_to_arrays(curve.list_of_points)
+    colors = np.asarray(colors)
+    offsets = _single_stroke_offsets(x_values)
+    cumulative_length = get_cumulative_length(x_values, y_values)
+
+    new_x, new_y, new_pen_up = resample_curves(
+        x_values, y_values, colors != 0, cumulative_length, offsets)
+    new_x, new_y = scale_curves(
+        new_x, new_y, (np.array([min_point.x_cord]),
+                       np.array([min_point.y_cord])),
+        (np.array([max_point.x_cord]), np.array([max_point.y_cord])),
+        (np.array([curve.center_of_mass.x_cord]),
+         np.array([curve.center_of_mass.y_cord])))
+    new_colors = new_pen_up[0] * (SCALE / COLOR_DOWNSCALE)
+    return _curve_from_arrays(new_x[0], new_y[0], new_colors, curve.length)
 
 
 def draw_new_points(list_of_points):
@@ -285,20 +879,8 @@ def dot_product(vector1, vector2):
 
 def get_angle_list(curve):
     """Get list of angles between lines and x_axis."""
-    feature_list = []
-    list_of_points = curve.list_of_points
-
-    for i in range(len(list_of_points) - 1):
-        point = list_of_points[i]
-        next_point = list_of_points[i + 1]
-        angle = angle_between_line_and_xaxis(point, next_point)
-
-        # scaling angle
-        angle = 2 * angle / pi * (SCALE / ANGLE_DOWNSCALE)
-
-        # appends absolute value of the angle
-        feature_list.append(fabs(angle))
-    return feature_list
+    x_values, y_values = _points_to_arrays(curve.list_of_points)
+    return get_angles(x_values, y_values).tolist()
 
 
 def join_features(list_of_points, list_of_feature1, colors):
@@ -326,57 +908,138 @@ def normalize_points(list_of_signal_points, colors):
     returns list of points that represents the same
     figure but is in our preferred standard
     """
-    min_point, max_point = calculate_border_points(list_of_signal_points)
+    x_values = [signal.get_x() for signal in list_of_signal_points]
+    y_values = [signal.get_y() for signal in list_of_signal_points]
+    colors = np.asarray(colors)
+
+    new_x, new_y, new_pen_up = normalize_arrays(x_values, y_values,
+                                                colors != 0)
+    new_colors = new_pen_up * (SCALE / COLOR_DOWNSCALE)
+    length = get_cumulative_length(np.asarray(x_values, dtype=float),
+                                   np.asarray(y_values, dtype=float))[-1]
+    return _curve_from_arrays(new_x, new_y, new_colors, length)
 
-    curve = create_curve(list_of_signal_points)
 
-    new_curve = create_normalized_curve(curve, min_point, max_point, colors)
-    return new_curve
+def segment_signals(proper, raising):
+    """Find the proper points among the signals and the pen state after them.
+
+    The finger is raised after a point if the first signal following the
+    point which is either a proper point or a raise of the finger is
+    the raise. The signals are processed in a single pass.
+
+    Args:
+        proper (array-like of bool): True for the proper signals of points.
+        raising (array-like of bool): True for the signals of raising
+            the finger.
+
+    Returns:
+        Tuple of two arrays: indices of the proper points among the signals
+        and the pen-up markers of those points.
+    """
+    proper = np.asarray(proper, dtype=bool)
+    markers = np.flatnonzero(proper | np.asarray(raising, dtype=bool))
+    marker_is_point = proper[markers]
+    pen_up = np.zeros(len(markers), dtype=bool)
+    pen_up[:-1] = ~marker_is_point[1:]
+    return markers[marker_is_point], pen_up[marker_is_point]
+
+
+def _segment_signal_list(list_of_signals):
+    """Run segment_signals on the signals from evtest."""
+    if isinstance(list_of_signals, stroke_module.Stroke):
+        proper = list_of_signals.proper_points()
+        raising = ~proper & list_of_signals.raising_finger()
+        return segment_signals(proper, raising)
+    proper = [signal.is_proper_signal_of_point() for signal in list_of_signals]
+    raising = [not is_proper and signal.is_raising_finger_signal()
+               for signal, is_proper in zip(list_of_signals, proper)]
+    return segment_signals(proper, raising)
 
 
 def filter_points_from_signals(list_of_signals):
-    """Remove unproper signals from evtest."""
-    points = []
-    colors = []
-    length = len(list_of_signals)
-    color_scaled = SCALE / COLOR_DOWNSCALE
-    for i in range(length):
-        touchpad_signal = list_of_signals[i]
-        if touchpad_signal.is_proper_signal_of_point():
-            points.append(touchpad_signal)
-            j = i + 1
-            while j < length and not \
-                    list_of_signals[j].is_raising_finger_signal()\
-                    and not list_of_signals[j].is_proper_signal_of_point():
-                j += 1
-            if j == length or list_of_signals[j].is_proper_signal_of_point():
-                colors.append(0)
-            else:
-                colors.append(color_scaled)
+    """Remove unproper signals from evtest.
+
+    The points are returned as a Stroke if the signals are given as one.
+    """
+    point_indices, pen_up = _segment_signal_list(list_of_signals)
+    if isinstance(list_of_signals, stroke_module.Stroke):
+        points = list_of_signals.take(point_indices)
+    else:
+        points = [list_of_signals[i] for i in point_indices]
+    colors = (pen_up * (SCALE / COLOR_DOWNSCALE)).tolist()
     return points, colors
 
 
+def signals_to_arrays(list_of_signals):
+    """Convert signals from evtest to arrays of the proper points.
+
+    Args:
+        list_of_signals (list or Stroke): The signals. A Stroke is converted
+            without touching the individual signals.
+
+    Returns:
+        Tuple of three arrays: x coordinates, y coordinates and pen-up
+        markers of the proper points.
+    """
+    point_indices, pen_up = _segment_signal_list(list_of_signals)
+    if isinstance(list_of_signals, stroke_module.Stroke):
+        return (list_of_signals.x_values[point_indices].astype(float),
+                list_of_signals.y_values[point_indices].astype(float),
+                pen_up)
+    x_values = np.array([list_of_signals[i].get_x() for i in point_indices],
+                        dtype=float)
+    y_values = np.array([list_of_signals[i].get_y() for i in point_indices],
+                        dtype=float)
+    return x_values, y_values, pen_up
+
+
+def pack_strokes(list_of_signal_lists):
+    """Pack many lists of signals (or Strokes) into PackedStrokes."""
+    arrays = [signals_to_arrays(signal_list)
+              for signal_list in list_of_signal_lists]
+    offsets = np.zeros(len(arrays) + 1, dtype=np.intp)
+    np.cumsum([len(x_values) for x_values, _, _ in arrays], out=offsets[1:])
+    if not arrays:
+        return PackedStrokes(np.empty(0), np.empty(0),
+                             np.empty(0, dtype=bool), offsets)
+    return PackedStrokes(np.concatenate([stroke[0] for stroke in arrays]),
+                         np.concatenate([stroke[1] for stroke in arrays]),
+                         np.concatenate([stroke[2] for stroke in arrays]),
+                         offsets)
+
+
 def get_new_points(list_of_signals):
     """Get new normalized list of points for list of signals."""
-    list_of_signal_points, colors = filter_points_from_signals(list_of_signals)
-    new_curve = normalize_points(list_of_signal_points, colors)
-
-    new_points = new_curve.list_of_points
-    return new_points
+    new_x, new_y, _ = normalize_arrays(*signals_to_arrays(list_of_signals))
+    return [Point(x_cord, y_cord) for x_cord, y_cord in zip(new_x, new_y)]
 
 
 def get_features(list_of_signals):
-    """Return list of features for list of points taken from evtest."""
-    list_of_signal_points, colors = filter_points_from_signals(list_of_signals)
+    """Return the feature vector for list of points taken from evtest."""
+    return get_features_from_arrays(*signals_to_arrays(list_of_signals))
 
-    new_curve = normalize_points(list_of_signal_points, colors)
 
-    new_points = new_curve.list_of_points
-    new_colors = new_curve.colors
+def get_feature_pyramid(list_of_signals, levels=None):
+    """Return the feature vectors of the signals at several resolutions.
 
-    # getting features different then coordinates
-    angles = get_angle_list(new_curve)
+    Args:
+        list_of_signals (list or Stroke): The signals.
+        levels (list of int): The numbers of points of the resolutions.
+            PYRAMID_LEVELS by default.
 
-    # joining all the features together
-    feature_list = join_features(new_points, angles, new_colors)
-    return feature_list
+    Returns:
+        Dictionary mapping every level to the array of features.
+    """
+    x_values, y_values, pen_up = signals_to_arrays(list_of_signals)
+    strokes = PackedStrokes(x_values, y_values, pen_up,
+                            _single_stroke_offsets(x_values))
+    return {number_of_points: features[0] for number_of_points, features in
+            get_feature_pyramid_batch(strokes, levels).items()}
+
+
+def get_statistics(list_of_signals):
+    """Return the statistics of the signals (see get_statistics_batch)."""
+    x_values, y_values, pen_up = signals_to_arrays(list_of_signals)
+    strokes = PackedStrokes(x_values, y_values, pen_up,
+                            _single_stroke_offsets(x_values))
+    return get_statistics_batch(strokes)[0]
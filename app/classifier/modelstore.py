@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""Saving and loading the model store of the classifier.
+
+The store is a single uncompressed NumPy .npz file. Its manifest entry is a
+JSON document with the format version and the small data (e.g. the symbol
+table and the tolerances), the other entries are the arrays (e.g. the
+feature matrix of the index). It never holds pickles, so loading it runs no
+code from the file.
+
+The data of every array starts at a multiple of ALIGNMENT bytes of the
+file, so the arrays can be memory-mapped where they are (see load). The
+processes mapping the same store share its pages.
+"""
+
+import io
+import json
+import mmap
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+FORMAT = 'touchpad-classifier-store'
+# The version of the layout of the store. The stores of other versions are
+# not loaded.
+VERSION = 1
+
+MANIFEST_KEY = 'manifest'
+
+# The alignment of the data of the arrays in the file.
+ALIGNMENT = 64
+# The zip extra field padding the local headers, the one of zipalign.
+PADDING_EXTRA_ID = 0xD935
+# The size of the fixed part of the local header of a zip member.
+LOCAL_HEADER_SIZE = 30
+
+
+def save(path, manifest, arrays):
+    """Write the store atomically.
+
+    It is written to a temporary file first, which then replaces the old
+    store, so the readers see either the old or the new one whole.
+
+    Args:
+        path (str): The path of the store.
+        manifest (dict): The data which can be encoded as JSON. The format
+            and the version are added to it.
+        arrays (dict): Maps the names to the numpy.ndarrays.
+    """
+    manifest = dict(manifest, format=FORMAT, version=VERSION)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as handle:
+        with zipfile.ZipFile(handle, 'w', zipfile.ZIP_STORED) as archive:
+            _write_array(archive, handle, MANIFEST_KEY,
+                         np.array(json.dumps(manifest, sort_keys=True)))
+            for name, array in sorted(arrays.items()):
+                _write_array(archive, handle, name, array)
+    os.replace(temporary_path, path)
+
+
+def _write_array(archive, handle, name, array):
+    """Write the array as an aligned .npy member of the archive."""
+    data = io.BytesIO()
+    np.lib.format.write_array(data, np.asanyarray(array),
+                              allow_pickle=False)
+    member = zipfile.ZipInfo(name + '.npy', date_time=(1980, 1, 1, 0, 0, 0))
+    member.compress_type = zipfile.ZIP_STORED
+    # The .npy header aligns the data to ALIGNMENT bytes of the member, so
+    # the member has to start aligned. The extra field is at least its
+    # header long.
+    header_end = handle.tell() + LOCAL_HEADER_SIZE + \
+        len(member.filename.encode('utf-8')) + 4
+    padding = -header_end % ALIGNMENT
+    member.extra = struct.pack('<HH', PADDING_EXTRA_ID, padding) + \
+        bytes(padding)
+    archive.writestr(member, data.getvalue())
+
+
+def load(path, mapped=False):
+    """Read the store, opening the file once.
+
+    Args:
+        path (str): The path of the store.
+        mapped (bool): Map the arrays into the memory instead of reading
+            them. They are read-only then, and they are read from the file
+            when they are used. Replacing the store (see save) does not
+            change them.
+
+    Returns:
+        Tuple of the manifest and of the dictionary of the arrays.
+
+    Raises:
+        FileNotFoundError: If there is no store.
+        ValueError: If the file is not a store or its version is not
+            VERSION.
+    """
+    with open(path, 'rb') as handle:
+        try:
+            archive = zipfile.ZipFile(handle)
+        except zipfile.BadZipFile:
+            raise ValueError("%s is not a classifier store" % path)
+        with archive:
+            members = {member.filename[:-len('.npy')]: member
+                       for member in archive.infolist()
+                       if member.filename.endswith('.npy')}
+            manifest = _read_manifest(path, archive,
+                                      members.pop(MANIFEST_KEY, None))
+            buffer = None
+            if mapped and members:
+                buffer = mmap.mmap(handle.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+            arrays = {}
+            for name, member in members.items():
+                if buffer is not None:
+                    arrays[name] = _map_array(handle, buffer, member)
+                if arrays.get(name) is None:
+                    arrays[name] = _read_array(archive, member)
+    return manifest, arrays
+
+
+def load_manifest(path):
+    """Read the manifest of the store only.
+
+    Raises:
+        FileNotFoundError: If there is no store.
+        ValueError: If the file is not a store or its version is not
+            VERSION.
+    """
+    with open(path, 'rb') as handle:
+        try:
+            archive = zipfile.ZipFile(handle)
+        except zipfile.BadZipFile:
+            raise ValueError("%s is not a classifier store" % path)
+        with archive:
+            try:
+                member = archive.getinfo(MANIFEST_KEY + '.npy')
+            except KeyError:
+                member = None
+            return _read_manifest(path, archive, member)
+
+
+def _read_manifest(path, archive, member):
+    """Read the manifest of the .npy member and check its version.
+
+    The member is None if the archive has no manifest.
+    """
+    if member is None:
+        raise ValueError("%s is not a classifier store" % path)
+    manifest = json.loads(str(_read_array(archive, member)))
+    if manifest.get('format') != FORMAT:
+        raise ValueError("%s is not a classifier store" % path)
+    if manifest.get('version') != VERSION:
+        raise ValueError("%s has version %s of the store, %d is supported"
+                         % (path, manifest.get('version'), VERSION))
+    return manifest
+
+
+def _read_array(archive, member):
+    """Read the array of the .npy member of the archive."""
+    with archive.open(member) as data:
+        return np.lib.format.read_array(data, allow_pickle=False)
+
+
+def _map_array(handle, buffer, member):
+    """Return the array of the .npy member as a view of the mapped file.
+
+    Returns:
+        The read-only array, or None if the member cannot be mapped (it is
+        compressed or it has an unknown version of the .npy header).
+    """
+    if member.compress_type != zipfile.ZIP_STORED:
+        return None
+    handle.seek(member.header_offset)
+    header = handle.read(LOCAL_HEADER_SIZE)
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    handle.seek(member.header_offset + LOCAL_HEADER_SIZE + name_length +
+                extra_length)
+    version = np.lib.format.read_magic(handle)
+    if version == (1, 0):
+        shape, fortran_order, dtype = \
+            np.lib.format.read_array_header_1_0(handle)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = \
+            np.lib.format.read_array_header_2_0(handle)
+    else:
+        return None
+    if dtype.hasobject:
+        raise ValueError("the store holds objects")
+    count = int(np.prod(shape, dtype=np.int64))
+    array = np.frombuffer(buffer, dtype, count, handle.tell())
+    return array.reshape(shape, order='F' if fortran_order else 'C')
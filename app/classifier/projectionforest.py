@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""The ProjectionForest class."""
+
+import numpy as np
+
+# The number of the trees of the forest.
+TREES = 16
+# The most training elements a leaf of a tree holds.
+LEAF_SIZE = 64
+# The seed of the random splits, so the same samples give the same forest.
+SEED = 2016
+
+
+class ProjectionForest:
+    """Approximate nearest neighbour search by random projection trees.
+
+    Every tree splits the samples in halves recursively, by the median of
+    their projections onto the line through two random samples of the node,
+    until at most leaf_size samples are left. A query descends every tree
+    to one leaf and the union of the leaves is searched exactly. So the
+    cost of a query depends on the number of the trees and on the leaf size
+    rather than on the number of the samples. The nearest samples may be
+    missed if they fell into other leaves in every tree; more trees make
+    it less likely (see tools/indexbenchmark.py for the recall).
+
+    The samples can be spliced without building the trees again (see
+    splice). The new samples are put into the leaves they fall into, so
+    the leaves grow past leaf_size and the forest should be built again
+    once many samples have been spliced.
+
+    Attributes:
+        samples (numpy.ndarray): The searched vectors, one per row.
+        depth (int): The number of the splits from the root to a leaf.
+        directions (numpy.ndarray): The projection vectors of the inner
+            nodes, of shape (trees, nodes, features). The children of the
+            i-th node are the nodes 2i + 1 (below the threshold) and
+            2i + 2 (above), like in a binary heap.
+        thresholds (numpy.ndarray): The medians of the projections of the
+            inner nodes, of shape (trees, nodes).
+        leaf_rows (numpy.ndarray): The rows of the samples of every leaf,
+            of shape (trees, samples), grouped by the leaf.
+        leaf_offsets (numpy.ndarray): The rows of the i-th leaf of a tree
+            are at leaf_offsets[tree, i] to leaf_offsets[tree, i + 1]
+            (exclusive) of leaf_rows.
+        spliced (int): The number of the samples removed or added by splice
+            since the forest was built.
+    """
+
+    def __init__(self, samples, trees=TREES, leaf_size=LEAF_SIZE,
+                 seed=SEED):
+        """Constructor. Builds the trees.
+
+        Args:
+            samples (numpy.ndarray): The searched vectors, one per row.
+            trees (int): The number of the trees.
+            leaf_size (int): The most samples a leaf holds.
+            seed (int): The seed of the random splits.
+        """
+        self.samples = np.asarray(samples)
+        number_of_samples = len(self.samples)
+        self.depth = 0
+        while number_of_samples > leaf_size << self.depth:
+            self.depth += 1
+        nodes = 2 ** self.depth - 1
+        generator = np.random.RandomState(seed)
+        self.directions = np.zeros((trees, nodes, self.samples.shape[1]),
+                                   dtype=self.samples.dtype)
+        self.thresholds = np.zeros((trees, nodes))
+        self.leaf_rows = np.empty((trees, number_of_samples), dtype=np.intp)
+        self.leaf_offsets = np.empty((trees, nodes + 2), dtype=np.intp)
+        for tree in range(trees):
+            self._build_tree(tree, generator)
+        self.spliced = 0
+
+    def get_arrays(self):
+        """Return the arrays of the trees to store (see from_arrays)."""
+        return {'directions': self.directions, 'thresholds': self.thresholds,
+                'leaf_rows': self.leaf_rows, 'leaf_offsets': self.leaf_offsets,
+                'spliced': np.array(self.spliced)}
+
+    @staticmethod
+    def from_arrays(samples, arrays):
+        """Make the forest of the samples of the arrays of get_arrays.
+
+        Nothing is computed, so the arrays may be memory-mapped.
+        """
+        forest = ProjectionForest.__new__(ProjectionForest)
+        forest.samples = samples
+        for name, array in arrays.items():
+            setattr(forest, name, array)
+        forest.depth = int(np.log2(forest.thresholds.shape[1] + 1))
+        # The stores of the older versions have no count of the splices.
+        forest.spliced = int(arrays.get('spliced', 0))
+        return forest
+
+    def splice(self, samples, start, end):
+        """Replace the samples of rows start to end (exclusive).
+
+        Their rows are removed from the leaves and the new samples are put
+        into the leaves they fall into, the splits stay. So it takes the
+        time of copying the rows of the leaves and of the queries of the
+        new samples. The arrays are replaced rather than changed, as they
+        may be memory-mapped.
+
+        Args:
+            samples (numpy.ndarray): All the searched vectors after the
+                splice. Its rows from start on, as many as it has more than
+                the old samples without the removed ones, are the new ones.
+            start (int): The first removed row of the old samples.
+            end (int): The row after the last removed one.
+        """
+        samples = np.asarray(samples)
+        count = len(samples) - len(self.samples) + end - start
+        new_rows = np.arange(start, start + count)
+        new_leaves = self.get_leaves(samples[new_rows])
+        trees, number_of_offsets = self.leaf_offsets.shape
+        leaf_rows = np.empty((trees, len(samples)), dtype=np.intp)
+        leaf_offsets = np.zeros((trees, number_of_offsets), dtype=np.intp)
+        for tree in range(trees):
+            kept = (self.leaf_rows[tree] < start) | \
+                (self.leaf_rows[tree] >= end)
+            rows = self.leaf_rows[tree][kept]
+            rows[rows >= end] += count - (end - start)
+            leaves = np.repeat(np.arange(number_of_offsets - 1),
+                               np.diff(self.leaf_offsets[tree]))[kept]
+            leaves = np.concatenate([leaves, new_leaves[:, tree]])
+            order = np.argsort(leaves, kind='mergesort')
+            leaf_rows[tree] = np.concatenate([rows, new_rows])[order]
+            np.cumsum(np.bincount(leaves, minlength=number_of_offsets - 1),
+                      out=leaf_offsets[tree, 1:])
+        self.leaf_rows, self.leaf_offsets = leaf_rows, leaf_offsets
+        self.samples = samples
+        self.spliced += end - start + count
+
+    def _build_tree(self, tree, generator):
+        """Split the samples level by level into the leaves of the tree."""
+        # The rows of every node of the current level, in order.
+        groups = [np.arange(len(self.samples))]
+        for level in range(self.depth):
+            first_node = 2 ** level - 1
+            children = []
+            for index, rows in enumerate(groups):
+                node = first_node + index
+                direction = self._get_direction(rows, generator)
+                projections = self.samples[rows].dot(direction)
+                half = len(rows) // 2
+                order = np.argpartition(projections, half)
+                # The threshold lies between the halves, so the samples fall
+                # into their own leaves despite the rounding.
+                threshold = -np.inf
+                if half:
+                    threshold = (projections[order[:half]].max() +
+                                 projections[order[half]]) / 2
+                self.directions[tree, node] = direction
+                self.thresholds[tree, node] = threshold
+                children += [rows[order[:half]], rows[order[half:]]]
+            groups = children
+        self.leaf_offsets[tree, 0] = 0
+        np.cumsum([len(rows) for rows in groups],
+                  out=self.leaf_offsets[tree, 1:len(groups) + 1])
+        self.leaf_rows[tree] = np.concatenate(groups)
+
+    def _get_direction(self, rows, generator):
+        """Return the line through two random samples of the node.
+
+        A random direction is used if the samples are the same.
+        """
+        if len(rows) >= 2:
+            first, second = generator.choice(rows, 2, replace=False)
+            direction = self.samples[first] - self.samples[second]
+            if direction.any():
+                return direction
+        return generator.normal(size=self.samples.shape[1])
+
+    def get_leaves(self, queries):
+        """Return the leaf every query falls into in every tree.
+
+        Returns:
+            Matrix of the indices of the leaves, of shape (queries, trees).
+        """
+        queries = np.asarray(queries)
+        trees = len(self.directions)
+        nodes = np.zeros((len(queries), trees), dtype=np.intp)
+        tree_indices = np.arange(trees)
+        for _ in range(self.depth):
+            projections = np.einsum('qtf,qf->qt',
+                                    self.directions[tree_indices, nodes],
+                                    queries)
+            above = projections >= self.thresholds[tree_indices, nodes]
+            nodes = 2 * nodes + 1 + above
+        return nodes - (2 ** self.depth - 1)
+
+    def kneighbors(self, queries, count):
+        """Find the approximately nearest samples of the queries.
+
+        The samples in the leaves of a query are compared with it exactly.
+        If there are fewer than count of them, all the samples are.
+
+        Args:
+            queries (numpy.ndarray): The query vectors, one per row.
+            count (int): The number of the nearest samples. At most the
+                number of the samples.
+
+        Returns:
+            Tuple of the matrices of the distances and of the rows of the
+            nearest samples found, nearest first, one row per query (like
+            NearestNeighbors.kneighbors of sklearn).
+        """
+        queries = np.asarray(queries)
+        leaves = self.get_leaves(queries)
+        distances = np.empty((len(queries), count))
+        rows = np.empty((len(queries), count), dtype=np.intp)
+        for index, query in enumerate(queries):
+            candidates = np.unique(np.concatenate(
+                [self.leaf_rows[tree, self.leaf_offsets[tree, leaf]:
+                                self.leaf_offsets[tree, leaf + 1]]
+                 for tree, leaf in enumerate(leaves[index])]))
+            if len(candidates) < count:
+                candidates = np.arange(len(self.samples))
+            differences = self.samples[candidates] - query
+            candidate_distances = np.sqrt(
+                np.einsum('ij,ij->i', differences, differences))
+            nearest = np.argsort(candidate_distances, kind='mergesort')[:count]
+            distances[index] = candidate_distances[nearest]
+            rows[index] = candidates[nearest]
+        return distances, rows
@@ -0,0 +1,748 @@
+# -*- coding: utf-8 -*-
+"""The SymbolIndex class."""
+
+import bisect
+from math import log
+import multiprocessing
+import signal
+import threading
+import time
+
+import numpy as np
+
+from classifier import balltree
+from classifier import featureextractor
+from classifier import projectionforest
+
+# The number of neighbours voting for the symbol.
+NEIGHBORS = 5
+# The number of the nearest elements of the winning symbol whose mean
+# distance is compared with the tolerance of the symbol.
+VERIFICATION_NEIGHBORS = 2
+# The number of candidates surviving each coarse level of the cascade.
+CASCADE_SURVIVORS = [80, 20]
+# The searched matrices of at most so many rows are scanned whole. The
+# bigger ones get a ball tree (see tools/indexbenchmark.py).
+BRUTE_FORCE_MAX_SAMPLES = 700
+# The ball tree or the forest is built again when a symbol is inserted or
+# removed only once the rows spliced into it since it was built are more
+# than this fraction of the searched rows (see BallTree.splice).
+SPLICE_REBUILD_FRACTION = 0.25
+
+# How far the statistics of a stroke (see get_statistics_batch of the
+# featureextractor) may be outside of the statistics of the training set of
+# a symbol, which is still considered. It is so many standard deviations of
+# the statistics of the training set, like the tolerance follows the
+# distances within it.
+ENVELOPE_DEVIATIONS = 2
+# The least margins of the envelopes. The number of points, the arc length
+# relative to the border and the aspect ratio may always differ by a factor
+# of 2, the number of the raises of the finger by 1.
+ENVELOPE_MIN_MARGINS = np.array([log(2), 1, log(2), log(2)])
+# The statistics checked against the envelopes. The number of points (the
+# first one) depends on the speed of drawing and on the sampling rate of the
+# touchpad rather than on the shape, so it never rules a symbol out. The
+# envelopes keep it anyway, so the stores of either version can be read.
+ENVELOPE_STATISTICS = [1, 2, 3]
+
+# The number of the queries the batched brute force compares with the
+# samples at once.
+BRUTE_FORCE_CHUNK = 256
+
+BACKEND_BRUTE_FORCE = 'brute'
+BACKEND_BALL_TREE = 'ball_tree'
+# The approximate search for the very large libraries, never chosen by
+# itself.
+BACKEND_FOREST = 'forest'
+
+
+class SymbolIndex:
+    """Index of the feature vectors of all the training elements.
+
+    The feature vectors of all the symbols are kept in one matrix sorted by
+    the symbol, so the training set of every symbol is a view of a slice of
+    it. One query gives both the vote of the nearest neighbours and the
+    distances to the nearest elements of the winning symbol.
+
+    If the matrices of the coarse levels of the feature pyramid are given,
+    the queries go from the coarse to the fine features: the candidates are
+    the nearest elements at the coarsest level and each finer level keeps
+    only the nearest CASCADE_SURVIVORS of them.
+
+    The nearest elements can be searched in worker processes instead (see
+    start_shards). Each one holds the index of a group of the symbols and
+    the voters are merged from the nearest elements of every group.
+
+    Attributes:
+        symbols (list of str): The names of the symbols, sorted.
+        features (numpy.ndarray): The full-resolution feature vectors of all
+            the training elements, one per row, sorted by the symbol.
+        labels (numpy.ndarray): The index of the symbol of every row.
+        offsets (numpy.ndarray): The rows of the i-th symbol are the rows
+            offsets[i] to offsets[i + 1] (exclusive).
+        levels (list of int): The levels of the feature pyramid used by the
+            queries, the coarsest first. The last one is the full one.
+        coarse_features (dict): Maps the coarse levels to the matrices of
+            features sorted like features. Empty without the cascade.
+        backend (str): BACKEND_BRUTE_FORCE, BACKEND_BALL_TREE or
+            BACKEND_FOREST, the way the nearest elements of the coarsest
+            level are searched.
+        requested_backend (str): The backend given to the constructor,
+            None if it is chosen by the number of the training elements.
+        tree (BallTree or ProjectionForest): The ball tree or the forest
+            of the coarsest level, None with the brute force.
+        query_count (int): The number of queries so far.
+        query_time (float): The total time of the queries in seconds.
+        envelopes (numpy.ndarray): The lowest and the highest statistics
+            every symbol accepts, of shape (symbols, 2, statistics), or None
+            if no statistics were given.
+        filter_count (int): The number of the strokes checked against the
+            envelopes so far.
+        rejection_count (int): The number of the strokes which fitted in
+            no envelope, so they were not queried at all.
+        shards (list): The connections to the worker processes searching
+            the groups of the symbols with the processes and the first and
+            the last (exclusive) index of the symbols of every group. Empty
+            without the worker processes. They are not pickled.
+    """
+
+    def __init__(self, feature_matrices, coarse_matrices=None,
+                 backend=None, statistics=None):
+        """Constructor.
+
+        Args:
+            feature_matrices (dict): Maps the symbols to the matrices of
+                the full-resolution feature vectors of their training sets.
+            coarse_matrices (dict): Maps the coarse levels of the feature
+                pyramid to the dictionaries like feature_matrices. No
+                cascade is built if it is None.
+            backend (str): The backend to use. It is chosen by the number
+                of the training elements if it is None: the brute force up
+                to BRUTE_FORCE_MAX_SAMPLES of them, the ball tree above.
+                BACKEND_FOREST finds the nearest elements only
+                approximately, but the time of its queries hardly grows
+                with the number of the training elements.
+            statistics (dict): Maps the symbols to the matrices of the
+                statistics of their training sets, used to build the
+                envelopes. There are no envelopes if it is None.
+        """
+        self.symbols = sorted(feature_matrices)
+        sizes = [len(feature_matrices[symbol]) for symbol in self.symbols]
+        self.features = np.concatenate(
+            [feature_matrices[symbol] for symbol in self.symbols])
+        self.labels = np.repeat(np.arange(len(self.symbols)), sizes)
+        self.offsets = np.zeros(len(self.symbols) + 1, dtype=np.intp)
+        np.cumsum(sizes, out=self.offsets[1:])
+
+        self.coarse_features = {}
+        if coarse_matrices:
+            for level, matrices in coarse_matrices.items():
+                self.coarse_features[level] = np.concatenate(
+                    [matrices[symbol] for symbol in self.symbols])
+        self.levels = sorted(self.coarse_features) + \
+            [featureextractor.NUMBER_OF_POINTS]
+
+        self.requested_backend = backend
+        self._fit_backend()
+
+        self.envelopes = None
+        if statistics is not None:
+            self.envelopes = np.array([_get_envelope(statistics[symbol])
+                                       for symbol in self.symbols])
+        self._reset_counters()
+
+    def _reset_counters(self):
+        """Zero the counters of the queries, without worker processes."""
+        self.query_count = 0
+        self.query_time = 0.0
+        self.filter_count = 0
+        self.rejection_count = 0
+        self.shards = []
+        self.shard_lock = threading.Lock()
+
+    def get_store_data(self):
+        """Return the index as the data of the model store.
+
+        The ball tree and the forest are stored as well, so
+        from_store_data computes nothing.
+
+        Returns:
+            Tuple of the dictionary which can be encoded as JSON and of the
+            dictionary of the arrays, whose names start with 'index_' (see
+            modelstore.save).
+        """
+        manifest = {'symbols': self.symbols,
+                    'coarse_levels': self.levels[:-1],
+                    'requested_backend': self.requested_backend,
+                    'neighbors': NEIGHBORS,
+                    'verification_neighbors': VERIFICATION_NEIGHBORS,
+                    'extractor_version': featureextractor.EXTRACTOR_VERSION}
+        arrays = {'index_features': self.features,
+                  'index_labels': self.labels}
+        for level, matrix in self.coarse_features.items():
+            arrays['index_coarse_%d' % level] = matrix
+        if self.envelopes is not None:
+            arrays['index_envelopes'] = self.envelopes
+        if self.tree is not None:
+            for name, array in self.tree.get_arrays().items():
+                arrays['index_%s_%s' % (self.backend, name)] = array
+        return manifest, arrays
+
+    @staticmethod
+    def from_store_data(manifest, arrays):
+        """Make the index of the data returned by get_store_data.
+
+        The arrays are used as they are, so they may be memory-mapped (see
+        modelstore.load). The ball tree is built if it is not stored (by the
+        older versions). The envelopes are left out if the statistics were
+        computed by another version of the featureextractor.
+
+        Raises:
+            ValueError: If the index was built with other numbers of the
+                neighbours than NEIGHBORS and VERIFICATION_NEIGHBORS.
+        """
+        if manifest.get('neighbors', NEIGHBORS) != NEIGHBORS or \
+                manifest.get('verification_neighbors',
+                             VERIFICATION_NEIGHBORS) != \
+                VERIFICATION_NEIGHBORS:
+            raise ValueError("the index was built with other numbers of "
+                             "neighbours; learn the symbols again")
+        index = SymbolIndex.__new__(SymbolIndex)
+        index.symbols = list(manifest['symbols'])
+        index.features = arrays['index_features']
+        index.labels = arrays['index_labels']
+        index.offsets = np.zeros(len(index.symbols) + 1, dtype=np.intp)
+        np.cumsum(np.bincount(index.labels, minlength=len(index.symbols)),
+                  out=index.offsets[1:])
+        index.coarse_features = {
+            level: arrays['index_coarse_%d' % level]
+            for level in manifest['coarse_levels']}
+        index.levels = sorted(index.coarse_features) + \
+            [featureextractor.NUMBER_OF_POINTS]
+        index.requested_backend = manifest['requested_backend']
+        index._fit_backend(arrays)
+        index.envelopes = None
+        if manifest.get('extractor_version') == \
+                featureextractor.EXTRACTOR_VERSION:
+            index.envelopes = arrays.get('index_envelopes')
+        index._reset_counters()
+        return index
+
+    def _fit_backend(self, stored_arrays=None):
+        """Choose the backend and build its structure of the features.
+
+        Args:
+            stored_arrays (dict): The arrays of the model store, which hold
+                the structure if it does not have to be built (see
+                from_store_data).
+        """
+        backend = self._choose_backend()
+        self.backend = backend
+        self.tree = None
+        prefix = 'index_%s_' % backend
+        tree_arrays = {name[len(prefix):]: array
+                       for name, array in (stored_arrays or {}).items()
+                       if name.startswith(prefix)}
+        if backend == BACKEND_BALL_TREE and tree_arrays:
+            self.tree = balltree.BallTree.from_arrays(self.searched,
+                                                      tree_arrays)
+        elif backend == BACKEND_BALL_TREE:
+            self.tree = balltree.BallTree(self.searched)
+        elif backend == BACKEND_FOREST and tree_arrays:
+            self.tree = projectionforest.ProjectionForest.from_arrays(
+                self.searched, tree_arrays)
+        elif backend == BACKEND_FOREST:
+            self.tree = projectionforest.ProjectionForest(self.searched)
+
+    def _choose_backend(self):
+        """Set the searched matrix and return the backend of its size."""
+        self.searched = self.features
+        if self.coarse_features:
+            self.searched = self.coarse_features[self.levels[0]]
+        if self.requested_backend is not None:
+            return self.requested_backend
+        if len(self) > BRUTE_FORCE_MAX_SAMPLES:
+            return BACKEND_BALL_TREE
+        return BACKEND_BRUTE_FORCE
+
+    def insert_symbol(self, symbol, feature_matrix, coarse_matrices=None,
+                      statistics=None):
+        """Add the training elements of a symbol, replacing its old ones.
+
+        The rows of the symbol are spliced into the matrices, nothing of the
+        other symbols is computed again. The rows are spliced into the ball
+        tree or the forest as well (see BallTree.splice), which is built
+        again only past SPLICE_REBUILD_FRACTION or if the backend chosen by
+        the size changes. The brute force needs nothing. So it takes the
+        time of copying the matrices once, which is linear in the number of
+        the training elements but far below building the tree (see
+        tools/indexbenchmark.py). The worker processes are started again if
+        there are any, building the indexes of their groups.
+
+        Args:
+            symbol (str): The name of the symbol.
+            feature_matrix (numpy.ndarray): The full-resolution feature
+                vectors of its training set.
+            coarse_matrices (dict): Maps the coarse levels of the index to
+                the feature vectors of the training set. Needed by the
+                cascade only.
+            statistics (numpy.ndarray): The statistics of the training set.
+                Needed if the index has the envelopes.
+        """
+        label = bisect.bisect_left(self.symbols, symbol)
+        replaced = label < len(self.symbols) and \
+            self.symbols[label] == symbol
+        envelope = None
+        if self.envelopes is not None:
+            envelope = _get_envelope(statistics)[np.newaxis]
+        self._splice(label, label + replaced, [symbol], [feature_matrix],
+                     {level: [coarse_matrices[level]]
+                      for level in self.coarse_features}, envelope)
+
+    def remove_symbol(self, symbol):
+        """Remove the training elements of a symbol if it is indexed.
+
+        See insert_symbol. At least one symbol has to be left.
+        """
+        if symbol not in self.symbols:
+            return
+        label = self.symbols.index(symbol)
+        envelopes = None
+        if self.envelopes is not None:
+            envelopes = self.envelopes[:0]
+        self._splice(label, label + 1, [], [],
+                     {level: [] for level in self.coarse_features},
+                     envelopes)
+
+    def _splice(self, first, last, symbols, feature_matrices,
+                coarse_matrices, envelopes):
+        """Replace the symbols of indices first to last with the given."""
+        start, end = self.offsets[first], self.offsets[last]
+        spliced = end - start + sum(len(matrix)
+                                    for matrix in feature_matrices)
+        self.symbols[first:last] = symbols
+        self.features = np.concatenate(
+            [self.features[:start]] + feature_matrices +
+            [self.features[end:]]).astype(self.features.dtype, copy=False)
+        for level, matrices in coarse_matrices.items():
+            matrix = self.coarse_features[level]
+            self.coarse_features[level] = np.concatenate(
+                [matrix[:start]] + matrices + [matrix[end:]])\
+                .astype(matrix.dtype, copy=False)
+        sizes = np.diff(self.offsets)
+        sizes = np.concatenate([sizes[:first],
+                                [len(matrix) for matrix in feature_matrices],
+                                sizes[last:]]).astype(np.intp)
+        self.labels = np.repeat(np.arange(len(self.symbols)), sizes)
+        self.offsets = np.zeros(len(self.symbols) + 1, dtype=np.intp)
+        np.cumsum(sizes, out=self.offsets[1:])
+        if envelopes is not None:
+            self.envelopes = np.concatenate([self.envelopes[:first],
+                                             envelopes,
+                                             self.envelopes[last:]])
+        tree = self.tree
+        if tree is not None and self._choose_backend() == self.backend and \
+                tree.spliced + spliced <= SPLICE_REBUILD_FRACTION * len(self):
+            tree.splice(self.searched, start, end)
+        else:
+            self._fit_backend()
+        if self.shards:
+            self.start_shards(len(self.shards))
+
+    def __getstate__(self):
+        """Leave the worker processes out of the pickle."""
+        state = self.__dict__.copy()
+        state['shards'] = []
+        del state['shard_lock']
+        return state
+
+    def __setstate__(self, state):
+        """Restore the pickled index without the worker processes."""
+        # The indexes pickled by the older versions chose their backend by
+        # their size.
+        self.requested_backend = None
+        self.__dict__.update(state)
+        self.shards = []
+        self.shard_lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of training elements."""
+        return len(self.labels)
+
+    def get_symbol_features(self, symbol):
+        """Return the view of the feature vectors of the symbol."""
+        label = self.symbols.index(symbol)
+        return self.features[self.offsets[label]:self.offsets[label + 1]]
+
+    def get_mean_latency(self):
+        """Return the mean time of a query in seconds, None before any."""
+        if self.query_count == 0:
+            return None
+        return self.query_time / self.query_count
+
+    def start_shards(self, count):
+        """Split the symbols into groups searched by worker processes.
+
+        The groups have about the same number of training elements. Each
+        worker process builds the index of its group with the same backend
+        and keeps it until stop_shards. The queries then send the feature
+        vectors to the workers holding any candidate symbol, so their
+        searches run in parallel. The voters are the nearest of the
+        elements found by them, so without the cascade they are the same as
+        in one process.
+
+        Args:
+            count (int): The number of worker processes. There are fewer
+                if there are fewer symbols.
+        """
+        self.stop_shards()
+        # The groups end at the symbols nearest to the even split.
+        targets = np.arange(1, count) * len(self) / count
+        bounds = np.abs(self.offsets[:, np.newaxis] - targets).argmin(axis=0)
+        bounds = np.unique(np.concatenate(
+            [[0], np.clip(bounds, 1, len(self.symbols) - 1),
+             [len(self.symbols)]]))
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            shard = self._get_shard(first, last)
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_serve_shard, args=(shard, worker_connection),
+                daemon=True)
+            process.start()
+            worker_connection.close()
+            self.shards.append((connection, process, int(first),
+                                int(last)))
+
+    def stop_shards(self):
+        """Stop the worker processes, so the queries are searched here."""
+        with self.shard_lock:
+            for connection, process, _, _ in self.shards:
+                connection.send(None)
+                process.join()
+                connection.close()
+            self.shards = []
+
+    def _get_shard(self, first, last):
+        """Build the index of the symbols of indices first to last."""
+        symbols = self.symbols[first:last]
+        feature_matrices = {symbol: self.get_symbol_features(symbol)
+                            for symbol in symbols}
+        coarse_matrices = None
+        if self.coarse_features:
+            coarse_matrices = {
+                level: {symbol: matrix[self.offsets[label]:
+                                       self.offsets[label + 1]]
+                        for label, symbol in enumerate(symbols, first)}
+                for level, matrix in self.coarse_features.items()}
+        return SymbolIndex(feature_matrices, coarse_matrices, self.backend)
+
+    def filter_candidates(self, statistics):
+        """Find the symbols whose envelopes hold the statistics of a stroke.
+
+        Args:
+            statistics (numpy.ndarray): The statistics of the drawn symbol.
+
+        Returns:
+            Array of the indices of the symbols, or None if every symbol is
+            a candidate (or there are no envelopes).
+        """
+        inside = self.get_envelope_mask([statistics])
+        if inside is None or inside.all():
+            return None
+        return np.flatnonzero(inside[0])
+
+    def get_envelope_mask(self, statistics):
+        """Check the statistics of many strokes against all the envelopes.
+
+        Args:
+            statistics (numpy.ndarray): The statistics of the drawn
+                symbols, one per row.
+
+        Returns:
+            Matrix telling if the i-th stroke fits in the envelope of the
+            j-th symbol, or None if there are no envelopes.
+        """
+        if self.envelopes is None:
+            return None
+        transformed = _transform_statistics(statistics)[
+            :, np.newaxis, ENVELOPE_STATISTICS]
+        lowest = self.envelopes[:, 0][:, ENVELOPE_STATISTICS]
+        highest = self.envelopes[:, 1][:, ENVELOPE_STATISTICS]
+        inside = np.all((lowest <= transformed) & (transformed <= highest),
+                        axis=2)
+        self.filter_count += len(inside)
+        self.rejection_count += np.count_nonzero(~inside.any(axis=1))
+        return inside
+
+    def query(self, feature_vector, coarse_vectors=None, candidates=None):
+        """Find the symbol of the feature vector.
+
+        Args:
+            feature_vector (numpy.ndarray): The full-resolution features of
+                the drawn symbol.
+            coarse_vectors (dict): Maps the coarse levels to the features
+                of the drawn symbol. Needed by the cascade only.
+            candidates (numpy.ndarray): The indices of the symbols to search
+                among (see filter_candidates), all the symbols if None. It
+                must not be empty.
+
+        Returns:
+            Tuple of the name of the symbol which got the most votes (ties
+            go to the first symbol in order) and the array of the distances
+            to the VERIFICATION_NEIGHBORS nearest elements of the symbol.
+        """
+        if coarse_vectors is not None:
+            coarse_vectors = {level: np.asarray(vector)[np.newaxis]
+                              for level, vector in coarse_vectors.items()}
+        symbols, distances = self.query_many(
+            np.asarray(feature_vector)[np.newaxis], coarse_vectors,
+            candidates)
+        return symbols[0], distances[0]
+
+    def query_many(self, feature_vectors, coarse_vectors=None,
+                   candidates=None):
+        """Find the symbols of many feature vectors at once.
+
+        The nearest elements of all the vectors are searched together.
+
+        Args:
+            feature_vectors (numpy.ndarray): The full-resolution features
+                of the drawn symbols, one per row.
+            coarse_vectors (dict): Maps the coarse levels to the matrices of
+                the features of the drawn symbols. Needed by the cascade
+                only.
+            candidates (numpy.ndarray): The indices of the symbols to search
+                among for all the vectors (see query).
+
+        Returns:
+            Tuple of the list of the names of the symbols and of the list of
+            the arrays of the distances (see query).
+        """
+        start = time.perf_counter()
+        feature_vectors = np.asarray(feature_vectors)
+        rows, distances = self._get_nearest_rows(feature_vectors,
+                                                 coarse_vectors, candidates)
+        symbols = []
+        own_distances = []
+        for feature_vector, vector_rows, vector_distances in \
+                zip(feature_vectors, rows, distances):
+            label = np.bincount(self.labels[vector_rows]).argmax()
+            needed = min(VERIFICATION_NEIGHBORS,
+                         self.offsets[label + 1] - self.offsets[label])
+            symbol_distances = \
+                vector_distances[self.labels[vector_rows] == label][:needed]
+            if self.coarse_features or len(symbol_distances) < needed:
+                # The nearest elements of the symbol might be missing among
+                # the voters, so they are looked up in the view of the
+                # symbol.
+                symbol_distances = self._get_symbol_distances(
+                    label, feature_vector, needed)
+            symbols.append(self.symbols[label])
+            own_distances.append(symbol_distances)
+        self.query_time += time.perf_counter() - start
+        self.query_count += len(feature_vectors)
+        return symbols, own_distances
+
+    def _get_nearest_rows(self, feature_vectors, coarse_vectors, candidates):
+        """Return the rows of the voters and their distances, nearest first.
+
+        There is one row of each of the returned matrices per vector.
+        """
+        if self.shards:
+            return self._gather_nearest_rows(feature_vectors, coarse_vectors,
+                                             candidates)
+        candidate_rows = None
+        if candidates is not None:
+            candidate_rows = np.concatenate(
+                [np.arange(self.offsets[label], self.offsets[label + 1])
+                 for label in candidates])
+        if not self.coarse_features:
+            return self._search(feature_vectors, NEIGHBORS, candidate_rows)
+
+        coarse_levels = self.levels[:-1]
+        survivors = CASCADE_SURVIVORS[:len(coarse_levels)]
+        survivors += survivors[-1:] * (len(coarse_levels) - len(survivors))
+        coarsest_rows, _ = self._search(coarse_vectors[coarse_levels[0]],
+                                        survivors[0], candidate_rows)
+        count = min(NEIGHBORS, coarsest_rows.shape[1])
+        nearest_rows = np.empty((len(feature_vectors), count), dtype=np.intp)
+        nearest_distances = np.empty((len(feature_vectors), count))
+        for index, rows in enumerate(coarsest_rows):
+            for level, survivor_count in zip(coarse_levels[1:],
+                                             survivors[1:]):
+                distances = np.linalg.norm(
+                    self.coarse_features[level][rows] -
+                    coarse_vectors[level][index], axis=1)
+                rows = rows[np.argsort(distances,
+                                       kind='mergesort')[:survivor_count]]
+            distances = np.linalg.norm(
+                self.features[rows] - feature_vectors[index], axis=1)
+            order = np.argsort(distances, kind='mergesort')[:count]
+            nearest_rows[index] = rows[order]
+            nearest_distances[index] = distances[order]
+        return nearest_rows, nearest_distances
+
+    def _gather_nearest_rows(self, feature_vectors, coarse_vectors,
+                             candidates):
+        """Search the nearest rows in the worker processes and merge them.
+
+        See _get_nearest_rows.
+        """
+        with self.shard_lock:
+            asked = []
+            for connection, _, first, last in self.shards:
+                shard_candidates = None
+                if candidates is not None:
+                    shard_candidates = np.asarray(candidates)
+                    shard_candidates = shard_candidates[
+                        (first <= shard_candidates) &
+                        (shard_candidates < last)] - first
+                    if not len(shard_candidates):
+                        continue
+                connection.send((feature_vectors, coarse_vectors,
+                                 shard_candidates))
+                asked.append((connection, self.offsets[first]))
+            replies = [(connection.recv(), offset)
+                       for connection, offset in asked]
+        for reply, _ in replies:
+            if isinstance(reply, Exception):
+                raise reply
+        rows = np.hstack([shard_rows + offset
+                          for (shard_rows, _), offset in replies])
+        distances = np.hstack([shard_distances
+                               for (_, shard_distances), _ in replies])
+        order = np.argsort(distances, axis=1,
+                           kind='mergesort')[:, :NEIGHBORS]
+        by_query = np.arange(len(order))[:, np.newaxis]
+        return rows[by_query, order], distances[by_query, order]
+
+    def _search(self, vectors, count, candidate_rows=None):
+        """Return the count nearest rows of the searched matrix.
+
+        The rows are searched by the brute force if only the candidate rows
+        are searched, as there are usually few of them.
+
+        Returns:
+            Tuple of the matrices of the rows and of their distances,
+            nearest first, one row per vector.
+        """
+        if candidate_rows is not None:
+            distances, rows = brute_force_kneighbors(
+                self.searched[candidate_rows], vectors,
+                min(count, len(candidate_rows)))
+            return candidate_rows[rows], distances
+        count = min(count, len(self))
+        if self.tree is not None:
+            distances, rows = self.tree.kneighbors(vectors, count)
+            return rows, distances
+        distances, rows = brute_force_kneighbors(self.searched, vectors,
+                                                 count)
+        return rows, distances
+
+    def _get_symbol_distances(self, label, feature_vector, count):
+        """Return the distances to the count nearest symbol elements."""
+        view = self.features[self.offsets[label]:self.offsets[label + 1]]
+        distances = np.linalg.norm(view - feature_vector, axis=1)
+        return np.sort(distances)[:count]
+
+
+def _serve_shard(shard, connection):
+    """Search the nearest rows of a group of the symbols until stopped.
+
+    It runs in a worker process (see SymbolIndex.start_shards). Every
+    request holds the arguments of _get_nearest_rows of the shard, None
+    stops it. The errors are sent back instead of the rows.
+    """
+    # Ctrl+C is handled by the main process, which stops the workers.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        try:
+            reply = shard._get_nearest_rows(*request)
+        except Exception as error:
+            reply = error
+        connection.send(reply)
+    connection.close()
+
+
+def _get_envelope(statistics):
+    """Return the lowest and the highest statistics a symbol accepts.
+
+    The margins follow the spread of the statistics of the training set
+    (see ENVELOPE_DEVIATIONS).
+
+    Args:
+        statistics (numpy.ndarray): The statistics of the training set of
+            the symbol, one row per training element.
+    """
+    transformed = _transform_statistics(statistics)
+    margins = np.maximum(ENVELOPE_DEVIATIONS * transformed.std(axis=0),
+                         ENVELOPE_MIN_MARGINS)
+    return np.array([transformed.min(axis=0) - margins,
+                     transformed.max(axis=0) + margins])
+
+
+def _transform_statistics(statistics):
+    """Take the logarithms of the statistics which vary by a factor.
+
+    The number of the raises of the finger is left as it is.
+    """
+    transformed = np.array(statistics, dtype=float)
+    transformed[..., [0, 2]] = np.log1p(transformed[..., [0, 2]])
+    transformed[..., 3] = np.log(transformed[..., 3])
+    return transformed
+
+
+def brute_force_kneighbors(samples, queries, count):
+    """Find the nearest samples of the queries by computing all distances.
+
+    It gives the same results as NearestNeighbors.kneighbors of sklearn
+    without its overhead, which dominates for small matrices.
+
+    Args:
+        samples (numpy.ndarray): The searched vectors, one per row.
+        queries (numpy.ndarray): The query vectors, one per row.
+        count (int): The number of the nearest samples.
+
+    Returns:
+        Tuple of the matrices of the distances and of the rows of the
+        nearest samples, nearest first, one row per query.
+    """
+    samples = np.asarray(samples)
+    queries = np.asarray(queries)
+    if len(queries) == 1:
+        # The differences are computed directly rather than expanding the
+        # squares, which loses the precision of the small distances.
+        differences = samples - queries[0]
+        rows = _select_smallest(
+            np.einsum('ij,ij->i', differences, differences)[np.newaxis],
+            count)
+    else:
+        # Many queries are compared with the samples by matrix products.
+        # The squares are expanded in double precision, which is enough to
+        # choose the nearest samples. Their distances are computed directly.
+        samples_64 = samples.astype(np.float64)
+        sample_norms = np.einsum('ij,ij->i', samples_64, samples_64)
+        rows = np.empty((len(queries), min(count, len(samples))),
+                        dtype=np.intp)
+        for start in range(0, len(queries), BRUTE_FORCE_CHUNK):
+            chunk = queries[start:start + BRUTE_FORCE_CHUNK]\
+                .astype(np.float64)
+            squares = sample_norms - 2 * chunk.dot(samples_64.T) + \
+                np.einsum('ij,ij->i', chunk, chunk)[:, np.newaxis]
+            rows[start:start + BRUTE_FORCE_CHUNK] = \
+                _select_smallest(squares, count)
+    differences = samples[rows] - queries[:, np.newaxis]
+    distances = np.sqrt(np.einsum('ijk,ijk->ij', differences, differences))
+    order = np.argsort(distances, axis=1, kind='mergesort')
+    by_query = np.arange(len(order))[:, np.newaxis]
+    return distances[by_query, order], rows[by_query, order]
+
+
+def _select_smallest(values, count):
+    """Return the columns of the count smallest values of every row."""
+    if count >= values.shape[1]:
+        return np.tile(np.arange(values.shape[1]), (len(values), 1))
+    return np.argpartition(values, count - 1, axis=1)[:, :count]
@@ -8,7 +8,13 @@ touchpad event.
 import os
 import pickle
 
+from classifier import featureextractor
+from stroke import stroke as stroke_module
+
 STANDARD_MAX_BREAK_VALUE = 0.3
+# The stroke may be classified speculatively after a break of this part of
+# the max break between two signals.
+SPECULATION_BREAK_FRACTION = 0.5
 
 MAX_NUMBER_OF_SIGNALS_IN_GROUP = 3000
 MAX_DURATION_OF_GROUP = 4
@@ -21,18 +27,24 @@ class SignalCollection:
     """Collection of signals to interpret.
 
     Attributes:
-        signal_list (list): A list of signals chronologically. Old signals
-            are regularly removed.
+        stroke (Stroke): The signals chronologically. Old signals are
+            regularly removed.
+        accumulator (StrokeAccumulator): The statistics of the stroke made of
+            the collected signals, updated as signals come and go.
+        version (int): The number of the changes of the collection so far.
+            It tells if the stroke has changed since it was last looked at.
     """
 
     def __init__(self):
         """Constructor.
 
-        Simply initializes an empty list.
+        Simply initializes an empty stroke.
         """
-        self.signal_list = []
+        self.stroke = stroke_module.Stroke()
+        self.accumulator = featureextractor.StrokeAccumulator()
         self.max_waittime = STANDARD_MAX_BREAK_VALUE
         self.end_on_raise = False
+        self.version = 0
         self.reset()
         self.load_settings()
 
@@ -118,21 +130,31 @@ class SignalCollection:
         return self.end_on_raise
 
     def reset(self):
-        """Erase the signal_list."""
-        self.signal_list = []
+        """Erase the stroke.
+
+        A new stroke is started so that the old one, which might have been
+        handed over with as_stroke, stays untouched.
+        """
+        self.stroke = stroke_module.Stroke()
+        self.accumulator.reset()
+        self.version += 1
 
     def add_and_maintain(self, signal):
         """Remove some signals and add a new one.
 
-        Remove signals from the head of the signal_list if they are old
+        Remove signals from the head of the stroke if they are old
         or if there are too many of them.
 
         Args:
             signal (TouchpadSignal): A new signal to be added.
         """
         while self._need_to_remove_head(signal):
-            self.signal_list.pop(0)
-        self.signal_list.append(signal)
+            if self.stroke.is_proper_signal_of_point(0):
+                self.accumulator.remove_head_point()
+            self.stroke.remove_head()
+        self.stroke.append_signal(signal)
+        self.accumulator.add(signal)
+        self.version += 1
 
     def is_recent_enough(self, current_time):
         """Check if the last signal is recent enough.
@@ -142,16 +164,16 @@ class SignalCollection:
 
         Args:
             current_time (float): The current time which is compared with
-                the time of the last signal in the list.
+                the time of the last signal in the stroke.
 
         Retruns:
             True if the (current_time - tail_time) is less or equal
             MAX_BREAK_BETWEEN_TWO_SIGNALS.
-            True is returned if the signal_list
+            True is returned if the stroke
             is empty. False otherwise.
         """
         try:
-            tail_time = self.signal_list[-1].get_time()
+            tail_time = self.stroke.get_time(-1)
         except IndexError:
             result = True
         else:
@@ -159,6 +181,48 @@ class SignalCollection:
                    self.max_waittime
         return result
 
+    def is_quiet(self, current_time):
+        """Check if the stroke is likely to be finished.
+
+        It is if there has been no signal for SPECULATION_BREAK_FRACTION of
+        the max break between two signals, so the stroke may be classified
+        before is_recent_enough tells it is finished for sure.
+
+        Args:
+            current_time (float): The current time which is compared with
+                the time of the last signal in the stroke.
+
+        Returns:
+            True if the stroke is not empty and the break is long enough.
+            False otherwise.
+        """
+        try:
+            tail_time = self.stroke.get_time(-1)
+        except IndexError:
+            return False
+        return current_time - tail_time >= \
+            self.max_waittime * SPECULATION_BREAK_FRACTION
+
+    def get_time_when_quiet(self, current_time):
+        """Get the amount of time left until the stroke is quiet.
+
+        See is_quiet.
+
+        Args:
+            current_time (float): The current time which is compared with
+                the time of the last signal in the stroke.
+
+        Returns:
+            The time left, 0 if the stroke is quiet already. None is
+            returned if the stroke is empty.
+        """
+        try:
+            tail_time = self.stroke.get_time(-1)
+        except IndexError:
+            return None
+        return max(0.0, tail_time + self.max_waittime *
+                   SPECULATION_BREAK_FRACTION - current_time)
+
     def get_max_break_between_two_points(self):
         """Get max timewait."""
         return self.max_waittime
@@ -166,41 +230,78 @@ class SignalCollection:
     def get_time_when_old_enough(self, current_time):
         """Get the amount of time left for the tail to get old.
 
-        The tail is the tail of the signal_list.
+        The tail is the tail of the stroke.
 
         Args:
             current_time (float): The current time which is compared with
-                the time of the last signal in the list.
+                the time of the last signal in the stroke.
 
         Returns:
             The difference between the current time and the time of the tail.
-            None is returned if the signal_list is empty.
+            None is returned if the stroke is empty.
         """
         try:
-            tail_time = self.signal_list[-1].get_time()
+            tail_time = self.stroke.get_time(-1)
         except IndexError:
             result_time = None
         else:
             result_time = current_time - tail_time
         return result_time
 
-    def as_list(self):
-        """Return the SignalCollection as a list.
+    def as_stroke(self):
+        """Return the SignalCollection as a stroke.
+
+        Returns:
+            The stroke of the collected signals.
+        """
+        return self.stroke
+
+    def get_features(self):
+        """Return the feature vector of the collected signals.
+
+        Only the final resampling is computed here. The rest has been
+        accumulated while the signals were added.
+
+        Returns:
+            The feature vector. None is returned if there are no proper
+            points in the collection.
+        """
+        return self.accumulator.get_features()
+
+    def get_feature_pyramid(self, levels=None):
+        """Return the feature vectors of the collected signals.
+
+        Args:
+            levels (list of int): The numbers of points of the resolutions.
+                PYRAMID_LEVELS of the featureextractor by default.
+
+        Returns:
+            Dictionary mapping every level to the array of features. None is
+            returned if there are no proper points in the collection.
+        """
+        return self.accumulator.get_feature_pyramid(levels)
+
+    def get_statistics(self):
+        """Return the statistics of the collected signals.
+
+        They have been accumulated while the signals were added (see
+        get_statistics_batch of the featureextractor).
 
         Returns:
-            The signal_list as a list.
+            The array of the statistics. None is returned if there are no
+            proper points in the collection.
         """
-        return self.signal_list
+        return self.accumulator.get_statistics()
 
     def _need_to_remove_head(self, signal):
-        """Check if there is a need of the list's head removal.
+        """Check if there is a need of the stroke's head removal.
 
         Args:
             signal (TouchpadSignal): A signal. Needed to calculate if the head
                 is too old or not.
 
         Returns:
-            True if the list is too big or if the head is too old.
+            True if the stroke is too big or if the head is too old.
             False otherwise.
         """
         if self._is_empty():
@@ -213,31 +314,31 @@ class SignalCollection:
             return False
 
     def _is_empty(self):
-        """Check if the signal_list is empty.
+        """Check if the stroke is empty.
 
         Returns:
-            True if signal list is empty. False otherwise.
+            True if the stroke is empty. False otherwise.
         """
-        return self.signal_list == []
+        return len(self.stroke) == 0
 
     def _is_too_big(self):
-        """Check if the signal_list is not too big.
+        """Check if the stroke is not too big.
 
         Returns:
-            True if signal list is too big. False otheriwse.
+            True if the stroke is too big. False otheriwse.
         """
-        return len(self.signal_list) >= MAX_NUMBER_OF_SIGNALS_IN_GROUP
+        return len(self.stroke) >= MAX_NUMBER_OF_SIGNALS_IN_GROUP
 
     def _is_head_too_old(self, signal):
-        """Check if the head of the signal_list is too old.
+        """Check if the head of the stroke is too old.
 
         Args:
             signal (TouchpadSignal): A signal which is compared with the head
                 in terms of the time attribute.
 
         Returns:
-            True if the head of signal list is too old.
+            True if the head of the stroke is too old.
         """
         signal_time = signal.get_time()
-        head_time = self.signal_list[0].get_time()
+        head_time = self.stroke.get_time(0)
         return signal_time - head_time > MAX_DURATION_OF_GROUP
@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+"""A stroke: a sequence of touchpad signals stored as arrays.
+
+The values of the signals are kept in contiguous typed arrays (one array per
+attribute) instead of a list of TouchpadSignal objects. A StrokeSet keeps
+many strokes in the same arrays, one after another.
+"""
+
+import os
+
+import numpy as np
+
+# The names of the arrays of the values of the signals.
+_ARRAY_NAMES = ['x_values', 'y_values', 'pressures', 'times']
+
+
+class Stroke:
+    """A sequence of touchpad signals stored as arrays.
+
+    Signals are appended at the tail and removed from the head. Slicing
+    gives a stroke which shares the memory with the original one.
+
+    Constants:
+        INITIAL_CAPACITY (int): The number of signals a new stroke has
+            room for.
+    """
+
+    INITIAL_CAPACITY = 256
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        """Constructor.
+
+        Args:
+            capacity (int): The number of signals to make room for.
+        """
+        self._x_values = np.empty(capacity, dtype=np.int32)
+        self._y_values = np.empty(capacity, dtype=np.int32)
+        self._pressures = np.empty(capacity, dtype=np.int32)
+        self._times = np.empty(capacity, dtype=np.float64)
+        self._start = 0
+        self._stop = 0
+
+    @classmethod
+    def from_signals(cls, signal_list):
+        """Create a stroke out of a list of signals.
+
+        Args:
+            signal_list (list): Signals with the get_x, get_y, get_pressure
+                and get_time methods (e.g. TouchpadSignal).
+        """
+        stroke = cls(max(len(signal_list), 1))
+        for signal in signal_list:
+            stroke.append_signal(signal)
+        return stroke
+
+    @classmethod
+    def from_arrays(cls, x_values, y_values, pressures, times):
+        """Create a stroke out of arrays of the values of the signals."""
+        stroke = cls(0)
+        stroke._x_values = np.array(x_values, dtype=np.int32)
+        stroke._y_values = np.array(y_values, dtype=np.int32)
+        stroke._pressures = np.array(pressures, dtype=np.int32)
+        stroke._times = np.array(times, dtype=np.float64)
+        stroke._stop = len(stroke._x_values)
+        return stroke
+
+    @property
+    def x_values(self):
+        """The x values of the signals."""
+        return self._x_values[self._start:self._stop]
+
+    @property
+    def y_values(self):
+        """The y values of the signals."""
+        return self._y_values[self._start:self._stop]
+
+    @property
+    def pressures(self):
+        """The pressures of the signals."""
+        return self._pressures[self._start:self._stop]
+
+    @property
+    def times(self):
+        """The times of the signals."""
+        return self._times[self._start:self._stop]
+
+    def __len__(self):
+        """Return the number of signals."""
+        return self._stop - self._start
+
+    def __getitem__(self, key):
+        """Return the signals selected by a slice as a new stroke.
+
+        The new stroke shares the memory with this one until either of them
+        grows.
+        """
+        if not isinstance(key, slice):
+            raise TypeError('strokes can only be sliced; use the get_* '
+                            'methods to access a single signal')
+        start, stop, step = key.indices(len(self))
+        if step != 1:
+            raise ValueError('slice step of a stroke must be 1')
+        stroke = Stroke(0)
+        stop = max(start, stop)
+        begin = self._start + start
+        end = self._start + stop
+        stroke._x_values = self._x_values[begin:end]
+        stroke._y_values = self._y_values[begin:end]
+        stroke._pressures = self._pressures[begin:end]
+        stroke._times = self._times[begin:end]
+        stroke._stop = stop - start
+        return stroke
+
+    def __getstate__(self):
+        """Return the state to pickle without the unused capacity."""
+        return {'x_values': self.x_values.copy(),
+                'y_values': self.y_values.copy(),
+                'pressures': self.pressures.copy(),
+                'times': self.times.copy()}
+
+    def __setstate__(self, state):
+        """Restore the state from a pickle."""
+        self._x_values = state['x_values']
+        self._y_values = state['y_values']
+        self._pressures = state['pressures']
+        self._times = state['times']
+        self._start = 0
+        self._stop = len(self._x_values)
+
+    def append(self, x_value, y_value, pressure, time):
+        """Append a signal given by its values."""
+        if self._stop == len(self._x_values):
+            self._make_room()
+        self._x_values[self._stop] = x_value
+        self._y_values[self._stop] = y_value
+        self._pressures[self._stop] = pressure
+        self._times[self._stop] = time
+        self._stop += 1
+
+    def append_signal(self, signal):
+        """Append a signal (e.g. TouchpadSignal)."""
+        self.append(signal.get_x(), signal.get_y(), signal.get_pressure(),
+                    signal.get_time())
+
+    def remove_head(self, count=1):
+        """Remove signals from the head.
+
+        Args:
+            count (int): The number of signals to remove.
+        """
+        self._start = min(self._start + count, self._stop)
+
+    def take(self, indices):
+        """Return a new stroke made of the signals at the indices."""
+        return Stroke.from_arrays(self.x_values[indices],
+                                  self.y_values[indices],
+                                  self.pressures[indices],
+                                  self.times[indices])
+
+    def copy(self):
+        """Return a compact copy of the stroke."""
+        return Stroke.from_arrays(self.x_values, self.y_values,
+                                  self.pressures, self.times)
+
+    def get_x(self, index):
+        """Get the x value of the signal at the index."""
+        return int(self._x_values[self._position(index)])
+
+    def get_y(self, index):
+        """Get the y value of the signal at the index."""
+        return int(self._y_values[self._position(index)])
+
+    def get_pressure(self, index):
+        """Get the pressure of the signal at the index."""
+        return int(self._pressures[self._position(index)])
+
+    def get_time(self, index):
+        """Get the time of the signal at the index."""
+        return float(self._times[self._position(index)])
+
+    def is_proper_signal_of_point(self, index):
+        """Check if the signal at the index has both x >= 0 and y >= 0."""
+        position = self._position(index)
+        return bool(self._x_values[position] >= 0 and
+                    self._y_values[position] >= 0)
+
+    def is_raising_finger_signal(self, index):
+        """Check if the signal at the index has pressure equal to 0."""
+        return bool(self._pressures[self._position(index)] == 0)
+
+    def proper_points(self):
+        """Return the mask of the signals which are proper points.
+
+        See TouchpadSignal.is_proper_signal_of_point.
+        """
+        return (self.x_values >= 0) & (self.y_values >= 0)
+
+    def raising_finger(self):
+        """Return the mask of the signals of raising the finger.
+
+        See TouchpadSignal.is_raising_finger_signal.
+        """
+        return self.pressures == 0
+
+    def _position(self, index):
+        """Translate the index of a signal to the position in the arrays."""
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError('stroke index out of range')
+        return self._start + index
+
+    def _make_room(self):
+        """Move the signals to new, larger arrays.
+
+        New arrays are allocated so that the slices of this stroke stay
+        untouched.
+        """
+        capacity = max(self.INITIAL_CAPACITY, 2 * len(self))
+        for name in ['_x_values', '_y_values', '_pressures', '_times']:
+            storage = getattr(self, name)
+            moved = np.empty(capacity, dtype=storage.dtype)
+            moved[:len(self)] = storage[self._start:self._stop]
+            setattr(self, name, moved)
+        self._stop -= self._start
+        self._start = 0
+
+
+class StrokeSet:
+    """A sequence of strokes stored in shared arrays (e.g. a training set).
+
+    The signals of all the strokes are kept one after another in the same
+    typed arrays, the offset table tells where every stroke starts. The
+    strokes are given out as Strokes sharing the memory with the set.
+
+    The set is saved to an uncompressed NumPy .npz file of the arrays (see
+    save). It holds no pickles, so loading it needs neither the classes of
+    the signals nor running code from the file.
+
+    Constants:
+        INITIAL_CAPACITY (int): The number of signals a new set has room
+            for.
+    """
+
+    INITIAL_CAPACITY = 4096
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        """Constructor.
+
+        Args:
+            capacity (int): The number of signals to make room for.
+        """
+        self._x_values = np.empty(capacity, dtype=np.int32)
+        self._y_values = np.empty(capacity, dtype=np.int32)
+        self._pressures = np.empty(capacity, dtype=np.int32)
+        self._times = np.empty(capacity, dtype=np.float64)
+        # The signals of the i-th stroke are at offsets[i] to
+        # offsets[i + 1] (exclusive).
+        self._offsets = [0]
+
+    @classmethod
+    def from_strokes(cls, strokes):
+        """Create a set out of strokes or lists of signals.
+
+        Args:
+            strokes (iterable): Strokes or lists of signals with the get_x,
+                get_y, get_pressure and get_time methods (e.g. the training
+                sets of the older versions).
+        """
+        stroke_set = cls()
+        for stroke in strokes:
+            stroke_set.append(stroke)
+        return stroke_set
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Create a set out of the arrays of get_arrays.
+
+        The arrays are used as they are, so they may be memory-mapped.
+        """
+        stroke_set = cls(0)
+        for name in _ARRAY_NAMES:
+            setattr(stroke_set, '_' + name, arrays[name])
+        stroke_set._offsets = [int(offset) for offset in arrays['offsets']]
+        if len(stroke_set._x_values) != stroke_set._offsets[-1]:
+            raise ValueError('the offsets do not match the signals')
+        return stroke_set
+
+    @classmethod
+    def load(cls, path):
+        """Load the set from the file written by save.
+
+        Raises:
+            FileNotFoundError: If there is no file.
+            ValueError: If the file is not a set of strokes.
+        """
+        with np.load(path, allow_pickle=False) as arrays:
+            try:
+                return cls.from_arrays(
+                    {name: arrays[name]
+                     for name in _ARRAY_NAMES + ['offsets']})
+            except KeyError:
+                raise ValueError('%s is not a set of strokes' % path)
+
+    def save(self, path):
+        """Write the set atomically to an uncompressed .npz file."""
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'wb') as handle:
+            np.savez(handle, **self.get_arrays())
+        os.replace(temporary_path, path)
+
+    def get_arrays(self):
+        """Return the arrays of the signals and the offsets to store.
+
+        The unused capacity is left out.
+        """
+        arrays = {name: getattr(self, '_' + name)[:self._offsets[-1]]
+                  for name in _ARRAY_NAMES}
+        arrays['offsets'] = np.array(self._offsets, dtype=np.int64)
+        return arrays
+
+    def __len__(self):
+        """Return the number of strokes."""
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        """Return the stroke at the index, sharing the set's memory."""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('stroke set index out of range')
+        begin = self._offsets[index]
+        end = self._offsets[index + 1]
+        stroke = Stroke(0)
+        stroke._x_values = self._x_values[begin:end]
+        stroke._y_values = self._y_values[begin:end]
+        stroke._pressures = self._pressures[begin:end]
+        stroke._times = self._times[begin:end]
+        stroke._stop = end - begin
+        return stroke
+
+    def __iter__(self):
+        """Iterate over the strokes."""
+        for index in range(len(self)):
+            yield self[index]
+
+    def __getstate__(self):
+        """Return the state to pickle without the unused capacity."""
+        return self.get_arrays()
+
+    def __setstate__(self, state):
+        """Restore the state from a pickle."""
+        self.__dict__ = StrokeSet.from_arrays(state).__dict__
+
+    def append(self, stroke):
+        """Append a copy of the stroke.
+
+        Args:
+            stroke (Stroke or list): The stroke or a list of signals (e.g.
+                TouchpadSignal).
+        """
+        if not isinstance(stroke, Stroke):
+            stroke = Stroke.from_signals(stroke)
+        begin = self._offsets[-1]
+        end = begin + len(stroke)
+        if end > len(self._x_values):
+            self._make_room(end)
+        self._x_values[begin:end] = stroke.x_values
+        self._y_values[begin:end] = stroke.y_values
+        self._pressures[begin:end] = stroke.pressures
+        self._times[begin:end] = stroke.times
+        self._offsets.append(end)
+
+    def _make_room(self, size):
+        """Move the signals to new arrays with room for size signals.
+
+        New arrays are allocated so that the strokes given out stay
+        untouched, and the loaded arrays need not be writable.
+        """
+        capacity = max(self.INITIAL_CAPACITY, size, 2 * len(self._x_values))
+        used = self._offsets[-1]
+        for name in _ARRAY_NAMES:
+            storage = getattr(self, '_' + name)
+            moved = np.empty(capacity, dtype=storage.dtype)
+            moved[:used] = storage[:used]
+            setattr(self, '_' + name, moved)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the ball tree."""
+
+import numpy as np
+
+from classifier import balltree
+from classifier import symbolindex
+
+
+def test_leaves():
+    """Test if the leaves are small and their balls hold their samples"""
+    generator = np.random.RandomState(3)
+    samples = generator.normal(0, 100, (1000, 6)).astype(np.float32)
+    tree = balltree.BallTree(samples, leaf_size=50)
+
+    assert sorted(tree.leaf_rows) == list(range(1000))
+    assert np.diff(tree.leaf_offsets).max() <= 50
+    assert (tree.ordered == samples[tree.leaf_rows]).all()
+    # The ordered samples take no more memory than the samples.
+    assert tree.ordered.dtype == np.float32
+    assert tree.norms.dtype == np.float64
+    for leaf, (start, end) in enumerate(zip(tree.leaf_offsets[:-1],
+                                            tree.leaf_offsets[1:])):
+        distances = np.linalg.norm(
+            samples[tree.leaf_rows[start:end]] - tree.centers[leaf], axis=1)
+        assert (distances <= tree.radii[leaf] + 1e-9).all()
+
+
+def test_kneighbors():
+    """Test if the tree finds the exact nearest samples"""
+    generator = np.random.RandomState(4)
+    centers = generator.uniform(-500, 500, (10, 8))
+    samples = np.concatenate([center + generator.normal(0, 20, (200, 8))
+                              for center in centers])
+    queries = np.concatenate([centers + generator.normal(0, 20,
+                                                         centers.shape),
+                              samples[:3], [np.zeros(8)]])
+    for count in [1, 5, 300]:
+        distances, rows = balltree.BallTree(samples).kneighbors(queries,
+                                                                count)
+        expected_distances, expected_rows = \
+            symbolindex.brute_force_kneighbors(samples, queries, count)
+        assert (rows == expected_rows).all()
+        assert np.allclose(distances, expected_distances)
+
+    # The stored arrays give the same tree.
+    tree = balltree.BallTree(samples)
+    loaded = balltree.BallTree.from_arrays(samples, tree.get_arrays())
+    assert (loaded.kneighbors(queries, 5)[1] == rows[:, :5]).all()
+
+    # Single precision samples are searched exactly as well.
+    samples = samples.astype(np.float32)
+    distances, rows = balltree.BallTree(samples).kneighbors(queries, 5)
+    expected_distances, expected_rows = \
+        symbolindex.brute_force_kneighbors(samples, queries, 5)
+    assert (rows == expected_rows).all()
+    assert np.allclose(distances, expected_distances)
+
+
+def test_splice():
+    """Test if the spliced tree holds its samples and finds the nearest"""
+    generator = np.random.RandomState(5)
+    samples = generator.normal(0, 100, (1000, 6))
+    tree = balltree.BallTree(samples, leaf_size=50)
+    added = generator.normal(300, 100, (130, 6))
+    spliced = np.concatenate([samples[:200], added, samples[500:]])
+    tree.splice(spliced, 200, 500)
+
+    assert tree.spliced == 430
+    assert tree.samples is spliced
+    assert sorted(tree.leaf_rows) == list(range(830))
+    assert (tree.ordered == spliced[tree.leaf_rows]).all()
+    assert np.allclose(tree.norms, (tree.ordered ** 2).sum(axis=1))
+    # The new samples are in leaves of their own after the old ones.
+    assert sorted(tree.leaf_rows[-130:]) == list(range(200, 330))
+    for leaf, (start, end) in enumerate(zip(tree.leaf_offsets[:-1],
+                                            tree.leaf_offsets[1:])):
+        assert end > start
+        distances = np.linalg.norm(
+            spliced[tree.leaf_rows[start:end]] - tree.centers[leaf], axis=1)
+        assert (distances <= tree.radii[leaf] + 1e-9).all()
+
+    queries = np.concatenate([generator.normal(0, 100, (10, 6)),
+                              added[:3], samples[300:303]])
+    for count in [1, 5, 300]:
+        distances, rows = tree.kneighbors(queries, count)
+        expected_distances, expected_rows = \
+            symbolindex.brute_force_kneighbors(spliced, queries, count)
+        assert (rows == expected_rows).all()
+        assert np.allclose(distances, expected_distances)
+
+    # The number of the spliced samples is stored with the tree.
+    loaded = balltree.BallTree.from_arrays(spliced, tree.get_arrays())
+    assert loaded.spliced == 430
+    loaded.splice(spliced[:700], 700, 830)
+    assert loaded.spliced == 560
+    assert sorted(loaded.leaf_rows) == list(range(700))
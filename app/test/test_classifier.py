@@ -4,13 +4,21 @@
 
 import pytest
 import operator
-import filecmp
 import pickle
 import shutil
 import platform
+import os
+import subprocess
+import sys
 from math import fabs
 
+import numpy as np
+
 from classifier import classifier as classifier_module
+from classifier import featureextractor
+from classifier import modelstore
+
+NUMBER_OF_POINTS = featureextractor.NUMBER_OF_POINTS
 
 
 # Class for mocking signal
@@ -26,6 +34,12 @@ class Signal_test:
     def get_y(self):
         return self.y
 
+    def get_pressure(self):
+        return 1
+
+    def get_time(self):
+        return 0.0
+
     def is_proper_signal_of_point(self):
         return True
 
@@ -63,13 +77,17 @@ def setup_function(test_function):
                  TEST_LOCATION + 'training-set_test.dat')
     shutil.copy2(TEST_LOCATION + PRE_TEST_FOLDER + 'training-set_test2.dat',
                  TEST_LOCATION + 'training-set_test2.dat')
+    for name in ['classifier-store.npz', 'training-set_test.npz',
+                 'training-set_test2.npz']:
+        if os.path.exists(TEST_LOCATION + name):
+            os.remove(TEST_LOCATION + name)
 
 
 def test_reset_training_set():
     """Test for load training set."""
     classifier = classifier_module.Classifier(None)
     classifier.reset_training_set(117, "a")
-    assert classifier.training_set == []
+    assert len(classifier.training_set) == 0
     assert classifier.training_size == 0
     assert classifier.ultimate_training_size == 117
 
@@ -88,14 +106,11 @@ def test__compute_tolerance_distance():
     AL = [L1, L2, L3, L4, L5]
     symbol = "a"
     classifier._compute_tolerance_distance(AL, symbol)
-    tolerance_distance_path = \
-        classifier_module.Classifier._get_file_path( \
-            classifier.files[classifier_module.DISTANCE_TOLERANCE_FILE], symbol)
-    file_with_tolerance_distance = \
-        open(tolerance_distance_path, 'r')
-    tolerance_distance = float(file_with_tolerance_distance.readline())
-    file_with_tolerance_distance.close()
+    tolerance_distance = classifier._get_tolerance_distance(symbol)
     assert fabs(tolerance_distance - 0.5506099238118276) < epsilon
+    # It is saved with the model store only.
+    assert not os.path.exists(classifier_module.Classifier._get_file_path(
+        classifier.files[classifier_module.DISTANCE_TOLERANCE_FILE], symbol))
 
 
 def test__build_paths():
@@ -136,8 +151,8 @@ def test_add_to_training_set():
     added_list = classifier.training_set[training_size - 1]
 
     for i in range(0, len(SIGNAL_LIST_TEST) - 1):
-        assert SIGNAL_LIST_TEST[i].get_x() == added_list[i].get_x()
-        assert SIGNAL_LIST_TEST[i].get_y() == added_list[i].get_y()
+        assert SIGNAL_LIST_TEST[i].get_x() == added_list.get_x(i)
+        assert SIGNAL_LIST_TEST[i].get_y() == added_list.get_y(i)
 
 
 def test__save_training_set():
@@ -147,19 +162,19 @@ def test__save_training_set():
     classifier._delete_symbol('test')
     classifier.reset_training_set(7, 'test')
     for i in range(0, 5):
-        signal_a = Signal_test(1.0 + i * 0.028, 1.00 - i * i * 0.20 * 0.30)
-        signal_b = Signal_test(2.0 - i * 0.011, 2.00 - i * 0.020)
+        signal_a = Signal_test(1000 + i * 28, 1000 - i * i * 60)
+        signal_b = Signal_test(2000 - i * 11, 2000 - i * 20)
         signal_list_test = [signal_a, signal_b]
 
         classifier.add_to_training_set(signal_list_test)
 
     classifier._save_training_set("test")
-    assert filecmp.cmp(TEST_LOCATION + 'symbol-list.dat',
-                       TEST_LOCATION + 'expected_symbol-list.dat')
-    assert filecmp.cmp(TEST_LOCATION + 'training-set_test.dat',
-                       TEST_LOCATION + 'expected_training-set_test.dat') or \
-        filecmp.cmp(TEST_LOCATION + 'training-set_test.dat',
-                    TEST_LOCATION + 'expected2_training-set_test.dat')
+    assert classifier.symbol_list == ['test2', 'test']
+    training_set = classifier._load_training_set('test')
+    assert len(training_set) == 5
+    for i, stroke in enumerate(training_set):
+        assert list(stroke.x_values) == [1000 + i * 28, 2000 - i * 11]
+        assert list(stroke.y_values) == [1000 - i * i * 60, 2000 - i * 20]
 
 
 def test__load_training_set():
@@ -175,22 +190,37 @@ def test__load_training_set():
         assert signal_list[1].get_y() == 2.00 - i * 0.020
 
 
+def test__write_training_set_to_file():
+    """Test if a legacy training set is replaced by the columnar one"""
+    legacy = [[Signal_test(i, 2 * i), Signal_test(3 * i, -i)]
+              for i in range(4)]
+    with open(TEST_LOCATION + 'training-set_test.dat', 'wb') as handle:
+        pickle.dump(legacy, handle)
+    classifier = classifier_module.Classifier(None)
+    assert classifier._load_training_set('test')[3][1].get_y() == -3
+    key = classifier._get_training_set_key('test')
+
+    classifier._write_training_set_to_file(
+        'test', classifier._load_training_set('test'))
+    assert not os.path.exists(TEST_LOCATION + 'training-set_test.dat')
+    assert classifier._get_training_set_key('test') != key
+    training_set = classifier._load_training_set('test')
+    assert len(training_set) == 4
+    for i, stroke in enumerate(training_set):
+        assert list(stroke.x_values) == [i, 3 * i]
+        assert list(stroke.y_values) == [2 * i, -i]
+
+
 def test__learn_one_symbol():
     """Test learning specific symbol"""
     if platform.machine() == 'x86_64':
         classifier = classifier_module.Classifier(None)
+        os.remove(TEST_LOCATION + 'nn-model_test.dat')
         tolerance = classifier._learn_one_symbol('test')
 
-        file_with_model = open(TEST_LOCATION + 'test_nn_model.dat', 'rb')
-        nbrs_from_file = pickle.load(file_with_model)
-
-        assert 'ball_tree' == nbrs_from_file.algorithm
-        assert 30 == nbrs_from_file.leaf_size
-        assert 'minkowski' == nbrs_from_file.metric
-        assert nbrs_from_file.metric_params is None
-        assert 2 == nbrs_from_file.n_neighbors
-        assert 2 == nbrs_from_file.p
-        assert 1.0 == nbrs_from_file.radius
+        # No model of the older versions is fitted.
+        assert not os.path.exists(TEST_LOCATION + 'nn-model_test.dat')
+        assert classifier._get_tolerance_distance('test') == tolerance
         assert tolerance < 398.85960989443032 + epsilon
         assert tolerance > 398.85960989443032 - epsilon
 
@@ -199,6 +229,10 @@ def test_classify():
     """Test classifying the given list of points to a symbol"""
     if platform.machine() == 'x86_64':
         classifier = classifier_module.Classifier(None)
+        # The models of the older versions are not read.
+        assert classifier.classify(SIGNAL_LIST_TEST) is None
+        classifier.symbol_list = ['test']
+        classifier.learn(True)
         for i in range(0, 5):
             signal_a = Signal_test(1.0 + i * 0.028, 1.00 - i * i * 0.20 * 0.30)
             signal_b = Signal_test(2.0 - i * 0.011, 2.00 - i * 0.020)
@@ -208,17 +242,30 @@ def test_classify():
             assert symbol == 'test'
 
 
+def test__get_tolerance_distance():
+    """Test if the tolerances of the older versions are read on demand"""
+    classifier = classifier_module.Classifier(None)
+    assert not classifier.tolerance_distances
+    assert classifier.symbol_index is classifier_module.NOT_LOADED
+
+    with open(TEST_LOCATION + 'distance-tolerance_test.dat') as handle:
+        tolerance_distance = float(handle.readline())
+    assert classifier._get_tolerance_distance('test') == tolerance_distance
+    assert list(classifier.tolerance_distances) == ['test']
+    assert classifier._get_tolerance_distance('missing') == 0
+    classifier.tolerance_distances['missing'] = 2.5
+    assert classifier._get_tolerance_distance('missing') == 2.5
+    classifier._delete_symbol('missing')
+
+
 def test__delete_symbol():
     """Test deleting one symbol"""
     classifier = classifier_module.Classifier(None)
     classifier.symbol_list.append("test2")
-    classifier._save_symbol_list()
     classifier._delete_symbol('test2')
     classifier.symbol_list.append("test3")
-    classifier._save_symbol_list()
 
-    assert filecmp.cmp(TEST_LOCATION + 'symbol-list.dat',
-                       TEST_LOCATION + 'expected_test_delete_symbol.dat')
+    assert classifier.symbol_list == ['test', 'test2', 'test3']
 
 
 def test_delete_symbols():
@@ -232,8 +279,328 @@ def test_delete_symbols():
     symbols_list = ['test2', 'test3', 'test4']
     classifier.delete_symbols(symbols_list)
 
-    classifier.symbol_list.append("test2")
-    classifier._save_symbol_list()
+    # The symbol table is saved with the model store only.
+    assert not os.path.exists(TEST_LOCATION + 'symbol-list.dat')
+    manifest = modelstore.load_manifest(TEST_LOCATION +
+                                        'classifier-store.npz')
+    assert manifest['symbols'] == ['test']
+    assert classifier_module.Classifier(None).symbol_list == ['test']
+
+
+def test__get_feature_matrices_cache(monkeypatch):
+    """Test if features are cached and the cache follows the training set."""
+    classifier = classifier_module.Classifier(None)
+    features = classifier._get_feature_matrices(['test'])['test']
+    cache_path = classifier_module.Classifier._get_file_path(
+        classifier.files[classifier_module.FEATURE_CACHE_FILE], 'test')
+    key = classifier._get_training_set_key('test')
+    cached_pyramid = classifier._load_cached_features('test', key)
+    assert (cached_pyramid[NUMBER_OF_POINTS] == features).all()
+
+    def fail_extraction(strokes):
+        raise AssertionError('features should be loaded from the cache')
+
+    classifier = classifier_module.Classifier(None)
+    with monkeypatch.context() as patch:
+        patch.setattr(classifier_module.featureextractor,
+                      'get_feature_pyramid_batch', fail_extraction)
+        cached = classifier._get_feature_matrices(['test'])['test']
+    assert (cached == features).all()
+
+    # A new version of the extractor invalidates the cache.
+    with monkeypatch.context() as patch:
+        patch.setattr(classifier_module.featureextractor,
+                      'EXTRACTOR_VERSION',
+                      featureextractor.EXTRACTOR_VERSION + 1)
+        assert classifier._get_training_set_key('test') != key
+
+    classifier = classifier_module.Classifier(None)
+    classifier.reset_training_set(5, 'test')
+    classifier.training_set = [SIGNAL_LIST_TEST]
+    classifier._write_training_set_to_file('test')
+    new_key = classifier._get_training_set_key('test')
+    assert new_key != key
+    assert classifier._load_cached_features('test', new_key) is None
+    assert len(classifier._get_feature_matrices(['test'])['test']) == 1
+    assert classifier._load_cached_features('test', new_key) is not None
+    classifier._delete_symbol('test')
+    assert not os.path.exists(cache_path)
+
+
+def test_classify_with_symbol_index(monkeypatch, capsys):
+    """Test classifying the given list of points with the symbol index"""
+    if platform.machine() == 'x86_64':
+        monkeypatch.setattr(classifier_module, 'CASCADE_MIN_SAMPLES', 1)
+        classifier = classifier_module.Classifier(None)
+        classifier.symbol_list = ['test']
+        classifier._learn_all_symbols_together()
+        assert not os.path.exists(TEST_LOCATION + 'nn-model.dat')
+        classifier = classifier_module.Classifier(None)
+        assert classifier._get_symbol_index().coarse_features
+        for i in range(0, 5):
+            signal_a = Signal_test(1.0 + i * 0.028, 1.00 - i * i * 0.20 * 0.30)
+            signal_b = Signal_test(2.0 - i * 0.011, 2.00 - i * 0.020)
+            symbol = classifier.classify([signal_a, signal_b])
+            assert symbol == 'test'
+
+        monkeypatch.setattr(classifier_module, 'CASCADE_MIN_SAMPLES', 10000)
+        classifier.symbol_list = ['test']
+        classifier._learn_all_symbols_together()
+        assert not classifier.symbol_index.coarse_features
+        capsys.readouterr()
+        assert classifier.classify(
+            [Signal_test(1.0, 1.0), Signal_test(2.0, 2.0)]) == 'test'
+        # The latency of the queries is reported.
+        assert "mean query latency:" in capsys.readouterr()[0]
+
+        # The statistics of a long stroke rule the symbol out at once.
+        long_stroke = [Signal_test(i * 100.0, 1.0) for i in range(100)]
+        assert classifier.classify(long_stroke) is None
+        assert classifier.symbol_index.rejection_count == 1
+        # The statistics given by the caller are used as they are.
+        assert classifier.classify(
+            [Signal_test(1.0, 1.0), Signal_test(2.0, 2.0)], None,
+            featureextractor.get_statistics(long_stroke)) is None
+        assert classifier.symbol_index.rejection_count == 2
+
+        classifier.symbol_list = []
+        classifier._learn_all_symbols_together()
+        classifier = classifier_module.Classifier(None)
+        assert classifier._get_symbol_index() is None
+        assert classifier.classify(SIGNAL_LIST_TEST) is None
+
 
-    assert filecmp.cmp(TEST_LOCATION + 'symbol-list.dat',
-                       TEST_LOCATION + 'expected_test_delete_symbols.dat')
+def test__save_model_store():
+    """Test if the store holds the symbols, the tolerances and the index"""
+    if platform.machine() == 'x86_64':
+        classifier = classifier_module.Classifier(None)
+        classifier.symbol_list = ['test']
+        classifier._learn_all_symbols_together()
+        manifest, arrays = modelstore.load(
+            TEST_LOCATION + 'classifier-store.npz')
+        assert manifest['symbols'] == ['test']
+        assert manifest['active'] == [True]
+        assert manifest['tolerances'] == {
+            'test': classifier._get_tolerance_distance('test')}
+        assert manifest['index']['symbols'] == ['test']
+        assert len(arrays['index_features']) == \
+            len(classifier.symbol_index)
+
+        # The files of the older versions are replaced by the store.
+        for name in ['nn-model.dat', 'nn-model_test.dat',
+                     'distance-tolerance_test.dat']:
+            assert not os.path.exists(TEST_LOCATION + name)
+        classifier = classifier_module.Classifier(None)
+        assert classifier.tolerance_distances == manifest['tolerances']
+
+        # The active flags are saved with the store.
+        classifier.deactivate_symbols(['test'])
+        classifier = classifier_module.Classifier(None)
+        assert classifier.symbol_list == []
+        assert classifier.inactive_symbols == ['test']
+        assert classifier.tolerance_distances == manifest['tolerances']
+        assert classifier.activate_symbols(['test'])
+        assert modelstore.load_manifest(
+            TEST_LOCATION + 'classifier-store.npz')['active'] == [True]
+
+
+def test_classifier_from_model_store():
+    """Test if the store alone is enough to classify"""
+    if platform.machine() == 'x86_64':
+        classifier = classifier_module.Classifier(None)
+        classifier.symbol_list = ['test']
+        classifier.inactive_symbols = ['test2']
+        classifier.learn(True)
+        tolerances = classifier.tolerance_distances.copy()
+
+        store_path = classifier.files[classifier_module.MODEL_STORE_FILE]
+        for template in classifier.files.values():
+            for symbol in ['', 'test', 'test2']:
+                path = classifier_module.Classifier._get_file_path(template,
+                                                                   symbol)
+                if path != store_path and os.path.isfile(path):
+                    os.remove(path)
+        classifier = classifier_module.Classifier(None)
+        assert classifier.symbol_list == ['test']
+        assert classifier.inactive_symbols == ['test2']
+        assert classifier.tolerance_distances == tolerances
+        assert fabs(classifier._get_tolerance_distance('test') -
+                    398.85960989443032) < epsilon
+        signal_list = [Signal_test(1.0, 1.0), Signal_test(2.0, 2.0)]
+        assert classifier.classify(signal_list) == 'test'
+        # The training set is needed to activate a symbol.
+        assert not classifier.activate_symbols(['test2'])
+
+
+def test__update_symbol_index(monkeypatch):
+    """Test if updating the index gives the index built from scratch"""
+    if platform.machine() == 'x86_64':
+        monkeypatch.setattr(classifier_module, 'CASCADE_MIN_SAMPLES', 10000)
+        classifier = classifier_module.Classifier(None)
+        classifier.symbol_list = ['test']
+        classifier._learn_all_symbols_together()
+        classifier.symbol_list = ['test', 'test2']
+        assert classifier._update_symbol_index(['test2'])
+        updated = classifier_module.Classifier(None)._get_symbol_index()
+        classifier._learn_all_symbols_together()
+        built = classifier.symbol_index
+        assert updated.symbols == built.symbols == ['test', 'test2']
+        assert (updated.features == built.features).all()
+        assert (updated.offsets == built.offsets).all()
+        assert np.allclose(updated.envelopes, built.envelopes)
+
+        classifier.symbol_list = ['test2']
+        assert classifier._update_symbol_index(['test'])
+        assert classifier.symbol_index.symbols == ['test2']
+
+        # Turning the cascade on needs the index built from scratch.
+        monkeypatch.setattr(classifier_module, 'CASCADE_MIN_SAMPLES', 1)
+        classifier.symbol_list = ['test', 'test2']
+        assert not classifier._update_symbol_index(['test'])
+
+
+def test_classify_many(monkeypatch, tmpdir):
+    """Test if classifying many symbols at once is like one by one"""
+    if platform.machine() == 'x86_64':
+        strokes = []
+        for i in range(0, 5):
+            strokes.append([Signal_test(1000 + i * 28, 1000 - i * i * 60),
+                            Signal_test(2000 - i * 11, 2000 - i * 20)])
+        strokes.append([Signal_test(1000, 1000), Signal_test(900000, 1000)])
+        strokes.append([Signal_test(i * 100000, 1000) for i in range(100)])
+
+        # The classifier is learnt from scratch in its own directory.
+        classifier = classifier_module.Classifier(None)
+        classifier.files = {name: os.path.join(str(tmpdir), name)
+                            for name in classifier.files}
+        classifier.symbol_list = []
+        classifier.inactive_symbols = []
+        classifier.tolerance_distances = {}
+        classifier.training_set = strokes[:5]
+        classifier._save_training_set('test')
+
+        # Without the cascade first, then with it.
+        for cascade_min_samples in [10000, 1]:
+            monkeypatch.setattr(classifier_module, 'CASCADE_MIN_SAMPLES',
+                                cascade_min_samples)
+            classifier.learn(True)
+            assert os.path.exists(os.path.join(str(tmpdir),
+                                               'classifier-store.npz'))
+            assert bool(classifier.symbol_index.coarse_features) == \
+                (cascade_min_samples == 1)
+            symbols, distances, accepted = classifier.classify_many(strokes)
+            assert len(symbols) == len(distances) == len(accepted)
+            for stroke, symbol, distance, is_accepted in \
+                    zip(strokes, symbols, distances, accepted):
+                expected = classifier.classify(stroke)
+                assert expected == (symbol if is_accepted else None)
+                if symbol is not None:
+                    assert is_accepted == (
+                        distance <
+                        classifier._get_tolerance_distance(symbol))
+            assert list(accepted[:5]) == [True] * 5
+
+        assert len(classifier.classify_many([])[0]) == 0
+
+
+def test__fit_projection(monkeypatch):
+    """Test if the projection is fitted, saved and followed by the models"""
+    monkeypatch.setattr(classifier_module, 'PROJECTION_COMPONENTS', 3)
+    classifier = classifier_module.Classifier(None)
+    classifier.symbol_list = ['test']
+    classifier._learn_all_symbols_together()
+    assert os.path.exists(TEST_LOCATION + 'projection.dat')
+
+    classifier = classifier_module.Classifier(None)
+    assert classifier._get_projection()['components'].shape == \
+        (3, 4 * NUMBER_OF_POINTS - 1)
+    features = classifier._get_feature_matrices(['test'])['test']
+    projected = classifier._project(features)
+    assert projected.shape == (len(features), 3)
+    assert projected.dtype == np.float32
+    # The tolerance is computed in the projected space.
+    assert fabs(classifier._get_tolerance_distance('test') -
+                classifier._compute_tolerance_distance(projected, 'test')) < \
+        epsilon
+
+    monkeypatch.setattr(classifier_module, 'PROJECTION_COMPONENTS', None)
+    classifier._learn_all_symbols_together()
+    assert classifier.projection is None
+    assert not os.path.exists(TEST_LOCATION + 'projection.dat')
+
+
+def test__project(monkeypatch):
+    """Test if the projection onto all components keeps the distances"""
+    classifier = classifier_module.Classifier(None)
+    generator = np.random.RandomState(3)
+    features = generator.uniform(-500, 500, (20, 4 * NUMBER_OF_POINTS - 1))
+    classifier.feature_pyramids['a'] = {NUMBER_OF_POINTS: features}
+    classifier.symbol_list = ['a']
+    monkeypatch.setattr(classifier_module, 'PROJECTION_COMPONENTS', 20)
+    classifier._fit_projection()
+    projected = classifier._project(features)
+    assert np.isclose(np.linalg.norm(projected[3] - projected[11]),
+                      np.linalg.norm(features[3] - features[11]), rtol=1e-4)
+    assert classifier._project(features[0]).shape == (20,)
+    os.remove(TEST_LOCATION + 'projection.dat')
+
+
+def test__learn_symbols():
+    """Test if the symbols learnt in processes are learnt the same way"""
+    symbols = ['test', 'test2']
+    for symbol in symbols:
+        os.remove(TEST_LOCATION + 'distance-tolerance_%s.dat' % symbol)
+        os.remove(TEST_LOCATION + 'nn-model_%s.dat' % symbol)
+    classifier = classifier_module.Classifier(None)
+    classifier._learn_symbols(symbols, 1)
+    expected = classifier.tolerance_distances
+
+    classifier = classifier_module.Classifier(None)
+    classifier._learn_symbols(symbols, 2)
+    for symbol in symbols:
+        assert fabs(classifier.tolerance_distances[symbol] -
+                    expected[symbol]) < epsilon
+        # Nothing but the store holds the tolerances and the models.
+        assert not os.path.exists(
+            TEST_LOCATION + 'distance-tolerance_%s.dat' % symbol)
+        assert not os.path.exists(TEST_LOCATION + 'nn-model_%s.dat' % symbol)
+    assert sorted(classifier.feature_pyramids) == symbols
+
+
+def test_hardcoded_symbols(monkeypatch):
+    """Test if both bitnesses map the store of the hardcoded symbols"""
+    app_path = os.path.dirname(os.path.dirname(
+        os.path.abspath(classifier_module.__file__)))
+    monkeypatch.setattr(classifier_module, 'DATA_PATH',
+                        os.path.join(app_path, 'classifier', 'data', ''))
+    classifiers = [classifier_module.Classifier(bitness)
+                   for bitness in [32, 64]]
+    assert classifiers[0].files == classifiers[1].files
+    for classifier in classifiers:
+        assert classifier.symbol_list == [
+            'small_a', 'large_k', 'large_sigma', 'small_gamma',
+            'small_gamma_with_dot']
+        symbol_index = classifier._get_symbol_index()
+        # The matrices are mapped from the file, not read.
+        assert not symbol_index.features.flags.owndata
+        assert not symbol_index.features.flags.writeable
+        assert symbol_index.symbols == sorted(classifier.symbol_list)
+        for symbol in symbol_index.symbols:
+            assert classifier._get_tolerance_distance(symbol) > 0
+            features = symbol_index.get_symbol_features(symbol)
+            found, _ = symbol_index.query(features[0], {}, None)
+            assert found == symbol
+    assert not os.path.exists(os.path.join(
+        app_path, 'classifier', 'data', '32', 'nn-model.dat'))
+
+
+def test_classifier_without_sklearn():
+    """Test if the classification does not import sklearn"""
+    code = ("import sys\n"
+            "from classifier import classifier\n"
+            "classifier.Classifier(None)._get_symbol_index()\n"
+            "assert 'sklearn' not in sys.modules\n")
+    app_path = os.path.dirname(os.path.dirname(
+        os.path.abspath(classifier_module.__file__)))
+    subprocess.check_call([sys.executable, '-c', code],
+                          env=dict(os.environ, PYTHONPATH=app_path))
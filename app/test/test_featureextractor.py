@@ -2,11 +2,16 @@
 
 """Tests for signal collection."""
 
+import pickle
+
+import numpy as np
 import pytest
 
 from classifier import featureextractor
 from math import pi
 
+FEATURES_LOCATION = 'featureextractor/data/'
+
 # Basic points
 POINTA = featureextractor.Point(2.0, 4.0)
 POINTB = featureextractor.Point(1.0, 2.0)
@@ -280,3 +285,253 @@ def test_feature_extractor():
     assert minimum < -500.0 + 0.000001
     assert maximum < 500.0 + 0.000001
     assert maximum > 500.0 - 0.000001
+
+
+# Class for mocking signals which are not always proper points
+class Signal_with_pressure_test:
+
+    def __init__(self, x, y, pressure):
+        self.x = x
+        self.y = y
+        self.pressure = pressure
+
+    def get_x(self):
+        return self.x
+
+    def get_y(self):
+        return self.y
+
+    def is_proper_signal_of_point(self):
+        return self.x >= 0 and self.y >= 0
+
+    def is_raising_finger_signal(self):
+        return self.pressure == 0
+
+
+def _load_expected_features():
+    """Load strokes with the features computed by the object engine."""
+    with open(FEATURES_LOCATION + 'expected_features.dat', 'rb') as handle:
+        return pickle.load(handle)
+
+
+def test_get_features_parity():
+    """Test if the array engine gives the same features as the object one.
+
+    """
+    for stroke, expected_features, _ in _load_expected_features():
+        signal_list = [Signal_with_pressure_test(*signal) for signal in stroke]
+        features = featureextractor.get_features(signal_list)
+
+        assert len(features) == len(expected_features)
+        # The color of the last point used to depend on rounding errors
+        # (see test_get_features_last_color).
+        for feature, expected in zip(features[:-1], expected_features[:-1]):
+            assert abs(feature - expected) < 0.000001
+
+
+def test_get_features_last_color():
+    """Test if the last point keeps the color of the last proper signal.
+
+    """
+    signal_list = [Signal_with_pressure_test(700, 700 + 4 * i, 40)
+                   for i in range(50)]
+    signal_list.append(Signal_with_pressure_test(-1, -1, 0))
+    signal_list.append(Signal_with_pressure_test(760, 650, 40))
+    features = featureextractor.get_features(signal_list)
+    assert features[-1] == 0
+
+    signal_list.append(Signal_with_pressure_test(-1, -1, 0))
+    features = featureextractor.get_features(signal_list)
+    assert features[-1] == featureextractor.SCALE / \
+        featureextractor.COLOR_DOWNSCALE
+
+
+def test_get_new_points_parity():
+    """Test if the normalized points are the same as in the object engine.
+
+    """
+    for stroke, _, expected_points in _load_expected_features():
+        signal_list = [Signal_with_pressure_test(*signal) for signal in stroke]
+        points = featureextractor.get_new_points(signal_list)
+
+        assert len(points) == featureextractor.NUMBER_OF_POINTS
+        for point, expected in zip(points, expected_points):
+            assert abs(point.x_cord - expected[0]) < 0.000001
+            assert abs(point.y_cord - expected[1]) < 0.000001
+
+
+def test_get_features_from_arrays():
+    """Test the array engine on a curve given directly as arrays.
+
+    """
+    x_values = [0, 3, 3, 6]
+    y_values = [0, 4, 4, 8]
+    pen_up = [False, True, False, False]
+    features = featureextractor.get_features_from_arrays(x_values, y_values,
+                                                         pen_up)
+
+    assert len(features) == 4 * featureextractor.NUMBER_OF_POINTS - 1
+    x_values = features[0::4]
+    colors = features[2::4]
+    # The finger was raised at (3, 4) but the curve was continued from
+    # the same point, so the segment drawn after the raise is not marked.
+    assert not colors.any()
+    assert np.isclose(x_values[0], -375.0)
+    assert np.isclose(x_values[-1], 375.0)
+
+
+def test_get_features_batch():
+    """Test if features of packed strokes are the same as of single ones.
+
+    """
+    signal_lists = [[Signal_with_pressure_test(*signal) for signal in stroke]
+                    for stroke, _, _ in _load_expected_features()]
+    strokes = featureextractor.pack_strokes(signal_lists)
+    features = featureextractor.get_features_batch(strokes)
+
+    assert len(strokes.offsets) == len(signal_lists) + 1
+    assert features.shape == (len(signal_lists),
+                              4 * featureextractor.NUMBER_OF_POINTS - 1)
+    for row, signal_list in zip(features, signal_lists):
+        expected = featureextractor.get_features(signal_list)
+        assert np.allclose(row, expected, rtol=0, atol=0.000001)
+
+
+def test_get_features_batch_empty():
+    """Test if no strokes give an empty matrix of features.
+
+    """
+    features = featureextractor.get_features_batch(
+        featureextractor.pack_strokes([]))
+    assert features.shape == (0, 4 * featureextractor.NUMBER_OF_POINTS - 1)
+
+
+def test_get_feature_pyramid_batch():
+    """Test if the levels of the pyramid are resampled from the same curves.
+
+    """
+    signal_lists = [[Signal_with_pressure_test(*signal) for signal in stroke]
+                    for stroke, _, _ in _load_expected_features()]
+    strokes = featureextractor.pack_strokes(signal_lists)
+    pyramid = featureextractor.get_feature_pyramid_batch(strokes)
+    number_of_points = featureextractor.NUMBER_OF_POINTS
+
+    assert sorted(pyramid) == featureextractor.PYRAMID_LEVELS
+    assert np.allclose(pyramid[number_of_points],
+                       featureextractor.get_features_batch(strokes))
+    for level, features in pyramid.items():
+        assert features.shape == (len(signal_lists), 4 * level - 1)
+        # The first and the last point are the same at every level.
+        assert np.allclose(features[:, :2],
+                           pyramid[number_of_points][:, :2])
+        assert np.allclose(features[:, -3:],
+                           pyramid[number_of_points][:, -3:])
+
+    empty = featureextractor.get_feature_pyramid_batch(
+        featureextractor.pack_strokes([]), [10])
+    assert empty[10].shape == (0, 39)
+
+
+def test_get_statistics():
+    """Test the statistics of a stroke with a raise of the finger.
+
+    """
+    signals = [Signal_with_pressure_test(*signal) for signal in
+               [(0, 0, 1), (3, 4, 1), (-1, -1, 0), (3, 8, 1), (3, 10, 1)]]
+    statistics = featureextractor.get_statistics(signals)
+    # The length is measured along the path, across the raise too.
+    assert np.allclose(statistics, [4, 1, 11 / 14, 11 / 4])
+
+    strokes = featureextractor.pack_strokes([signals, signals[:2]])
+    batch = featureextractor.get_statistics_batch(strokes)
+    assert np.allclose(batch[0], statistics)
+    assert np.allclose(batch[1], [2, 0, 5 / 8, 5 / 4])
+
+
+def test_stroke_accumulator():
+    """Test if accumulated features are the same as extracted at once.
+
+    """
+    for stroke, _, _ in _load_expected_features():
+        signal_list = [Signal_with_pressure_test(*signal) for signal in stroke]
+        accumulator = featureextractor.StrokeAccumulator()
+        for signal in signal_list:
+            accumulator.add(signal)
+
+        expected = featureextractor.get_features(signal_list)
+        assert np.allclose(accumulator.get_features(), expected, rtol=0,
+                           atol=0.000001)
+        pyramid = accumulator.get_feature_pyramid()
+        for level, features in \
+                featureextractor.get_feature_pyramid(signal_list).items():
+            assert np.allclose(pyramid[level], features, rtol=0,
+                               atol=0.000001)
+        assert np.allclose(accumulator.get_statistics(),
+                           featureextractor.get_statistics(signal_list))
+
+
+def test_stroke_accumulator_remove_head():
+    """Test if the accumulator forgets the signals removed from the head.
+
+    """
+    stroke, _, _ = _load_expected_features()[-1]
+    signal_list = [Signal_with_pressure_test(*signal) for signal in stroke]
+    accumulator = featureextractor.StrokeAccumulator()
+    window = 700
+    for i, signal in enumerate(signal_list):
+        if i >= window and \
+                signal_list[i - window].is_proper_signal_of_point():
+            accumulator.remove_head_point()
+        accumulator.add(signal)
+
+    window_list = signal_list[-window:]
+    points, _ = featureextractor.filter_points_from_signals(window_list)
+    min_point, max_point = featureextractor.calculate_border_points(points)
+    curve = featureextractor.create_curve(points)
+
+    assert accumulator.number_of_points() == len(points)
+    assert accumulator.get_border_points() == \
+        ((min_point.x_cord, min_point.y_cord),
+         (max_point.x_cord, max_point.y_cord))
+    assert np.isclose(accumulator.get_length(), curve.length)
+    assert np.allclose(accumulator.get_center_of_mass(),
+                       (curve.center_of_mass.x_cord,
+                        curve.center_of_mass.y_cord))
+    assert np.allclose(accumulator.get_features(),
+                       featureextractor.get_features(window_list), rtol=0,
+                       atol=0.000001)
+    assert np.allclose(accumulator.get_statistics(),
+                       featureextractor.get_statistics(window_list))
+
+
+def test_stroke_accumulator_empty():
+    """Test if an accumulator without points has no features.
+
+    """
+    accumulator = featureextractor.StrokeAccumulator()
+    accumulator.add(Signal_with_pressure_test(-1, -1, 0))
+    assert accumulator.number_of_points() == 0
+    assert accumulator.get_features() is None
+    assert accumulator.get_statistics() is None
+
+    signal = Signal_with_pressure_test(3, 4, 10)
+    accumulator.add(signal)
+    accumulator.remove_head_point()
+    assert accumulator.get_features() is None
+
+
+def test_segment_signals():
+    """Test finding points and pen states in a single pass.
+
+    """
+    # point, non-point, raise, point, point, non-point, point, raise,
+    # non-point, raise+point, non-point
+    proper = [True, False, False, True, True, False, True, False, False,
+              True, False]
+    raising = [False, False, True, False, False, False, False, True, False,
+               True, False]
+
+    point_indices, pen_up = featureextractor.segment_signals(proper, raising)
+
+    assert point_indices.tolist() == [0, 3, 4, 6, 9]
+    assert pen_up.tolist() == [True, False, False, True, False]
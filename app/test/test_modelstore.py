@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the model store."""
+
+import os
+
+import numpy as np
+import pytest
+
+from classifier import modelstore
+
+
+def test_save_and_load(tmpdir):
+    """Test if the store keeps the manifest and the arrays"""
+    path = str(tmpdir.join('store.npz'))
+    arrays = {'features': np.arange(6, dtype=np.float32).reshape(2, 3),
+              'labels': np.array([0, 1])}
+    modelstore.save(path, {'symbols': ['a', 'b'], 'tolerances': {'a': 1.5}},
+                    arrays)
+    assert os.listdir(str(tmpdir)) == ['store.npz']
+
+    manifest, loaded = modelstore.load(path)
+    assert manifest['symbols'] == ['a', 'b']
+    assert manifest['tolerances'] == {'a': 1.5}
+    assert manifest['version'] == modelstore.VERSION
+    assert sorted(loaded) == ['features', 'labels']
+    assert modelstore.load_manifest(path) == manifest
+    assert loaded['features'].dtype == np.float32
+    assert (loaded['features'] == arrays['features']).all()
+
+    # Saving again replaces the store.
+    modelstore.save(path, {'symbols': []}, {})
+    assert modelstore.load(path) == ({'symbols': [],
+                                      'format': modelstore.FORMAT,
+                                      'version': modelstore.VERSION}, {})
+
+
+def test_load_mapped(tmpdir):
+    """Test if the mapped arrays are aligned read-only views of the file"""
+    path = str(tmpdir.join('store.npz'))
+    arrays = {'a': np.arange(5, dtype=np.int8),
+              'features': np.arange(12, dtype=np.float32).reshape(3, 4),
+              'fortran': np.asfortranarray(np.ones((2, 3))),
+              'empty': np.zeros((0, 4))}
+    modelstore.save(path, {'symbols': ['a']}, arrays)
+
+    manifest, loaded = modelstore.load(path, mapped=True)
+    assert manifest['symbols'] == ['a']
+    assert sorted(loaded) == sorted(arrays)
+    for name, array in arrays.items():
+        assert (loaded[name] == array).all()
+        assert loaded[name].shape == array.shape
+        assert loaded[name].dtype == array.dtype
+        assert not loaded[name].flags.writeable
+        assert not loaded[name].flags.owndata
+        assert loaded[name].ctypes.data % modelstore.ALIGNMENT == 0
+
+    # The store stays a valid .npz file.
+    with np.load(path) as store:
+        assert (store['features'] == arrays['features']).all()
+
+    # The mapped arrays outlive the replaced store.
+    modelstore.save(path, {}, {'features': np.zeros(1)})
+    assert (loaded['features'] == arrays['features']).all()
+
+
+def test_load_errors(tmpdir, monkeypatch):
+    """Test if the missing, foreign and newer stores are refused"""
+    path = str(tmpdir.join('store.npz'))
+    with pytest.raises(FileNotFoundError):
+        modelstore.load(path)
+    with pytest.raises(FileNotFoundError):
+        modelstore.load_manifest(path)
+
+    np.savez(path, features=np.zeros(3))
+    with pytest.raises(ValueError):
+        modelstore.load(path)
+    with pytest.raises(ValueError):
+        modelstore.load_manifest(path)
+
+    monkeypatch.setattr(modelstore, 'VERSION', modelstore.VERSION + 1)
+    modelstore.save(path, {}, {})
+    monkeypatch.undo()
+    with pytest.raises(ValueError):
+        modelstore.load(path)
+    with pytest.raises(ValueError):
+        modelstore.load_manifest(path)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the random projection forest."""
+
+import numpy as np
+
+from classifier import projectionforest
+from classifier import symbolindex
+
+
+def test_leaves():
+    """Test if every tree splits the samples into small leaves"""
+    generator = np.random.RandomState(1)
+    samples = generator.normal(0, 100, (1000, 6))
+    forest = projectionforest.ProjectionForest(samples, trees=3,
+                                               leaf_size=50)
+
+    assert forest.depth == 5
+    for tree in range(3):
+        assert sorted(forest.leaf_rows[tree]) == list(range(1000))
+        sizes = np.diff(forest.leaf_offsets[tree])
+        assert sizes.max() <= 50
+    # The samples fall into their own leaves.
+    leaves = forest.get_leaves(samples)
+    for tree in range(3):
+        for leaf, (start, end) in enumerate(zip(
+                forest.leaf_offsets[tree][:-1],
+                forest.leaf_offsets[tree][1:])):
+            rows = forest.leaf_rows[tree, start:end]
+            assert (leaves[rows, tree] == leaf).all()
+
+
+def test_kneighbors():
+    """Test if the forest finds most of the exact nearest samples"""
+    generator = np.random.RandomState(2)
+    centers = generator.uniform(-500, 500, (10, 8))
+    samples = np.concatenate([center + generator.normal(0, 20, (200, 8))
+                              for center in centers])
+    queries = centers + generator.normal(0, 20, centers.shape)
+    distances, rows = projectionforest.ProjectionForest(samples)\
+        .kneighbors(queries, 5)
+    expected_distances, expected_rows = \
+        symbolindex.brute_force_kneighbors(samples, queries, 5)
+
+    found = sum(len(np.intersect1d(query_rows, expected_query_rows))
+                for query_rows, expected_query_rows in zip(rows,
+                                                           expected_rows))
+    assert found >= 0.9 * expected_rows.size
+    assert (distances >= expected_distances - 1e-9).all()
+    assert np.allclose(distances, np.linalg.norm(
+        samples[rows] - queries[:, np.newaxis], axis=2))
+
+    # A single leaf holds all the samples, so the search is exact.
+    distances, rows = projectionforest.ProjectionForest(samples[:40])\
+        .kneighbors(queries, 5)
+    expected_distances, _ = \
+        symbolindex.brute_force_kneighbors(samples[:40], queries, 5)
+    assert np.allclose(distances, expected_distances)
+
+
+def test_splice():
+    """Test if the spliced samples fall into their leaves"""
+    generator = np.random.RandomState(3)
+    samples = generator.normal(0, 100, (1000, 6))
+    forest = projectionforest.ProjectionForest(samples, trees=3,
+                                               leaf_size=50)
+    directions = forest.directions
+    added = generator.normal(0, 100, (130, 6))
+    spliced = np.concatenate([samples[:200], added, samples[500:]])
+    forest.splice(spliced, 200, 500)
+
+    # The splits stay.
+    assert forest.directions is directions
+    assert forest.spliced == 430
+    assert forest.samples is spliced
+    leaves = forest.get_leaves(spliced)
+    for tree in range(3):
+        assert sorted(forest.leaf_rows[tree]) == list(range(830))
+        for leaf, (start, end) in enumerate(zip(
+                forest.leaf_offsets[tree][:-1],
+                forest.leaf_offsets[tree][1:])):
+            rows = forest.leaf_rows[tree, start:end]
+            assert (leaves[rows, tree] == leaf).all()
+    distances, rows = forest.kneighbors(spliced[195:335], 1)
+    assert (rows[:, 0] == np.arange(195, 335)).all()
+    assert np.allclose(distances, 0)
+
+    loaded = projectionforest.ProjectionForest.from_arrays(
+        spliced, forest.get_arrays())
+    assert loaded.spliced == 430
@@ -2,6 +2,9 @@
 
 """Tests for signal collection """
 
+import numpy as np
+
+from classifier import featureextractor
 from signalcollection import signalcollection
 
 COLLECTION = signalcollection.SignalCollection()
@@ -16,18 +19,45 @@ class TestSignal:
         return self.time
 
 
+class Signal_with_pressure_test(TestSignal):
+
+    def __init__(self, x, y, pressure, time):
+        self.x = x
+        self.y = y
+        self.pressure = pressure
+        self.time = time
+
+    def get_x(self):
+        return self.x
+
+    def get_y(self):
+        return self.y
+
+    def get_pressure(self):
+        return self.pressure
+
+    def is_proper_signal_of_point(self):
+        return self.x >= 0 and self.y >= 0
+
+    def is_raising_finger_signal(self):
+        return self.pressure == 0
+
+
 def test_init():
     """Test for initial function"""
-    assert COLLECTION.signal_list == []
+    assert len(COLLECTION.stroke) == 0
 
 
 def test_reset():
-    """Test for reseting signal list"""
-    COLLECTION.signal_list = [5]
-    assert COLLECTION.signal_list == [5]
+    """Test for reseting the stroke"""
+    COLLECTION.stroke.append(5, 5, 1, 0.0)
+    assert len(COLLECTION.stroke) == 1
+    stroke = COLLECTION.as_stroke()
 
     COLLECTION.reset()
-    assert COLLECTION.signal_list == []
+    assert len(COLLECTION.stroke) == 0
+    assert len(stroke) == 1
+    assert stroke.get_x(0) == 5
 
 
 def test__is_to_big():
@@ -35,27 +65,27 @@ def test__is_to_big():
     maxi = signalcollection.MAX_NUMBER_OF_SIGNALS_IN_GROUP
 
     for i in range(0, maxi - 1):
-        COLLECTION.signal_list.append(i)
+        COLLECTION.stroke.append(i, i, 1, 0.0)
 
     assert COLLECTION._is_too_big() is False
 
-    COLLECTION.signal_list.append(-1)
+    COLLECTION.stroke.append(-1, -1, 1, 0.0)
 
     assert COLLECTION._is_too_big() is True
 
 
 def test__is_empty():
     """Test _is_empty function"""
-    COLLECTION.signal_list = [5]
+    COLLECTION.stroke.append(5, 5, 1, 0.0)
     assert COLLECTION._is_empty() is False
 
     COLLECTION.reset()
     assert COLLECTION._is_empty() is True
 
 
-def test_as_list():
-    """Test as_empty function"""
-    assert COLLECTION.as_list() == COLLECTION.signal_list
+def test_as_stroke():
+    """Test as_stroke function"""
+    assert COLLECTION.as_stroke() is COLLECTION.stroke
 
 
 def test_is_head_too_old():
@@ -65,7 +95,7 @@ def test_is_head_too_old():
     signal_zero = TestSignal()
     signal_zero.set_time(0)
 
-    COLLECTION.signal_list.append(signal_zero)
+    COLLECTION.stroke.append(0, 0, 1, signal_zero.get_time())
 
     signal_maxi = TestSignal()
     signal_maxi.set_time(signalcollection.MAX_DURATION_OF_GROUP)
@@ -86,7 +116,7 @@ def test_is_recent_enough():
     signal_zero = TestSignal()
     signal_zero.set_time(0)
 
-    COLLECTION.signal_list.append(signal_zero)
+    COLLECTION.stroke.append(0, 0, 1, signal_zero.get_time())
     assert COLLECTION.is_recent_enough(COLLECTION
                                        .get_max_break_between_two_points())\
         is True
@@ -97,6 +127,28 @@ def test_is_recent_enough():
     COLLECTION.reset()
 
 
+def test_is_quiet():
+    """Test if the stroke gets quiet before it gets old and its version."""
+    collection = signalcollection.SignalCollection()
+    assert collection.is_quiet(100) is False
+    assert collection.get_time_when_quiet(100) is None
+
+    version = collection.version
+    collection.add_and_maintain(Signal_with_pressure_test(1, 1, 1, 10.0))
+    assert collection.version != version
+    quiet_break = collection.get_max_break_between_two_points() * \
+        signalcollection.SPECULATION_BREAK_FRACTION
+    assert np.isclose(collection.get_time_when_quiet(10.0), quiet_break)
+    assert collection.is_quiet(10.0 + quiet_break / 2) is False
+    assert collection.is_quiet(10.0 + quiet_break) is True
+    assert collection.get_time_when_quiet(11.0 + quiet_break) == 0
+    assert collection.is_recent_enough(10.0 + quiet_break) is True
+
+    version = collection.version
+    collection.reset()
+    assert collection.version != version
+
+
 def test__need_to_remove_head():
     """Test need_to_remove_head function"""
 
@@ -107,9 +159,38 @@ def test__need_to_remove_head():
     # assert on Empty
     assert COLLECTION._need_to_remove_head(signal_zero) is False
 
-    COLLECTION.signal_list.append(signal_zero)
+    COLLECTION.stroke.append(0, 0, 1, signal_zero.get_time())
 
     # Assert not too big and not too old.
     assert COLLECTION._need_to_remove_head(signal_zero) is False
 
     COLLECTION.reset()
+
+
+def test_get_features():
+    """Test if features follow the signals added and removed."""
+    collection = signalcollection.SignalCollection()
+    assert collection.get_features() is None
+    assert collection.get_statistics() is None
+
+    # The head gets too old after MAX_DURATION_OF_GROUP / 0.01 signals.
+    for i in range(1000):
+        pressure = 0 if i % 97 == 96 else 40
+        signal = Signal_with_pressure_test(500 + (i * 37) % 300,
+                                           200 + (i * i) % 500,
+                                           pressure, i * 0.01)
+        collection.add_and_maintain(signal)
+
+    stroke = collection.as_stroke()
+    assert len(stroke) < 1000
+    assert abs(stroke.get_time(0) - 1000 * 0.01 +
+               signalcollection.MAX_DURATION_OF_GROUP) < 0.02
+    assert np.allclose(collection.get_features(),
+                       featureextractor.get_features(stroke), rtol=0,
+                       atol=0.000001)
+    assert np.allclose(collection.get_statistics(),
+                       featureextractor.get_statistics(stroke))
+
+    collection.reset()
+    assert collection.get_features() is None
+    assert collection.get_statistics() is None
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for stroke"""
+
+import pickle
+
+import numpy as np
+import pytest
+
+from stroke import stroke as stroke_module
+
+
+class Signal_test:
+    def __init__(self, x, y, pressure, time):
+        self.x = x
+        self.y = y
+        self.pressure = pressure
+        self.time = time
+
+    def get_x(self):
+        return self.x
+
+    def get_y(self):
+        return self.y
+
+    def get_pressure(self):
+        return self.pressure
+
+    def get_time(self):
+        return self.time
+
+
+def _make_stroke(length):
+    stroke = stroke_module.Stroke()
+    for i in range(length):
+        stroke.append(i, 2 * i, i % 3, i * 0.5)
+    return stroke
+
+
+def test_append():
+    """Test if appended signals are kept in typed arrays"""
+    stroke = _make_stroke(1000)
+    assert len(stroke) == 1000
+    assert stroke.x_values.dtype == np.int32
+    assert stroke.times.dtype == np.float64
+    assert list(stroke.y_values[:3]) == [0, 2, 4]
+    assert stroke.get_x(-1) == 999
+    assert stroke.get_pressure(4) == 1
+    assert stroke.get_time(3) == 1.5
+    with pytest.raises(IndexError):
+        stroke.get_x(1000)
+
+
+def test_from_signals():
+    """Test if a stroke made of signals keeps their values"""
+    signals = [Signal_test(3, -1, 20, 0.25), Signal_test(4, 5, 0, 0.5)]
+    stroke = stroke_module.Stroke.from_signals(signals)
+    assert list(stroke.x_values) == [3, 4]
+    assert list(stroke.proper_points()) == [False, True]
+    assert list(stroke.raising_finger()) == [False, True]
+    assert not stroke.is_proper_signal_of_point(0)
+    assert stroke.is_raising_finger_signal(1)
+    assert len(stroke_module.Stroke.from_signals([])) == 0
+
+
+def test_remove_head():
+    """Test if the head is removed and the stroke still grows"""
+    stroke = _make_stroke(300)
+    stroke.remove_head(250)
+    assert len(stroke) == 50
+    assert stroke.get_x(0) == 250
+    for i in range(300, 600):
+        stroke.append(i, 2 * i, 0, i * 0.5)
+    assert list(stroke.x_values) == list(range(250, 600))
+    stroke.remove_head(1000)
+    assert len(stroke) == 0
+
+
+def test_slice():
+    """Test if a slice shares the memory and survives appending"""
+    stroke = _make_stroke(10)
+    part = stroke[2:5]
+    assert list(part.x_values) == [2, 3, 4]
+    assert np.may_share_memory(part.x_values, stroke.x_values)
+    part.append(-7, -7, 0, 0.0)
+    assert list(part.x_values) == [2, 3, 4, -7]
+    assert stroke.get_x(5) == 5
+    with pytest.raises(ValueError):
+        stroke[::2]
+    with pytest.raises(TypeError):
+        stroke[0]
+
+
+def test_pickle():
+    """Test if a pickled stroke is compact and equal to the original"""
+    stroke = _make_stroke(300)
+    stroke.remove_head(100)
+    restored = pickle.loads(pickle.dumps(stroke))
+    assert len(restored) == 200
+    assert len(restored._x_values) == 200
+    assert (restored.times == stroke.times).all()
+    restored.append(1, 1, 1, 1.0)
+    assert len(restored) == 201
+
+
+def test_stroke_set(tmpdir):
+    """Test if the strokes of a set share its arrays and survive saving"""
+    strokes = [_make_stroke(length) for length in [3, 0, 5000]]
+    stroke_set = stroke_module.StrokeSet.from_strokes(
+        strokes[:2] + [[Signal_test(7, 8, 9, 0.5)]])
+    stroke_set.append(strokes[2])
+    assert len(stroke_set) == 4
+    assert [len(stroke) for stroke in stroke_set] == [3, 0, 1, 5000]
+    assert stroke_set[2].get_pressure(0) == 9
+    assert list(stroke_set[-1].y_values[-2:]) == [9996, 9998]
+    assert np.may_share_memory(stroke_set[3].x_values, stroke_set._x_values)
+    with pytest.raises(IndexError):
+        stroke_set[4]
+
+    path = str(tmpdir.join('set.npz'))
+    stroke_set.save(path)
+    loaded = stroke_module.StrokeSet.load(path)
+    arrays = loaded.get_arrays()
+    assert list(arrays['offsets']) == [0, 3, 3, 4, 5004]
+    assert arrays['x_values'].dtype == np.int32
+    assert arrays['times'].dtype == np.float64
+    assert (loaded[3].times == strokes[2].times).all()
+    loaded.append(strokes[0])
+    assert list(loaded[4].x_values) == [0, 1, 2]
+
+    restored = pickle.loads(pickle.dumps(loaded))
+    assert len(restored) == 5
+    assert len(restored._x_values) == 5007
@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the symbol index."""
+
+import pickle
+
+import numpy as np
+import pytest
+from sklearn.neighbors import NearestNeighbors
+
+from classifier import featureextractor
+from classifier import symbolindex
+
+NUMBER_OF_POINTS = featureextractor.NUMBER_OF_POINTS
+
+
+def _make_matrices(generator, symbols, size, spread):
+    """Make clusters of feature pyramids around random centers."""
+    centers = generator.uniform(-500, 500, (len(symbols),
+                                            4 * NUMBER_OF_POINTS - 1))
+    pyramids = {}
+    for symbol, center in zip(symbols, centers):
+        matrix = center + generator.normal(0, spread, (size, len(center)))
+        pyramids[symbol] = {level: matrix[:, :4 * level - 1]
+                            for level in featureextractor.PYRAMID_LEVELS}
+    return centers, pyramids
+
+
+def _split_levels(pyramids):
+    """Split the pyramids into the full and the coarse matrices."""
+    feature_matrices = {symbol: pyramid[NUMBER_OF_POINTS]
+                        for symbol, pyramid in pyramids.items()}
+    coarse_matrices = {level: {symbol: pyramid[level]
+                               for symbol, pyramid in pyramids.items()}
+                       for level in featureextractor.PYRAMID_LEVELS[:-1]}
+    return feature_matrices, coarse_matrices
+
+
+def test_layout():
+    """Test if the symbols are sorted and their features are views"""
+    generator = np.random.RandomState(1)
+    _, pyramids = _make_matrices(generator, ['b', 'a'], 4, 10)
+    feature_matrices, _ = _split_levels(pyramids)
+    index = symbolindex.SymbolIndex(feature_matrices)
+
+    assert index.symbols == ['a', 'b']
+    assert len(index) == 8
+    assert list(index.labels) == [0] * 4 + [1] * 4
+    assert index.levels == [NUMBER_OF_POINTS]
+    view = index.get_symbol_features('b')
+    assert np.may_share_memory(view, index.features)
+    assert (view == feature_matrices['b']).all()
+
+
+def test_query():
+    """Test if the query votes and measures like the brute force"""
+    generator = np.random.RandomState(7)
+    centers, pyramids = _make_matrices(generator, ['b', 'a', 'c'], 50, 150)
+    feature_matrices, _ = _split_levels(pyramids)
+    index = symbolindex.SymbolIndex(feature_matrices)
+
+    for center in centers:
+        query = center + generator.normal(0, 150, len(center))
+        distances = np.linalg.norm(index.features - query, axis=1)
+        nearest = np.argsort(distances)[:symbolindex.NEIGHBORS]
+        label = np.bincount(index.labels[nearest]).argmax()
+        own = np.sort(distances[index.labels == label])
+        symbol, own_distances = index.query(query)
+        assert symbol == index.symbols[label]
+        assert np.allclose(own_distances,
+                           own[:symbolindex.VERIFICATION_NEIGHBORS])
+
+
+def test_query_winner_missing_among_voters():
+    """Test the distances of the winner with too few elements near"""
+    # Every symbol gets one vote, so the tie goes to the first one.
+    features = {symbol: np.array([[distance, 0.0], [0.0, 100.0]])
+                for symbol, distance in zip('abcde', [5.0, 1.0, 2.0, 3.0,
+                                                      4.0])}
+    index = symbolindex.SymbolIndex(features)
+    symbol, distances = index.query(np.array([0.0, 0.0]))
+    assert symbol == 'a'
+    assert np.allclose(distances, [5.0, 100.0])
+
+
+def test_query_with_cascade():
+    """Test if the cascade finds the same symbols as the full features"""
+    generator = np.random.RandomState(3)
+    centers, pyramids = _make_matrices(generator, ['a', 'b', 'c'], 200, 150)
+    feature_matrices, coarse_matrices = _split_levels(pyramids)
+    index = symbolindex.SymbolIndex(feature_matrices)
+    cascade = symbolindex.SymbolIndex(feature_matrices, coarse_matrices)
+    assert cascade.levels == featureextractor.PYRAMID_LEVELS
+
+    for center in centers:
+        query = center + generator.normal(0, 150, len(center))
+        pyramid = {level: query[:4 * level - 1]
+                   for level in featureextractor.PYRAMID_LEVELS}
+        symbol, distances = index.query(query)
+        cascade_symbol, cascade_distances = cascade.query(query, pyramid)
+        assert cascade_symbol == symbol
+        assert np.allclose(cascade_distances, distances)
+
+
+def test_brute_force_kneighbors():
+    """Test if the brute force finds the nearest like the ball tree"""
+    generator = np.random.RandomState(5)
+    samples = generator.normal(0, 100, (60, 7))
+    queries = generator.normal(0, 100, (4, 7))
+    distances, rows = symbolindex.brute_force_kneighbors(samples, queries, 3)
+    expected_distances, expected_rows = \
+        NearestNeighbors(algorithm='ball_tree').fit(samples)\
+        .kneighbors(queries, 3)
+    assert (rows == expected_rows).all()
+    assert np.allclose(distances, expected_distances)
+
+
+def test_backends(monkeypatch):
+    """Test if the backend follows the size and gives the same results"""
+    generator = np.random.RandomState(9)
+    centers, pyramids = _make_matrices(generator, ['a', 'b'], 30, 150)
+    feature_matrices, coarse_matrices = _split_levels(pyramids)
+    monkeypatch.setattr(symbolindex, 'BRUTE_FORCE_MAX_SAMPLES', 60)
+    brute = symbolindex.SymbolIndex(feature_matrices, coarse_matrices)
+    assert brute.backend == symbolindex.BACKEND_BRUTE_FORCE
+    assert brute.tree is None
+    monkeypatch.setattr(symbolindex, 'BRUTE_FORCE_MAX_SAMPLES', 59)
+    tree = symbolindex.SymbolIndex(feature_matrices, coarse_matrices)
+    assert tree.backend == symbolindex.BACKEND_BALL_TREE
+
+    assert brute.get_mean_latency() is None
+    for center in centers:
+        query = center + generator.normal(0, 150, len(center))
+        pyramid = {level: query[:4 * level - 1]
+                   for level in featureextractor.PYRAMID_LEVELS}
+        symbol, distances = brute.query(query, pyramid)
+        tree_symbol, tree_distances = tree.query(query, pyramid)
+        assert symbol == tree_symbol
+        assert np.allclose(distances, tree_distances)
+    assert brute.query_count == len(centers)
+    assert brute.get_mean_latency() > 0
+
+
+def test_filter_candidates():
+    """Test if the envelopes rule out the symbols and narrow the query"""
+    features = {'a': np.array([[0.0, 0.0], [0.0, 1.0]]),
+                'b': np.array([[0.0, 0.5], [9.0, 9.0]])}
+    statistics = {'a': np.array([[10, 0, 100, 1.0], [20, 0, 150, 1.5]]),
+                  'b': np.array([[40, 1, 400, 0.3], [40, 2, 500, 0.4]])}
+    index = symbolindex.SymbolIndex(features, statistics=statistics)
+
+    assert list(index.filter_candidates([15, 0, 120, 1.2])) == [0]
+    assert index.filter_candidates([30, 1, 250, 0.6]) is None
+    assert list(index.filter_candidates([500, 9, 9000, 50])) == []
+    assert index.filter_count == 3
+    assert index.rejection_count == 1
+
+    # The nearest element belongs to b but only a is searched.
+    symbol, distances = index.query(np.array([0.0, 0.5]),
+                                    candidates=np.array([0]))
+    assert symbol == 'a'
+    assert np.allclose(distances, [0.5, 0.5])
+    symbol, distances = index.query(np.array([0.0, 0.5]),
+                                    candidates=np.array([1]))
+    assert symbol == 'b'
+    assert distances[0] == 0
+
+
+def _get_curve_statistics(curves):
+    """Return the statistics of the curves given by their coordinates."""
+    offsets = np.cumsum([0] + [len(x_values) for x_values, _ in curves])
+    pen_up = np.zeros(offsets[-1], dtype=bool)
+    pen_up[offsets[1:] - 1] = True
+    strokes = featureextractor.PackedStrokes(
+        np.concatenate([x_values for x_values, _ in curves]),
+        np.concatenate([y_values for _, y_values in curves]),
+        pen_up, offsets)
+    return featureextractor.get_statistics_batch(strokes)
+
+
+def test_filter_candidates_scaled():
+    """Test if the envelopes keep the symbols drawn smaller or larger"""
+    generator = np.random.RandomState(5)
+    steps = np.arange(60) * 10.0
+
+    def circle(radius, density=1):
+        dense_angles = np.arange(80 * density) / (12.0 * density)
+        noise = generator.normal(0, radius / 75, (2, len(dense_angles)))
+        return (1000 + radius * np.cos(dense_angles) + noise[0],
+                1000 + radius * np.sin(dense_angles) + noise[1])
+
+    def line(scale):
+        noise = generator.normal(0, 3 * scale, (2, len(steps)))
+        return (100 + scale * steps + noise[0], 400 + noise[1])
+
+    features = {'circle': np.zeros((8, 2)), 'line': np.ones((8, 2))}
+    statistics = {
+        'circle': _get_curve_statistics([circle(300) for _ in range(8)]),
+        'line': _get_curve_statistics([line(1) for _ in range(8)])}
+    index = symbolindex.SymbolIndex(features, statistics=statistics)
+
+    for radius in [100, 150, 600]:
+        assert list(index.filter_candidates(
+            _get_curve_statistics([circle(radius)])[0])) == [0]
+    # Neither the speed of drawing nor the sampling rate matters.
+    for density in [0.25, 4]:
+        assert list(index.filter_candidates(
+            _get_curve_statistics([circle(300, density)])[0])) == [0]
+    assert list(index.filter_candidates(
+        _get_curve_statistics([line(0.3)])[0])) == [1]
+    assert index.rejection_count == 0
+
+
+def test_query_many():
+    """Test if the batched queries give the same results as single ones"""
+    generator = np.random.RandomState(11)
+    centers, pyramids = _make_matrices(generator, ['a', 'b', 'c'], 40, 150)
+    feature_matrices, coarse_matrices = _split_levels(pyramids)
+    queries = np.array([center + generator.normal(0, 150, len(center))
+                        for center in centers for _ in range(3)])
+    coarse_queries = {level: queries[:, :4 * level - 1]
+                      for level in featureextractor.PYRAMID_LEVELS[:-1]}
+    for backend in [symbolindex.BACKEND_BRUTE_FORCE,
+                    symbolindex.BACKEND_BALL_TREE,
+                    symbolindex.BACKEND_FOREST]:
+        for coarse in [None, coarse_matrices]:
+            index = symbolindex.SymbolIndex(feature_matrices, coarse,
+                                            backend)
+            symbols, distances = index.query_many(queries, coarse_queries)
+            assert index.query_count == len(queries)
+            for row, query in enumerate(queries):
+                pyramid = {level: vector[row]
+                           for level, vector in coarse_queries.items()}
+                symbol, own_distances = index.query(query, pyramid)
+                assert symbols[row] == symbol
+                assert np.allclose(distances[row], own_distances)
+
+
+def test_insert_and_remove_symbol():
+    """Test if the updated index is like the one built from scratch"""
+    generator = np.random.RandomState(15)
+    _, pyramids = _make_matrices(generator, ['a', 'b', 'c'], 20, 150)
+    feature_matrices, coarse_matrices = _split_levels(pyramids)
+    statistics = {symbol: generator.uniform(1, 100, (20, 4))
+                  for symbol in 'abc'}
+
+    def build(symbols):
+        return symbolindex.SymbolIndex(
+            {symbol: feature_matrices[symbol] for symbol in symbols},
+            {level: {symbol: matrices[symbol] for symbol in symbols}
+             for level, matrices in coarse_matrices.items()},
+            symbolindex.BACKEND_BALL_TREE,
+            {symbol: statistics[symbol] for symbol in symbols})
+
+    def assert_same(index, expected):
+        assert index.symbols == expected.symbols
+        assert (index.labels == expected.labels).all()
+        assert (index.offsets == expected.offsets).all()
+        assert (index.features == expected.features).all()
+        for level, matrix in expected.coarse_features.items():
+            assert (index.coarse_features[level] == matrix).all()
+        assert np.allclose(index.envelopes, expected.envelopes)
+        query = expected.features[7] + 1
+        pyramid = {level: query[:4 * level - 1]
+                   for level in featureextractor.PYRAMID_LEVELS}
+        symbol, distances = index.query(query, pyramid)
+        expected_symbol, expected_distances = expected.query(query, pyramid)
+        assert symbol == expected_symbol
+        assert np.allclose(distances, expected_distances)
+
+    index = build('ac')
+    index.insert_symbol('b', feature_matrices['b'],
+                        {level: matrices['b']
+                         for level, matrices in coarse_matrices.items()},
+                        statistics['b'])
+    assert_same(index, build('abc'))
+
+    # The old training elements of a symbol are replaced.
+    feature_matrices['a'] = feature_matrices['a'][:5]
+    statistics['a'] = statistics['a'][:5]
+    for matrices in coarse_matrices.values():
+        matrices['a'] = matrices['a'][:5]
+    index.insert_symbol('a', feature_matrices['a'],
+                        {level: matrices['a']
+                         for level, matrices in coarse_matrices.items()},
+                        statistics['a'])
+    assert_same(index, build('abc'))
+
+    index.remove_symbol('b')
+    index.remove_symbol('x')
+    assert_same(index, build('ac'))
+
+
+def test_splice_backend(monkeypatch):
+    """Test if the tree is spliced rather than built up to the fraction"""
+    generator = np.random.RandomState(16)
+    centers, pyramids = _make_matrices(generator, 'abcdefgh', 20, 150)
+    feature_matrices, _ = _split_levels(pyramids)
+    query = centers[1] + generator.normal(0, 150, len(centers[1]))
+    for backend in [symbolindex.BACKEND_BALL_TREE,
+                    symbolindex.BACKEND_FOREST]:
+        monkeypatch.setattr(symbolindex, 'SPLICE_REBUILD_FRACTION', 0.3)
+        index = symbolindex.SymbolIndex(
+            {symbol: feature_matrices[symbol] for symbol in 'acdefgh'},
+            None, backend)
+        tree = index.tree
+        index.insert_symbol('b', feature_matrices['b'])
+        assert index.tree is tree
+        assert tree.spliced == 20
+        assert tree.samples is index.searched
+        manifest, arrays = index.get_store_data()
+        index = symbolindex.SymbolIndex.from_store_data(manifest, arrays)
+        index.remove_symbol('h')
+        assert index.tree.spliced == 40
+        expected = symbolindex.SymbolIndex(
+            {symbol: feature_matrices[symbol] for symbol in 'abcdefg'},
+            None, backend)
+        assert index.query(query)[0] == expected.query(query)[0]
+        # The tree is built again past the fraction of the rows.
+        index.remove_symbol('g')
+        assert index.tree.spliced == 0
+        monkeypatch.setattr(symbolindex, 'SPLICE_REBUILD_FRACTION', 0)
+        index.insert_symbol('g', feature_matrices['g'])
+        assert index.tree.spliced == 0
+
+    # A tree is built once the library is too big for the brute force.
+    monkeypatch.setattr(symbolindex, 'SPLICE_REBUILD_FRACTION', 1)
+    monkeypatch.setattr(symbolindex, 'BRUTE_FORCE_MAX_SAMPLES', 150)
+    index = symbolindex.SymbolIndex(
+        {symbol: feature_matrices[symbol] for symbol in 'abcdefg'})
+    assert index.tree is None
+    index.insert_symbol('h', feature_matrices['h'])
+    assert index.backend == symbolindex.BACKEND_BALL_TREE
+    assert index.tree.spliced == 0
+    index.remove_symbol('h')
+    assert index.tree is None
+
+
+def test_store_data():
+    """Test if the index made of the stored data answers the same"""
+    generator = np.random.RandomState(17)
+    centers, pyramids = _make_matrices(generator, ['a', 'b'], 20, 150)
+    feature_matrices, coarse_matrices = _split_levels(pyramids)
+    statistics = {symbol: generator.uniform(1, 100, (20, 4))
+                  for symbol in 'ab'}
+    index = symbolindex.SymbolIndex(feature_matrices, coarse_matrices,
+                                    symbolindex.BACKEND_FOREST, statistics)
+    manifest, arrays = index.get_store_data()
+    assert all(isinstance(array, np.ndarray) for array in arrays.values())
+    loaded = symbolindex.SymbolIndex.from_store_data(manifest, arrays)
+
+    # The stored forest is used as it is.
+    assert loaded.tree.directions is arrays['index_forest_directions']
+    assert loaded.tree.depth == index.tree.depth
+    assert loaded.symbols == index.symbols
+    assert loaded.levels == index.levels
+    assert loaded.backend == symbolindex.BACKEND_FOREST
+    assert (loaded.offsets == index.offsets).all()
+    assert (loaded.envelopes == index.envelopes).all()
+    # The envelopes of the statistics of another version are left out.
+    manifest['extractor_version'] -= 1
+    assert symbolindex.SymbolIndex.from_store_data(
+        manifest, arrays).envelopes is None
+    for center in centers:
+        query = center + generator.normal(0, 150, len(center))
+        pyramid = {level: query[:4 * level - 1]
+                   for level in featureextractor.PYRAMID_LEVELS}
+        symbol, distances = index.query(query, pyramid)
+        loaded_symbol, loaded_distances = loaded.query(query, pyramid)
+        assert loaded_symbol == symbol
+        assert np.allclose(loaded_distances, distances)
+
+    # So is the ball tree.
+    index = symbolindex.SymbolIndex(feature_matrices, coarse_matrices,
+                                    symbolindex.BACKEND_BALL_TREE)
+    manifest, arrays = index.get_store_data()
+    loaded = symbolindex.SymbolIndex.from_store_data(manifest, arrays)
+    assert loaded.tree.centers is arrays['index_ball_tree_centers']
+    query = centers[0] + generator.normal(0, 150, len(centers[0]))
+    pyramid = {level: query[:4 * level - 1]
+               for level in featureextractor.PYRAMID_LEVELS}
+    assert loaded.query(query, pyramid)[0] == index.query(query, pyramid)[0]
+
+    # The index is not used with other numbers of the neighbours.
+    manifest['neighbors'] += 1
+    with pytest.raises(ValueError):
+        symbolindex.SymbolIndex.from_store_data(manifest, arrays)
+
+
+def test_shards():
+    """Test if the worker processes find the same symbols as one process"""
+    generator = np.random.RandomState(13)
+    centers, pyramids = _make_matrices(generator, ['a', 'b', 'c', 'd'], 30,
+                                       150)
+    feature_matrices, coarse_matrices = _split_levels(pyramids)
+    queries = np.array([center + generator.normal(0, 150, len(center))
+                        for center in centers for _ in range(3)])
+    index = symbolindex.SymbolIndex(feature_matrices)
+    sharded = symbolindex.SymbolIndex(feature_matrices)
+    sharded.start_shards(3)
+    try:
+        assert [shard[2:] for shard in sharded.shards] == \
+            [(0, 1), (1, 3), (3, 4)]
+        for candidates in [None, np.array([0, 3]), np.array([2, 3])]:
+            symbols, distances = index.query_many(queries,
+                                                  candidates=candidates)
+            sharded_symbols, sharded_distances = sharded.query_many(
+                queries, candidates=candidates)
+            assert sharded_symbols == symbols
+            assert np.allclose(sharded_distances, distances)
+        assert pickle.loads(pickle.dumps(sharded)).shards == []
+    finally:
+        sharded.stop_shards()
+    assert sharded.shards == []
+
+    cascade = symbolindex.SymbolIndex(feature_matrices, coarse_matrices)
+    cascade.start_shards(2)
+    try:
+        pyramid = {level: queries[0, :4 * level - 1]
+                   for level in featureextractor.PYRAMID_LEVELS}
+        symbol, _ = cascade.query(queries[0], pyramid)
+        assert symbol == 'a'
+    finally:
+        cascade.stop_shards()
@@ -4,9 +4,19 @@
 It receives signals from the listener thread using a queue and then
 interprets the data and undertakes learning of a new symbol or orders the
 execution of a command related to a recoginsed symbol.
+
+The recognition and the execution are done by a single worker thread, so the
+strokes are interpreted in the order they were drawn while the application
+thread keeps reading the queue. When the input goes quiet, the stroke is
+classified speculatively, before the break confirms it is finished. The
+result is used if nothing has been added to the stroke since.
 """
 
+from concurrent.futures import ThreadPoolExecutor
+import sys
 import time
+import traceback
+
 from classifier import classifier as classifier_module
 from executor import executor
 from signalcollection import signalcollection
@@ -31,14 +41,19 @@ def application_thread(queue, condition, learning_mode=False, training_size=0,
             that the user is asked to draw.
         system_bitness (int): A bitness of the system. The only legal values
             are {None, 32, 64}. If the value is 32 or 64 then set of hardcoded
-            symbols (with respect to the provided bitness) will be
-            recogniezed instead of the user defined symbols.
+            symbols (the same for both values) will be recogniezed instead
+            of the user defined symbols.
         symbol_name (str): A name of the symbol provided by the user with
             a command line option.
 
     Variables:
         collection (SignalCollection): A collection of signals sent by
             the listener thread. Mostly touchpad events but not necessarily.
+        interpreter (ThreadPoolExecutor): The worker the strokes are
+            interpreted in when not learning.
+        speculation (tuple): The version of the collection (see
+            SignalCollection) and the future of its speculative
+            classification, or None.
 
     """
     classifier = classifier_module.Classifier(system_bitness=system_bitness)
@@ -53,16 +68,25 @@ def application_thread(queue, condition, learning_mode=False, training_size=0,
         print("Use your touchpad as usual. Have a nice day!")
 
     collection = signalcollection.SignalCollection()
+    interpreter = ThreadPoolExecutor(max_workers=1)
+    speculation = None
 
     while True:
+        timeout = collection.get_time_when_old_enough(time.time())
+        speculating = not learning_mode and \
+            (speculation is None or speculation[0] != collection.version)
+        if speculating and timeout is not None:
+            timeout = min(timeout, collection.get_time_when_quiet(time.time()))
         condition.acquire()
-        condition.wait(collection.get_time_when_old_enough(time.time()))
+        condition.wait(timeout)
         condition.release()
 
         if not collection.is_recent_enough(time.time()):
-            send_points_to_interpreter(collection.as_list(), learning_mode,
-                                       classifier)
-            collection.reset()
+            interpret_collection(collection, learning_mode, classifier,
+                                 interpreter, speculation)
+            speculation = None
+        elif speculating and collection.is_quiet(time.time()):
+            speculation = speculate(collection, classifier, interpreter)
 
         if queue.empty():
             continue
@@ -70,18 +94,100 @@ def application_thread(queue, condition, learning_mode=False, training_size=0,
         signal = queue.get()
 
         if signal.is_stop_signal():
-            send_points_to_interpreter(collection.as_list(), learning_mode,
-                                       classifier)
-            collection.reset()
+            interpret_collection(collection, learning_mode, classifier,
+                                 interpreter, speculation)
+            speculation = None
         elif signal.is_proper_signal_of_point() \
                 or signal.is_raising_finger_signal():
             collection.add_and_maintain(signal)
+            if speculation is not None and speculation[1] is not None:
+                # The stroke goes on, so the guess is useless.
+                speculation[1].cancel()
+            speculation = None
+
+
+def speculate(collection, classifier, interpreter):
+    """Classify the collected stroke before it is known to be finished.
+
+    The stroke is submitted to the interpreter, which classifies it before
+    anything submitted later, so the result is ready when the break
+    confirms the stroke is finished.
+
+    Args:
+        collection (SignalCollection): The collected signals.
+        classifier (Classifier): The Classifier class object.
+        interpreter (ThreadPoolExecutor): The single worker thread.
+
+    Returns:
+        Tuple of the version of the collection and the future of the
+        symbol (see Classifier.classify). The future is None if there are
+        no points to classify.
+    """
+    # The slice keeps the signals collected so far even if more come.
+    stroke = collection.as_stroke()[:]
+    if not stroke.proper_points().any():
+        return collection.version, None
+    future = interpreter.submit(classifier.classify, stroke,
+                                collection.get_feature_pyramid(),
+                                collection.get_statistics())
+    return collection.version, future
+
 
+def interpret_collection(collection, learning_mode, classifier, interpreter,
+                         speculation=None):
+    """Hand the collected stroke over to the interpreter and reset it.
 
-def send_points_to_interpreter(signal_list, learning_mode, classifier):
-    """Interpret the signals from the signal list.
+    In the learning mode the stroke is added to the training set right
+    away, because the learning ends the application. Otherwise it is
+    submitted to the interpreter and the function returns at once. The
+    reset starts a new stroke, so the submitted one stays untouched.
 
-    It prints the first 10 signals from the signal_list. All of them are
+    Args:
+        collection (SignalCollection): The collected signals.
+        learning_mode (bool): Tells if it is a learning session or not.
+        classifier (Classifier): The Classifier class object. It is used by
+            the interpreter only when not learning.
+        interpreter (ThreadPoolExecutor): The single worker thread.
+        speculation (tuple): The speculative classification (see
+            speculate). Its result is used if it is of the current version
+            of the collection.
+    """
+    stroke = collection.as_stroke()
+    if learning_mode:
+        send_points_to_interpreter(stroke, learning_mode, classifier,
+                                   collection.get_feature_pyramid())
+    elif stroke.proper_points().any():
+        classified = None
+        feature_pyramid = None
+        statistics = None
+        if speculation is not None and speculation[0] == collection.version:
+            classified = speculation[1]
+        else:
+            feature_pyramid = collection.get_feature_pyramid()
+            statistics = collection.get_statistics()
+        future = interpreter.submit(send_points_to_interpreter, stroke,
+                                    learning_mode, classifier,
+                                    feature_pyramid, classified, statistics)
+        future.add_done_callback(_report_failure)
+    collection.reset()
+
+
+def _report_failure(future):
+    """Print the exception the interpretation of a stroke failed with."""
+    exception = future.exception()
+    if exception is not None:
+        print("application.py: error: interpretation failed",
+              file=sys.stderr)
+        traceback.print_exception(type(exception), exception,
+                                  exception.__traceback__)
+
+
+def send_points_to_interpreter(stroke, learning_mode, classifier,
+                               feature_pyramid=None, classified=None,
+                               statistics=None):
+    """Interpret the signals from the stroke.
+
+    It prints the first 10 signals from the stroke. All of them are
     points.
 
     If the symbol has been recognized by the classifier module
@@ -89,37 +195,37 @@ def send_points_to_interpreter(signal_list, learning_mode, classifier):
     appropriate command.
 
     Args:
-        signal_list (list): List of signals captured from the touchpad.
+        stroke (Stroke): The signals captured from the touchpad.
         learning_mode (bool): Tells if it is a learning session or not.
         classifier (Classifier): The Classifier class object.
+        feature_pyramid (dict): The features of the stroke at several
+            resolutions if they are already known.
+        classified (Future): The symbol of the stroke if it has already
+            been classified (see speculate).
+        statistics (numpy.ndarray): The statistics of the stroke if they
+            are already known.
 
     """
-    if not signal_list:
-        return
-    point_on_the_list = False
-    for one_signal in signal_list:
-        if one_signal.is_proper_signal_of_point():
-            point_on_the_list = True
-    if not point_on_the_list:
+    if not stroke.proper_points().any():
         return
 
     print()
     print("New portion of events:")
-    counter = 0
-    length = len(signal_list)
-    for one_signal in signal_list:
-        counter += 1
-        if counter == 11:
-            print("...")
-            break
-        print("Event #", counter, "\tout of", length, "in the list. x:",
-              one_signal.get_x(), "y:", one_signal.get_y())
+    length = len(stroke)
+    for index in range(min(length, 10)):
+        print("Event #", index + 1, "\tout of", length, "in the list. x:",
+              stroke.get_x(index), "y:", stroke.get_y(index))
+    if length > 10:
+        print("...")
     print()
 
     if learning_mode:
-        classifier.add_to_training_set(signal_list)
+        classifier.add_to_training_set(stroke)
     else:
-        item = classifier.classify(signal_list)
+        if classified is not None:
+            item = classified.result()
+        else:
+            item = classifier.classify(stroke, feature_pyramid, statistics)
         if item is not None:
             print("execution")
             executor.execute(item)
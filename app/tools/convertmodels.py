@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This converts the pickled models of the older versions to the model store.
+
+The older versions kept the training elements of the symbols only in the
+nearest neighbours models of sklearn (nn-model_<symbol>.dat), pickled by the
+version of sklearn of the time, which the later ones cannot read. The
+classifier reads the model store (classifier-store.npz) alone now. This
+reads the training elements out of the pickles without sklearn and saves
+them in one model store with the symbol table and the distance tolerances,
+computed again from all the training elements of every symbol. The models
+of several directories are merged, e.g. the ones of the hardcoded symbols
+learnt on the 32-bit and on the 64-bit machines.
+
+The models hold no strokes, so the index of the store has neither the
+envelopes of the statistics of the symbols nor the cascade. The user defined
+symbols come with their training sets, so learning them again is better.
+
+Run it from the app/ directory (see matrixanalyser.py for the reason):
+
+    ./tools/convertmodels.py [--output OUTPUT] DIRECTORY [DIRECTORY ...]
+
+The store of the hardcoded symbols has been made with:
+
+    ./tools/convertmodels.py --output classifier/data/hardcoded \\
+        classifier/data/32 classifier/data/64
+"""
+
+import argparse
+import contextlib
+import os
+import pickle
+import sys
+
+import numpy as np
+
+sys.path.append(".")
+
+from classifier import classifier as classifier_module
+from classifier import symbolindex
+
+
+class LegacyObject:
+    """Stands for an object of sklearn in a pickle, keeping its state."""
+
+    def __init__(self, *args):
+        """Constructor. Keeps the arguments of the pickle."""
+        self.args = args
+        self.state = None
+
+    def __setstate__(self, state):
+        """Keep the state of the pickle."""
+        self.state = state
+
+
+class LegacyUnpickler(pickle.Unpickler):
+    """Unpickler of the models of the older versions, without sklearn."""
+
+    def find_class(self, module, name):
+        """Return LegacyObject for the classes of sklearn."""
+        if module.split('.')[0] == 'sklearn':
+            return LegacyObject
+        return super().find_class(module, name)
+
+
+def get_classifier(directory):
+    """Return the classifier of the files of the directory."""
+    classifier = classifier_module.Classifier()
+    classifier.files = {name: os.path.join(directory, name)
+                        for name in classifier.files}
+    classifier.symbol_list, classifier.inactive_symbols, \
+        classifier.tolerance_distances = classifier._load_symbol_table()
+    return classifier
+
+
+def load_training_elements(directory):
+    """Load the training elements of the models of the directory.
+
+    Returns:
+        Tuple of the lists of the active and of the inactive symbols and of
+        the dictionary mapping the symbols to the matrices of the feature
+        vectors of their training elements.
+    """
+    classifier = get_classifier(directory)
+    feature_matrices = {}
+    for symbol in classifier.symbol_list + classifier.inactive_symbols:
+        model_path = classifier_module.Classifier._get_file_path(
+            classifier.files[classifier_module.MODEL_FILE], symbol)
+        with open(model_path, 'rb') as handle:
+            model = LegacyUnpickler(handle, encoding='latin1').load()
+        feature_matrices[symbol] = np.asarray(model.state['_fit_X'],
+                                              dtype=np.float64)
+    return (classifier.symbol_list, classifier.inactive_symbols,
+            feature_matrices)
+
+
+def convert(directories, output):
+    """Save the models of the directories in the model store of the output.
+
+    Returns:
+        Dictionary mapping the symbols to the matrices of the feature
+        vectors of their training elements.
+    """
+    classifier = get_classifier(output)
+    classifier.symbol_list = []
+    classifier.inactive_symbols = []
+    classifier.tolerance_distances = {}
+    matrices = {}
+    for directory in directories:
+        active, inactive, feature_matrices = \
+            load_training_elements(directory)
+        classifier.symbol_list += [symbol for symbol in active
+                                   if symbol not in classifier.symbol_list]
+        classifier.inactive_symbols += inactive
+        for symbol, matrix in feature_matrices.items():
+            matrices.setdefault(symbol, []).append(matrix)
+    classifier.inactive_symbols = [
+        symbol for index, symbol in enumerate(classifier.inactive_symbols)
+        if symbol not in classifier.symbol_list and
+        symbol not in classifier.inactive_symbols[:index]]
+    feature_matrices = {symbol: np.concatenate(matrices[symbol])
+                        for symbol in matrices}
+
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        for symbol, matrix in feature_matrices.items():
+            classifier._compute_tolerance_distance(matrix, symbol)
+    symbol_index = None
+    if classifier.symbol_list:
+        symbol_index = symbolindex.SymbolIndex(
+            {symbol: feature_matrices[symbol].astype(
+                classifier_module.MODEL_DTYPE)
+             for symbol in classifier.symbol_list},
+            None, classifier_module.INDEX_BACKEND)
+    os.makedirs(output, exist_ok=True)
+    classifier._save_model_store(symbol_index)
+    for symbol in classifier.symbol_list + classifier.inactive_symbols:
+        print("%-24s %6d training elements, tolerance %.6f" % (
+            symbol, len(feature_matrices[symbol]),
+            classifier._get_tolerance_distance(symbol)))
+    return feature_matrices
+
+
+def _get_configured_parser():
+    """Configure the commandline arguments parser."""
+    description = 'Convert the pickled models to the model store.'
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(dest='directories', metavar='DIRECTORY', nargs='+',
+                        help='a directory with the pickled models')
+    parser.add_argument('-o', '--output', dest='output', default=None,
+                        help='the directory of the model store (the first '
+                        'one of the models by default)')
+    return parser
+
+
+def main():
+    """The main function."""
+    args = _get_configured_parser().parse_args()
+    output = args.output
+    if output is None:
+        output = args.directories[0]
+    feature_matrices = convert(args.directories, output)
+    print("%d symbols converted" % len(feature_matrices))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This converts the pickled training sets to the columnar format.
+
+The older versions pickled every training set as a list of lists of
+TouchpadSignal objects (training-set_<symbol>.dat). The classifier keeps
+reading them, but every load rebuilds all the objects. This writes each one
+as the arrays of a StrokeSet (training-set_<symbol>.npz) once and removes
+the pickle. The features cached for the old files are extracted again on
+the next learning.
+
+Run it from the app/ directory (see matrixanalyser.py for the reason):
+
+    ./tools/converttrainingsets.py [--bitness {32,64}]
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+sys.path.append(".")
+
+from classifier import classifier as classifier_module
+from stroke import stroke as stroke_module
+
+
+def convert(system_bitness):
+    """Convert the pickled training sets of the classifier.
+
+    Returns:
+        The number of the converted training sets.
+    """
+    classifier = classifier_module.Classifier(system_bitness)
+    template = classifier.files[classifier_module.LEGACY_TRAINING_SET_FILE]
+    prefix, suffix = classifier_module.Classifier.\
+        _get_file_path(template, '\0').split('\0')
+    converted = 0
+    for legacy_path in sorted(glob.glob(glob.escape(prefix) + '*' +
+                                        glob.escape(suffix))):
+        symbol = legacy_path[len(prefix):len(legacy_path) - len(suffix)]
+        legacy_size = os.path.getsize(legacy_path)
+        training_set = stroke_module.StrokeSet.from_strokes(
+            classifier_module.load_training_set_file(legacy_path))
+        classifier._write_training_set_to_file(symbol, training_set)
+        size = os.path.getsize(classifier_module.Classifier._get_file_path(
+            classifier.files[classifier_module.TRAINING_SET_FILE], symbol))
+        print("%-24s %6d strokes %10d -> %10d bytes" % (
+            symbol, len(training_set), legacy_size, size))
+        converted += 1
+    return converted
+
+
+def _get_configured_parser():
+    """Configure the commandline arguments parser."""
+    description = 'Convert the pickled training sets to the columnar format.'
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-b', '--bitness', dest='bitness', default=None,
+                        choices=[32, 64], type=int,
+                        help='convert the hardcoded symbols of the given '
+                        'bitness instead of the user defined ones')
+    return parser
+
+
+def main():
+    """The main function."""
+    args = _get_configured_parser().parse_args()
+    converted = convert(args.bitness)
+    print("%d training sets converted" % converted)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This is an offline evaluation of the classifier on the stored symbols.
+
+It splits the training sets of the active user defined symbols into folds
+(k-fold or leave-one-out). For every fold the classifier is learnt in a
+temporary directory from the other folds, in the same way as by the
+learning mode, and the held out strokes are classified. The folds are run in
+parallel worker processes. The stored files are never touched.
+
+It prints the confusion matrix, the false accept and the false reject rates
+of every symbol, the counts of the pre-filter and the latency percentiles of
+the stages of classify. A false accept is a stroke classified as another
+symbol, a false reject is a stroke not classified at all. The pre-filter
+rules out the symbols by the statistics of the stroke (see
+SymbolIndex.filter_candidates); its false rejects are the strokes whose own
+symbol was ruled out.
+
+No touchpad is needed. Run it from the app/ directory (see matrixanalyser.py
+for the reason):
+
+    ./tools/crossvalidation.py [--folds FOLDS | --leave-one-out]
+                               [--jobs JOBS] [--seed SEED]
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.append(".")
+
+from classifier import classifier as classifier_module
+from classifier import featureextractor
+
+PERCENTILES = [50, 90, 99]
+PREFILTER_COUNTS = ['filtered', 'rejected', 'false_rejects']
+REJECTED = '(none)'
+STAGES = ['statistics', 'features', 'query', 'classify']
+
+
+def load_training_sets():
+    """Load the training sets of the active user defined symbols.
+
+    The hardcoded symbols come without their training sets, so they cannot
+    be evaluated.
+
+    Returns:
+        Dictionary mapping the symbols to their training sets. The symbols
+        without a training set file are left out.
+    """
+    classifier = classifier_module.Classifier()
+    training_sets = {}
+    for symbol in classifier.symbol_list:
+        training_set = classifier._load_training_set(symbol, True)
+        if training_set:
+            training_sets[symbol] = training_set
+    return training_sets
+
+
+def make_folds(training_sets, number_of_folds, seed):
+    """Split the training elements into folds.
+
+    Every symbol is spread evenly over the folds. Without number_of_folds
+    every training element is a fold of its own (leave-one-out).
+
+    Returns:
+        List of the folds, each one a list of the (symbol, index) pairs of
+        the held out training elements.
+    """
+    if number_of_folds is None:
+        return [[(symbol, index)] for symbol in sorted(training_sets)
+                for index in range(len(training_sets[symbol]))]
+    generator = random.Random(seed)
+    folds = [[] for _ in range(number_of_folds)]
+    position = 0
+    for symbol in sorted(training_sets):
+        indices = list(range(len(training_sets[symbol])))
+        generator.shuffle(indices)
+        for index in indices:
+            folds[position % number_of_folds].append((symbol, index))
+            position += 1
+    return [fold for fold in folds if fold]
+
+
+def measure_stages(classifier, strokes):
+    """Time the stages of classify one stroke at a time.
+
+    The stages are the statistics of the stroke with the ruling out of the
+    symbols, the feature extraction with the projection, the query of the
+    symbol index and the whole classify.
+
+    Returns:
+        Dictionary mapping the stages to the lists of latencies in seconds.
+    """
+    latencies = {stage: [] for stage in STAGES}
+    symbol_index = classifier._get_symbol_index()
+    if symbol_index is None:
+        return latencies
+    for stroke in strokes:
+        start = time.perf_counter()
+        candidates = symbol_index.filter_candidates(
+            featureextractor.get_statistics(stroke))
+        statistics_end = time.perf_counter()
+        feature_pyramid = featureextractor.get_feature_pyramid(
+            stroke, symbol_index.levels)
+        feature_vector = classifier._project(
+            feature_pyramid[featureextractor.NUMBER_OF_POINTS])
+        features_end = time.perf_counter()
+        if candidates is None or len(candidates):
+            symbol_index.query(feature_vector, feature_pyramid, candidates)
+        query_end = time.perf_counter()
+        classifier.classify(stroke)
+        classify_end = time.perf_counter()
+        latencies['statistics'].append(statistics_end - start)
+        latencies['features'].append(features_end - statistics_end)
+        latencies['query'].append(query_end - features_end)
+        latencies['classify'].append(classify_end - query_end)
+    return latencies
+
+
+def count_prefilter(classifier, held_out, strokes):
+    """Count the strokes ruled out by the statistics of the symbols.
+
+    The counters of the index are the ones of classify_many, which checks
+    every stroke once.
+
+    Returns:
+        Dictionary with the numbers of the checked strokes ('filtered'), of
+        the ones with every symbol ruled out ('rejected') and of the ones
+        with their own symbol ruled out ('false_rejects').
+    """
+    counts = dict.fromkeys(PREFILTER_COUNTS, 0)
+    symbol_index = classifier._get_symbol_index()
+    if symbol_index is None:
+        return counts
+    counts['filtered'] = symbol_index.filter_count
+    counts['rejected'] = symbol_index.rejection_count
+    statistics = featureextractor.get_statistics_batch(
+        featureextractor.pack_strokes(strokes))
+    inside = symbol_index.get_envelope_mask(statistics)
+    if inside is not None:
+        counts['false_rejects'] = sum(
+            1 for row, (symbol, _) in zip(inside, held_out)
+            if symbol in symbol_index.symbols and
+            not row[symbol_index.symbols.index(symbol)])
+    return counts
+
+
+def evaluate_fold(training_sets, held_out):
+    """Learn the classifier without the held out elements and test them.
+
+    It is run in a worker process. The output of the classifier is
+    suppressed.
+
+    Returns:
+        Tuple of the true symbols of the held out elements, the symbols
+        they were classified as (None if not classified), the dictionary
+        of the latencies of the stages (see measure_stages) and the one of
+        the counts of the pre-filter (see count_prefilter).
+    """
+    held_out_set = set(held_out)
+    directory = tempfile.mkdtemp(prefix='crossvalidation-')
+    try:
+        with open(os.devnull, 'w') as devnull, \
+                contextlib.redirect_stdout(devnull):
+            classifier = classifier_module.Classifier()
+            classifier.files = {name: os.path.join(directory, name)
+                                for name in classifier.files}
+            classifier.symbol_list = []
+            classifier.inactive_symbols = []
+            for symbol in sorted(training_sets):
+                classifier.training_set = [
+                    element for index, element
+                    in enumerate(training_sets[symbol])
+                    if (symbol, index) not in held_out_set]
+                if classifier.training_set:
+                    classifier._save_training_set(symbol)
+            classifier.training_set = []
+            classifier.learn(True)
+
+            strokes = [training_sets[symbol][index]
+                       for symbol, index in held_out]
+            found, _, accepted = classifier.classify_many(strokes)
+            counts = count_prefilter(classifier, held_out, strokes)
+            latencies = measure_stages(classifier, strokes)
+    finally:
+        shutil.rmtree(directory)
+    found = [symbol if is_accepted else None
+             for symbol, is_accepted in zip(found, accepted)]
+    return [symbol for symbol, _ in held_out], found, latencies, counts
+
+
+def print_confusion_matrix(symbols, true_symbols, found_symbols):
+    """Print the confusion matrix of the classification.
+
+    The rows are the true symbols, the columns the symbols they were
+    classified as.
+    """
+    columns = symbols + [None]
+    names = symbols + [REJECTED]
+    header = 'true\\found'
+    width = max(len(name) for name in names + [header]) + 1
+    print("%*s" % (width, header) +
+          "".join("%*s" % (width, name) for name in names))
+    for symbol in symbols:
+        counts = [sum(1 for true_symbol, found_symbol
+                      in zip(true_symbols, found_symbols)
+                      if true_symbol == symbol and found_symbol == column)
+                  for column in columns]
+        print("%*s" % (width, symbol) +
+              "".join("%*d" % (width, count) for count in counts))
+
+
+def print_rates(symbols, true_symbols, found_symbols):
+    """Print the accuracy and the false accept and reject rates."""
+    print("%-24s %6s %9s %9s %9s" % ('symbol', 'tests', 'accuracy', 'FAR',
+                                     'FRR'))
+    for symbol in symbols + [None]:
+        pairs = [(true_symbol, found_symbol) for true_symbol, found_symbol
+                 in zip(true_symbols, found_symbols)
+                 if symbol is None or true_symbol == symbol]
+        if not pairs:
+            continue
+        correct = sum(1 for true_symbol, found_symbol in pairs
+                      if found_symbol == true_symbol)
+        rejected = sum(1 for _, found_symbol in pairs if found_symbol is None)
+        print("%-24s %6d %8.1f%% %8.1f%% %8.1f%%" % (
+            'all' if symbol is None else symbol, len(pairs),
+            100.0 * correct / len(pairs),
+            100.0 * (len(pairs) - correct - rejected) / len(pairs),
+            100.0 * rejected / len(pairs)))
+
+
+def print_prefilter(counts):
+    """Print how many strokes the pre-filter rejected, rightly or not."""
+    filtered = max(counts['filtered'], 1)
+    print("pre-filter: %d strokes checked, %d with every symbol ruled out "
+          "(%.1f%%), %d with their own symbol ruled out (FRR %.1f%%)" % (
+              counts['filtered'], counts['rejected'],
+              100.0 * counts['rejected'] / filtered, counts['false_rejects'],
+              100.0 * counts['false_rejects'] / filtered))
+
+
+def print_latencies(latencies):
+    """Print the percentiles of the latencies of the stages."""
+    print("%-12s" % 'stage' + "".join(" %9s" % ('p%d us' % percentile)
+                                      for percentile in PERCENTILES))
+    for stage in STAGES:
+        if not latencies[stage]:
+            continue
+        values = np.percentile(latencies[stage], PERCENTILES) * 1e6
+        print("%-12s" % stage + "".join(" %9.1f" % value
+                                        for value in values))
+
+
+def run(number_of_folds, jobs, seed):
+    """Evaluate the classifier and print the results."""
+    training_sets = load_training_sets()
+    if not training_sets:
+        print("crossvalidation.py: error: there are no training sets",
+              file=sys.stderr)
+        sys.exit(1)
+    folds = make_folds(training_sets, number_of_folds, seed)
+    print("%d symbols, %d training elements, %d folds" % (
+        len(training_sets), sum(len(training_set) for training_set
+                                in training_sets.values()), len(folds)))
+
+    true_symbols = []
+    found_symbols = []
+    latencies = {stage: [] for stage in STAGES}
+    counts = dict.fromkeys(PREFILTER_COUNTS, 0)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(evaluate_fold, training_sets, fold)
+                   for fold in folds]
+        for future in futures:
+            fold_true, fold_found, fold_latencies, fold_counts = \
+                future.result()
+            true_symbols += fold_true
+            found_symbols += fold_found
+            for stage in STAGES:
+                latencies[stage] += fold_latencies[stage]
+            for name in PREFILTER_COUNTS:
+                counts[name] += fold_counts[name]
+
+    symbols = sorted(training_sets)
+    print()
+    print_confusion_matrix(symbols, true_symbols, found_symbols)
+    print()
+    print_rates(symbols, true_symbols, found_symbols)
+    print()
+    print_prefilter(counts)
+    print()
+    print_latencies(latencies)
+
+
+def _get_configured_parser():
+    """Configure the commandline arguments parser."""
+    description = 'Evaluate the classifier on the stored training sets.'
+    parser = argparse.ArgumentParser(description=description)
+    folds = parser.add_mutually_exclusive_group()
+    folds.add_argument('-k', '--folds', dest='folds', default=5,
+                       help='the number of folds (default: 5)', type=int)
+    folds.add_argument('-l', '--leave-one-out', dest='folds',
+                       action='store_const', const=None,
+                       help='hold out one training element at a time')
+    parser.add_argument('-j', '--jobs', dest='jobs', default=None,
+                        help='the number of worker processes (default: the '
+                        'number of processors)', type=int)
+    parser.add_argument('-s', '--seed', dest='seed', default=2016,
+                        help='the seed of the split into folds '
+                        '(default: 2016)', type=int)
+    return parser
+
+
+def main():
+    """The main function."""
+    args = _get_configured_parser().parse_args()
+    if args.folds is not None and args.folds < 2:
+        print("crossvalidation.py: error: at least 2 folds are needed",
+              file=sys.stderr)
+        sys.exit(1)
+    run(args.folds, args.jobs, args.seed)
+
+
+# The worker processes import this module, so it must not run by itself.
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This is a benchmark suite of the feature extractor.
+
+It generates deterministic synthetic strokes (lines, circles and glyphs made
+of a few strokes separated by raises of the finger) of 50 to
+MAX_NUMBER_OF_SIGNALS_IN_GROUP signals and times the featureextractor
+functions on them:
+
+    get_features, get_new_points, filter_points_from_signals,
+    create_normalized_curve
+
+For every stroke and function it reports the percentiles of the latency of
+a single call and the throughput in signals per second. The results may be
+saved as a baseline. The next runs are compared with the baseline and the
+benchmark fails if the median latency of any case grew by more than the
+threshold.
+
+With --adversarial it times the pen-up segmentation on groups with long
+runs of signals which are not points instead. The time per signal should
+stay the same as the groups grow.
+
+No touchpad is needed. Run it from the app/ directory (see matrixanalyser.py
+for the reason):
+
+    ./tools/featurebenchmark.py [--calls CALLS] [--threshold THRESHOLD]
+                                [--save-baseline] [--stroke] [--adversarial]
+"""
+
+import argparse
+import math
+import os
+import pickle
+import random
+import sys
+import time
+import timeit
+
+import numpy as np
+
+sys.path.append(".")
+
+from classifier import featureextractor
+from signalcollection import signalcollection
+from stroke import stroke as stroke_module
+
+BASELINE_PATH = './tools/data/featurebenchmark/'
+BASELINE_FILE = 'baseline.dat'
+STROKE_BASELINE_FILE = 'baseline-stroke.dat'
+
+SIZES = [50, 375, 750, 1500, signalcollection.MAX_NUMBER_OF_SIGNALS_IN_GROUP]
+PERCENTILES = [50, 90, 99]
+SEED = 2016
+
+
+class SyntheticSignal(object):
+    """A signal which imitates TouchpadSignal without touching the touchpad.
+
+    Attributes:
+        x_value (int): The x coordinate, -1 if the event was missing it.
+        y_value (int): The y coordinate, -1 if the event was missing it.
+        pressure (int): The pressure, 0 if the finger was raised.
+        time (float): The time of the event.
+    """
+
+    def __init__(self, x_value, y_value, pressure, time=0.0):
+        """Constructor."""
+        self.x_value = x_value
+        self.y_value = y_value
+        self.pressure = pressure
+        self.time = time
+
+    def get_x(self):
+        """Get the x value."""
+        return self.x_value
+
+    def get_y(self):
+        """Get the y value."""
+        return self.y_value
+
+    def get_pressure(self):
+        """Get the pressure."""
+        return self.pressure
+
+    def get_time(self):
+        """Get the time."""
+        return self.time
+
+    def is_raising_finger_signal(self):
+        """Check if the signal has pressure equal to 0."""
+        return self.pressure == 0
+
+    def is_proper_signal_of_point(self):
+        """Check if the signal has both x >= 0 and y >= 0."""
+        return self.x_value >= 0 and self.y_value >= 0
+
+
+def _point(number):
+    """Make a proper point lying on a spiral-like curve."""
+    return SyntheticSignal(1000 + (number * 37) % 400,
+                           1000 + (number * 53) % 300, 40)
+
+
+def _no_point():
+    """Make a signal which is neither a point nor a raise of the finger."""
+    return SyntheticSignal(-1, -1, 40)
+
+
+def _raise():
+    """Make a signal of raising the finger."""
+    return SyntheticSignal(-1, -1, 0)
+
+
+def _group_with_runs(size, run_length, ending):
+    """Make a group of points each followed by run_length non-points.
+
+    Args:
+        size (int): The number of signals in the group.
+        run_length (int): The number of non-points after every point.
+        ending (function): Makes the signal closing every run or None.
+    """
+    signals = []
+    number = 0
+    while len(signals) < size:
+        signals.append(_point(number))
+        number += 1
+        signals.extend(_no_point() for _ in range(run_length))
+        if ending is not None:
+            signals.append(ending())
+    return signals[:size]
+
+
+def get_adversarial_groups(size):
+    """Make the groups of signals the segmentation is benchmarked on.
+
+    Args:
+        size (int): The number of signals in every group.
+
+    Returns:
+        List of pairs: the name of the group and the list of signals.
+    """
+    return [
+        ('points only', [_point(number) for number in range(size)]),
+        ('two points far apart',
+         [_point(0)] + [_no_point() for _ in range(size - 2)] + [_point(1)]),
+        ('point, then a run of 10', _group_with_runs(size, 10, None)),
+        ('point, then a run of 100', _group_with_runs(size, 100, None)),
+        ('point, a run of 50, a raise', _group_with_runs(size, 50, _raise)),
+        ('point, a raise', _group_with_runs(size, 0, _raise)),
+    ]
+
+
+def _trace(size, position, generator):
+    """Make the signals of a finger following the curve.
+
+    Args:
+        size (int): The number of signals.
+        position (function): Maps a number from [0, 1] to the point of the
+            curve.
+        generator (Random): The source of the jitter of the touchpad.
+    """
+    signals = []
+    for number in range(size):
+        x_value, y_value = position(number / max(size - 1, 1))
+        signals.append(SyntheticSignal(
+            int(x_value) + generator.randint(-2, 2),
+            int(y_value) + generator.randint(-2, 2),
+            40 + generator.randint(-5, 5), number * 0.008))
+    return signals
+
+
+def _line(size, generator):
+    """Make a slanted line."""
+    return _trace(size, lambda t: (1200 + 2400 * t, 1500 + 1300 * t),
+                  generator)
+
+
+def _circle(size, generator):
+    """Make a circle."""
+    return _trace(size, lambda t: (3000 + 1000 * math.cos(2 * math.pi * t),
+                                   2500 + 1000 * math.sin(2 * math.pi * t)),
+                  generator)
+
+
+def _glyph(size, generator):
+    """Make a glyph of three strokes (like "A") separated by raises."""
+    parts = [lambda t: (1500 + 800 * t, 4000 - 2500 * t),
+             lambda t: (2300 + 800 * t, 1500 + 2500 * t),
+             lambda t: (1800 + 1000 * t, 2900)]
+    signals = []
+    for index, part in enumerate(parts):
+        part_size = (size - len(parts)) // len(parts)
+        if index == len(parts) - 1:
+            part_size = size - len(signals) - 1
+        signals.extend(_trace(part_size, part, generator))
+        signals.append(SyntheticSignal(-1, -1, 0))
+    return signals
+
+
+def get_synthetic_strokes(sizes=None):
+    """Make the strokes the feature extractor is benchmarked on.
+
+    The strokes are the same in every run.
+
+    Args:
+        sizes (list of int): The numbers of signals of the strokes. SIZES
+            by default.
+
+    Returns:
+        List of triples: the name of the stroke, its size and the list of
+        signals.
+    """
+    if sizes is None:
+        sizes = SIZES
+    generator = random.Random(SEED)
+    strokes = []
+    for size in sizes:
+        for name, make in [('line', _line), ('circle', _circle),
+                           ('glyph', _glyph)]:
+            strokes.append((name, size, make(size, generator)))
+    return strokes
+
+
+def _prepare_normalization(signals):
+    """Compute the arguments of create_normalized_curve for the signals."""
+    points, colors = featureextractor.filter_points_from_signals(signals)
+    curve = featureextractor.create_curve(points)
+    min_point, max_point = featureextractor.calculate_border_points(points)
+    return curve, min_point, max_point, colors
+
+
+def get_benchmarked_functions():
+    """Return the benchmarked functions.
+
+    Returns:
+        List of pairs: the name and a function making the call to time
+        out of the signals. The preparation of the arguments is not timed.
+    """
+    def get_call(function):
+        return lambda signals: lambda: function(signals)
+
+    def get_normalization_call(signals):
+        arguments = _prepare_normalization(signals)
+        return lambda: featureextractor.create_normalized_curve(*arguments)
+
+    return [
+        ('get_features', get_call(featureextractor.get_features)),
+        ('get_new_points', get_call(featureextractor.get_new_points)),
+        ('filter_points_from_signals',
+         get_call(featureextractor.filter_points_from_signals)),
+        ('create_normalized_curve', get_normalization_call),
+    ]
+
+
+def measure(call, calls):
+    """Measure the latencies of single calls.
+
+    Args:
+        call (function): The call to time.
+        calls (int): The number of timed calls. A few more are made before
+            to warm up.
+
+    Returns:
+        Array of the latencies in seconds.
+    """
+    for _ in range(3):
+        call()
+    latencies = np.empty(calls)
+    for index in range(calls):
+        start = time.perf_counter()
+        call()
+        latencies[index] = time.perf_counter() - start
+    return latencies
+
+
+def run_suite(calls, use_strokes):
+    """Time the functions on the synthetic strokes.
+
+    Args:
+        calls (int): The number of timed calls per case.
+        use_strokes (bool): Pass the signals as a Stroke instead of a list.
+
+    Returns:
+        Dictionary mapping the cases (tuples of the function name, the
+        stroke name and the size) to the arrays of latencies.
+    """
+    results = {}
+    for stroke_name, size, signals in get_synthetic_strokes():
+        if use_strokes:
+            signals = stroke_module.Stroke.from_signals(signals)
+        for function_name, get_call in get_benchmarked_functions():
+            results[(function_name, stroke_name, size)] = \
+                measure(get_call(signals), calls)
+    return results
+
+
+def get_baseline_path(use_strokes):
+    """Return the path of the baseline of the lists or of the Strokes."""
+    if use_strokes:
+        return BASELINE_PATH + STROKE_BASELINE_FILE
+    return BASELINE_PATH + BASELINE_FILE
+
+
+def load_baseline(use_strokes):
+    """Load the saved median latencies or None if there is no baseline."""
+    try:
+        with open(get_baseline_path(use_strokes), 'rb') as handle:
+            return pickle.load(handle)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(results, use_strokes):
+    """Save the median latencies of the results as the baseline."""
+    if not os.path.exists(BASELINE_PATH):
+        os.makedirs(BASELINE_PATH)
+    medians = {case: float(np.median(latencies))
+               for case, latencies in results.items()}
+    with open(get_baseline_path(use_strokes), 'wb') as handle:
+        pickle.dump(medians, handle)
+
+
+def report(results, baseline, threshold):
+    """Print the results and compare them with the baseline.
+
+    Returns:
+        The list of the cases which are slower than the baseline by more
+        than the threshold.
+    """
+    header = "%-27s %-7s %5s" % ('function', 'stroke', 'size')
+    header += "".join(" %8s" % ('p%d us' % percentile)
+                      for percentile in PERCENTILES)
+    header += " %12s" % 'signals/s'
+    if baseline is not None:
+        header += " %8s" % 'vs base'
+    print(header)
+
+    regressions = []
+    for case in sorted(results, key=lambda case: (case[0], case[2], case[1])):
+        function_name, stroke_name, size = case
+        latencies = results[case]
+        median = np.median(latencies)
+        row = "%-27s %-7s %5d" % (function_name, stroke_name, size)
+        row += "".join(" %8.1f" % (value * 1e6) for value in
+                       np.percentile(latencies, PERCENTILES))
+        row += " %12.0f" % (size / median)
+        if baseline is not None and case in baseline:
+            ratio = median / baseline[case]
+            row += " %7.2fx" % ratio
+            if ratio > 1 + threshold:
+                row += " REGRESSION"
+                regressions.append(case)
+        print(row)
+    return regressions
+
+
+def _time_per_call(function, signals, repeat):
+    """Measure the best time of one call of the function on the signals."""
+    number = max(1, 3000 // len(signals))
+    timer = timeit.Timer(lambda: function(signals))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run_adversarial(repeat):
+    """Time the pen-up segmentation on the adversarial groups."""
+    largest = signalcollection.MAX_NUMBER_OF_SIGNALS_IN_GROUP
+    sizes = [largest // 8, largest // 4, largest // 2, largest]
+    functions = [('filter', featureextractor.filter_points_from_signals),
+                 ('features', featureextractor.get_features)]
+
+    print("%-30s %6s %10s %12s %10s %12s"
+          % ('group', 'size', 'filter ms', 'ns/signal',
+             'features ms', 'ns/signal'))
+    for size in sizes:
+        for name, signals in get_adversarial_groups(size):
+            row = "%-30s %6d" % (name, size)
+            for _, function in functions:
+                seconds = _time_per_call(function, signals, repeat)
+                row += " %10.3f %12.1f" % (seconds * 1e3,
+                                           seconds * 1e9 / size)
+            print(row)
+
+
+def _get_configured_parser():
+    """Configure the commandline arguments parser."""
+    description = 'Benchmark the feature extractor.'
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-c', '--calls', dest='calls', default=30,
+                        help='the number of timed calls per case '
+                        '(default: 30)', type=int)
+    parser.add_argument('-t', '--threshold', dest='threshold', default=0.2,
+                        help='the allowed growth of the median latency '
+                        'compared with the baseline (default: 0.2)',
+                        type=float)
+    parser.add_argument('-b', '--save-baseline', dest='save_baseline',
+                        default=False, action='store_true',
+                        help='save the results as the new baseline')
+    parser.add_argument('-s', '--stroke', dest='use_strokes', default=False,
+                        action='store_true',
+                        help='pass the signals as a Stroke instead of a list')
+    parser.add_argument('-a', '--adversarial', dest='adversarial',
+                        default=False, action='store_true',
+                        help='benchmark the pen-up segmentation on groups '
+                        'with long runs of non-points instead')
+    parser.add_argument('-r', '--repeat', dest='repeat', default=5,
+                        help='the number of measurements the best time is '
+                        'chosen from with --adversarial (default: 5)',
+                        type=int)
+    return parser
+
+
+def main():
+    """The main function."""
+    args = _get_configured_parser().parse_args()
+    if args.adversarial:
+        run_adversarial(args.repeat)
+        return
+
+    results = run_suite(args.calls, args.use_strokes)
+    baseline = None if args.save_baseline else \
+        load_baseline(args.use_strokes)
+    regressions = report(results, baseline, args.threshold)
+    if args.save_baseline:
+        save_baseline(results, args.use_strokes)
+        print("Saved the baseline to %s."
+              % get_baseline_path(args.use_strokes))
+    elif baseline is None:
+        print("There is no baseline. Use --save-baseline to save one.")
+    if regressions:
+        print("featurebenchmark.py: error: %d case(s) slower than the "
+              "baseline by more than %d%%"
+              % (len(regressions), args.threshold * 100), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
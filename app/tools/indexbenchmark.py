@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""This is a benchmark of the backends of the symbol index.
+
+It builds indexes of deterministic synthetic feature vectors (clusters
+around random centers, one per symbol) of growing size with every backend
+and measures the latency of a single query. The backend the index chooses
+by itself is marked, so the crossover set by BRUTE_FORCE_MAX_SAMPLES can be
+checked on the machine. The approximate backend gets its recall as well:
+the fraction of the exact NEIGHBORS nearest elements it finds.
+
+With --updates it measures the updates of the index instead: building it
+from scratch, inserting and removing one symbol (which splices the ball tree
+or the forest rather than building it, see SymbolIndex.insert_symbol) and
+saving the model store, which is rewritten whole after every update.
+
+No touchpad is needed. Run it from the app/ directory (see matrixanalyser.py
+for the reason):
+
+    ./tools/indexbenchmark.py [--queries QUERIES] [--symbols SYMBOLS]
+                              [--cascade] [--updates]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(".")
+
+from classifier import featureextractor
+from classifier import modelstore
+from classifier import symbolindex
+
+SIZES = [50, 200, 500, 1000, 2000, 4000, 8000, 16000, 32000]
+BACKENDS = [symbolindex.BACKEND_BRUTE_FORCE, symbolindex.BACKEND_BALL_TREE,
+            symbolindex.BACKEND_FOREST]
+UPDATED_BACKENDS = [symbolindex.BACKEND_BALL_TREE,
+                    symbolindex.BACKEND_FOREST]
+SEED = 2016
+
+
+def get_synthetic_pyramids(size, symbols, generator):
+    """Make the feature pyramids of size training elements in total.
+
+    Returns:
+        Tuple of the centers of the clusters and of the dictionary mapping
+        the symbols to their feature pyramids.
+    """
+    number_of_features = featureextractor.get_feature_size(
+        featureextractor.NUMBER_OF_POINTS)
+    centers = generator.uniform(-500, 500, (symbols, number_of_features))
+    pyramids = {}
+    for index, center in enumerate(centers):
+        count = size // symbols + (index < size % symbols)
+        matrix = center + generator.normal(0, 150, (count, len(center)))
+        pyramids['symbol%d' % index] = \
+            {level: matrix[:, :featureextractor.get_feature_size(level)]
+             for level in featureextractor.PYRAMID_LEVELS}
+    return centers, pyramids
+
+
+def build_index(pyramids, backend, cascade):
+    """Build the index of the feature pyramids with the given backend."""
+    full_level = featureextractor.NUMBER_OF_POINTS
+    feature_matrices = {symbol: pyramid[full_level]
+                        for symbol, pyramid in pyramids.items()}
+    coarse_matrices = None
+    if cascade:
+        coarse_matrices = {
+            level: {symbol: pyramid[level]
+                    for symbol, pyramid in pyramids.items()}
+            for level in featureextractor.PYRAMID_LEVELS[:-1]}
+    return symbolindex.SymbolIndex(feature_matrices, coarse_matrices,
+                                   backend)
+
+
+def measure(index, queries):
+    """Return the mean latency of the queries in seconds."""
+    index.query(*queries[0])
+    index.query_count = 0
+    index.query_time = 0.0
+    for query in queries:
+        index.query(*query)
+    return index.get_mean_latency()
+
+
+def get_recall(index, queries):
+    """Return the mean fraction of the exact nearest elements found.
+
+    The nearest elements are searched at the coarsest level of the index,
+    where its backend is used.
+    """
+    level = index.levels[0]
+    vectors = np.array([vector if level == featureextractor.NUMBER_OF_POINTS
+                        else pyramid[level] for vector, pyramid in queries])
+    _, exact_rows = symbolindex.brute_force_kneighbors(
+        index.searched, vectors, symbolindex.NEIGHBORS)
+    found = 0
+    for query_rows, vector in zip(exact_rows, vectors):
+        rows, _ = index._search(vector[np.newaxis], symbolindex.NEIGHBORS)
+        found += len(np.intersect1d(rows[0], query_rows))
+    return found / exact_rows.size
+
+
+def run(number_of_queries, symbols, cascade):
+    """Print the latency of every backend for every size."""
+    generator = np.random.RandomState(SEED)
+    print("%6s" % 'size' + "".join(" %12s" % ('%s us' % backend)
+                                   for backend in BACKENDS) +
+          " %10s" % 'chosen' + " %8s" % 'recall')
+    for size in SIZES:
+        centers, pyramids = get_synthetic_pyramids(size, symbols, generator)
+        queries = []
+        for index in range(number_of_queries):
+            center = centers[index % len(centers)]
+            vector = center + generator.normal(0, 150, len(center))
+            queries.append((vector, {
+                level: vector[:featureextractor.get_feature_size(level)]
+                for level in featureextractor.PYRAMID_LEVELS}))
+        row = "%6d" % size
+        indexes = {backend: build_index(pyramids, backend, cascade)
+                   for backend in BACKENDS}
+        for backend in BACKENDS:
+            row += " %12.1f" % (measure(indexes[backend], queries) * 1e6)
+        row += " %10s" % build_index(pyramids, None, cascade).backend
+        row += " %7.1f%%" % (100 * get_recall(
+            indexes[symbolindex.BACKEND_FOREST], queries))
+        print(row)
+
+
+def measure_updates(pyramids, backend, cascade, path):
+    """Return the times of the updates of the index in seconds.
+
+    Returns:
+        Tuple of the times of building the index of all the symbols, of
+        inserting the last one into the index of the others, of removing it
+        again and of saving the model store.
+    """
+    symbol = sorted(pyramids)[-1]
+    others = {other: pyramid for other, pyramid in pyramids.items()
+              if other != symbol}
+    start = time.perf_counter()
+    build_index(pyramids, backend, cascade)
+    build_time = time.perf_counter() - start
+
+    index = build_index(others, backend, cascade)
+    coarse_matrices = {level: pyramids[symbol][level]
+                       for level in index.coarse_features}
+    start = time.perf_counter()
+    index.insert_symbol(symbol,
+                        pyramids[symbol][featureextractor.NUMBER_OF_POINTS],
+                        coarse_matrices)
+    insert_time = time.perf_counter() - start
+    start = time.perf_counter()
+    manifest, arrays = index.get_store_data()
+    modelstore.save(path, {'index': manifest}, arrays)
+    save_time = time.perf_counter() - start
+    start = time.perf_counter()
+    index.remove_symbol(symbol)
+    remove_time = time.perf_counter() - start
+    return build_time, insert_time, remove_time, save_time
+
+
+def run_updates(symbols, cascade):
+    """Print the times of the updates of the index for every size."""
+    generator = np.random.RandomState(SEED)
+    print("%6s %12s" % ('size', 'backend') +
+          "".join(" %10s" % ('%s ms' % name)
+                  for name in ['build', 'insert', 'remove', 'save']))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'classifier-store.npz')
+        for size in SIZES:
+            _, pyramids = get_synthetic_pyramids(size, symbols, generator)
+            for backend in UPDATED_BACKENDS:
+                times = measure_updates(pyramids, backend, cascade, path)
+                print("%6d %12s" % (size, backend) +
+                      "".join(" %10.1f" % (value * 1e3)
+                              for value in times))
+
+
+def _get_configured_parser():
+    """Configure the commandline arguments parser."""
+    description = 'Benchmark the backends of the symbol index.'
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-q', '--queries', dest='queries', default=200,
+                        help='the number of timed queries per case '
+                        '(default: 200)', type=int)
+    parser.add_argument('-s', '--symbols', dest='symbols', default=20,
+                        help='the number of symbols (default: 20)',
+                        type=int)
+    parser.add_argument('-c', '--cascade', dest='cascade', default=False,
+                        action='store_true',
+                        help='index the coarse levels of the feature '
+                        'pyramid as well')
+    parser.add_argument('-u', '--updates', dest='updates', default=False,
+                        action='store_true',
+                        help='measure inserting and removing a symbol and '
+                        'saving the model store instead of the queries')
+    return parser
+
+
+def main():
+    """The main function."""
+    args = _get_configured_parser().parse_args()
+    if args.updates:
+        run_updates(args.symbols, args.cascade)
+    else:
+        run(args.queries, args.symbols, args.cascade)
+
+
+if __name__ == '__main__':
+    main()
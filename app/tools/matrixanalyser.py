@@ -3,7 +3,7 @@
 """This is a utility to visualize the symbols drawn on touchpads.
 
 It starts its own modified version of the app/app.py and creates a figure
-for every signal_list the modified thread/application.py would send to the
+for every stroke the modified thread/application.py would send to the
 interpreter.
 
 The touchpad size is detected automatically. A suitable tolerance might be
@@ -69,44 +69,28 @@ class MatrixAnalyser(object):
         self.max_y = specification['max_y'] + tolerance
         self.tolerance = tolerance
 
-    def save_symbols(self, signal_list, show_figure=False):
-        """Generate figures based on the signal_list.
+    def save_symbols(self, stroke, show_figure=False):
+        """Generate figures based on the stroke.
 
         It saves generated figures to the FIGURES_PATH. It doesn't
         save the figure if one of the signal went out of bound or
-        if the signal_list is empty.
+        if there are no points in the stroke.
 
         Args:
-            signal_list (list): List of TouchpadSingals received from the
-                touchpad.
+            stroke (Stroke): The signals received from the touchpad.
             show_figure (bool): The indicator whether the method should show
                 the figure just after saving it or not.
         """
-        if not signal_list:
+        points = stroke.proper_points()
+        if not points.any():
             return
-        points = []
-        point_on_the_list = False
-        for one_signal in signal_list:
-            if one_signal.is_proper_signal_of_point():
-                points.append(one_signal)
-                point_on_the_list = True
-        if not point_on_the_list:
-            return
-        signal_list = points
-
-        x_coordinates = []
-        y_coordinates = []
-
-        for signal in signal_list:
-            normalized_x = self._normalize_x(signal.get_x())
-            if normalized_x is None:
-                return
-            x_coordinates.append(normalized_x)
 
-            normalized_y = self._normalize_y(signal.get_y())
-            if normalized_y is None:
-                return
-            y_coordinates.append(normalized_y)
+        x_coordinates = self._normalize_x(stroke.x_values[points])
+        if x_coordinates is None:
+            return
+        y_coordinates = self._normalize_y(stroke.y_values[points])
+        if y_coordinates is None:
+            return
 
         plt.gca().invert_yaxis()
         plt.scatter(x_coordinates, y_coordinates, s=3)
@@ -140,7 +124,7 @@ class MatrixAnalyser(object):
             condition.release()
 
             if not collection.is_recent_enough(time.time()):
-                self.save_symbols(collection.as_list(), show_figure)
+                self.save_symbols(collection.as_stroke(), show_figure)
                 collection.reset()
 
             if thread_queue.empty():
@@ -149,15 +133,15 @@ class MatrixAnalyser(object):
             signal = thread_queue.get()
 
             if signal.is_stop_signal():
-                self.save_symbols(collection.as_list(), show_figure)
+                self.save_symbols(collection.as_stroke(), show_figure)
                 collection.reset()
             elif signal.is_proper_signal_of_point() \
                     or signal.is_raising_finger_signal():
                 collection.add_and_maintain(signal)
 
-    def _normalize_x(self, x_value):
-        normalized_x = x_value - self.min_x
-        if normalized_x > self.max_x:
+    def _normalize_x(self, x_values):
+        normalized_x = x_values - self.min_x
+        if (normalized_x > self.max_x).any():
             print("matrixanalyser.py: warning: "
                   "The x coordinate of the recived signal "
                   "is out of the touchpad's detected range. "
@@ -167,9 +151,9 @@ class MatrixAnalyser(object):
         else:
             return normalized_x
 
-    def _normalize_y(self, y_value):
-        normalized_y = y_value - self.min_y
-        if normalized_y > self.max_y:
+    def _normalize_y(self, y_values):
+        normalized_y = y_values - self.min_y
+        if (normalized_y > self.max_y).any():
             print("matrixanalyser.py: warning:"
                   "The y coordinate of the recived signal "
                   "is out of the touchpad's detected range. "